@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the balancing algorithms.
+
+Runs every registered algorithm over synthetic outpost maps or over maps
+snapshotted from a live zone book and reports, for each of them:
+
+    time        - seconds taken by the algorithm
+    peak KB     - peak memory allocated while running (tracemalloc)
+    max load    - highest load of an outpost after the migrations
+    imbalance   - highest load divided by the average load
+    migrations  - number of agents that change location
+    violations  - outposts (besides central) above the load ceiling
+
+Usage:
+    python3 bench/balancers.py run [--sizes 2:10 1000:50000] [--map FILE]
+    python3 bench/balancers.py snapshot FILE
+
+Taking a snapshot requires the environment of the scout (ZOE_HOME).
+"""
+
+import argparse
+import collections
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'lib'))
+
+from libscout.algorithm import Balancer
+
+# Default synthetic sizes (outposts, agents)
+DEFAULT_SIZES = [(2, 10), (10, 100), (50, 1000), (200, 10000), (1000, 50000)]
+
+# Largest number of agents given to algorithms that do not scale
+AGENT_LIMITS = {
+    'optimal': 60,
+    'stable': 1000,
+    'vector': 20000
+}
+
+# Load ceiling used to count violations
+CEILING = 0.8
+
+
+def evaluate(outmap, result):
+    """ Obtain the quality metrics of a balancing result.
+
+        outmap - map of outposts and agents they contain
+        result - result of the balancing algorithm
+    """
+    current = {}
+    mips = {}
+
+    for outpost, entry in outmap.items():
+        for agent, info in entry['agents'].items():
+            current[agent] = outpost
+            mips[agent] = info['mips']
+
+    # Agents not in the result stay in their location
+    placement = dict(current)
+
+    for outpost, agents in result.items():
+        for agent in agents:
+            placement[agent] = outpost
+
+    used = collections.defaultdict(float)
+
+    for agent, outpost in placement.items():
+        used[outpost] += mips[agent]
+
+    loads = {}
+
+    for outpost, entry in outmap.items():
+        total = float(entry.get('mips') or 0)
+
+        if total > 0:
+            loads[outpost] = used[outpost] / total
+
+    average = sum(loads.values()) / len(loads) if loads else 0
+
+    return {
+        'max_load': max(loads.values()) if loads else 0,
+        'imbalance': max(loads.values()) / average if average else 0,
+        'migrations': sum(1 for a in placement if placement[a] != current[a]),
+        'violations': sum(1 for o, l in loads.items()
+            if l > CEILING and o != 'central')
+    }
+
+def load_map(path):
+    """ Load an outpost map stored as JSON.
+
+        path - path to the file
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def make_map(outposts, agents, seed=0, held=0.1):
+    """ Build a synthetic outpost map.
+
+        MIPS follow a Pareto distribution, so a few agents concentrate most
+        of the load, and outposts come in a few capacity tiers.
+
+        outposts - number of outposts (besides central)
+        agents   - number of agents
+        seed     - random seed
+        held     - fraction of held agents
+    """
+    rand = random.Random(seed)
+
+    outmap = {
+        'central': {
+            'mips': '20000', 'priority': '10', 'memory': '16384',
+            'bandwidth': '102400', 'agents': {}
+        }
+    }
+
+    for i in range(outposts):
+        outmap['outpost%d' % i] = {
+            'mips': str(rand.choice([500, 1000, 2000, 8000, 20000])),
+            'priority': str(rand.randint(1, 5)),
+            'memory': str(rand.choice([512, 2048, 8192])),
+            'bandwidth': str(rand.choice([1024, 10240])),
+            'agents': {}
+        }
+
+    names = list(outmap.keys())
+    agent_names = ['agent%d' % i for i in range(agents)]
+
+    # Enough capacity for the whole fleet on average
+    scale = sum(float(o['mips']) for o in outmap.values()) * 0.5 / (
+            agents * 3.0)
+
+    for agent in agent_names:
+        location = rand.choice(names)
+
+        peers = {}
+        for peer in rand.sample(agent_names, min(rand.randint(0, 3), agents)):
+            if peer != agent:
+                peers[peer] = rand.paretovariate(1.2)
+
+        outmap[location]['agents'][agent] = {
+            'location': location,
+            'mips': min(rand.paretovariate(1.5), 50) * scale,
+            'memory': rand.lognormvariate(17, 1),
+            'bandwidth': rand.lognormvariate(7, 2),
+            'peers': peers,
+            'size': int(rand.lognormvariate(13, 1.5)),
+            'timestamp': 0,
+            'is_free': rand.random() >= held
+        }
+
+    return outmap
+
+def run(maps, algorithms, memory=True):
+    """ Run the algorithms over the maps and print the results.
+
+        maps       - list of tuples with (description, outpost map)
+        algorithms - names of the algorithms to run
+        memory     - whether to measure memory (runs each algorithm twice)
+    """
+    balancer = Balancer()
+
+    print('%-14s %-10s %10s %10s %9s %9s %10s %10s' % (
+        'map', 'algorithm', 'time (s)', 'peak KB', 'max load', 'imbalance',
+        'migrations', 'violations'))
+
+    for description, outmap in maps:
+        agents = sum(len(o['agents']) for o in outmap.values())
+
+        for name in algorithms:
+            if agents > AGENT_LIMITS.get(name, agents):
+                print('%-14s %-10s %10s' % (description, name, 'skipped'))
+                continue
+
+            algorithm = balancer.get_algorithm(name)
+
+            gc.collect()
+            start = time.perf_counter()
+            result = algorithm(outmap.copy())
+            elapsed = time.perf_counter() - start
+
+            peak = float('nan')
+
+            if memory:
+                gc.collect()
+                tracemalloc.start()
+                algorithm(outmap.copy())
+                peak = tracemalloc.get_traced_memory()[1] / 1024.0
+                tracemalloc.stop()
+
+            metrics = evaluate(outmap, result)
+
+            print('%-14s %-10s %10.4f %10.0f %9.3f %9.3f %10d %10d' % (
+                description, name, elapsed, peak, metrics['max_load'],
+                metrics['imbalance'], metrics['migrations'],
+                metrics['violations']))
+
+def snapshot(path):
+    """ Store the outpost map of the live zone book as JSON.
+
+        path - path to the file
+    """
+    from libscout import planner
+    from libscout import util
+    from libscout.static import ZONE_BOOK
+
+    outposts = util.load_outpost_list()
+    conf = util.load_scout_conf()
+
+    outpost_map = planner.build_outpost_map(
+            outposts, conf, ZONE_BOOK.get_running_outposts())
+
+    with open(path, 'w') as f:
+        json.dump(outpost_map, f, default=str, indent=1)
+
+    print('stored %d outposts in %s' % (len(outpost_map), path))
+
+def main():
+    """ Parse the arguments and run the benchmark. """
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--sizes', nargs='*', default=None,
+            help='synthetic sizes as OUTPOSTS:AGENTS')
+    run_parser.add_argument('--map', nargs='*', default=[],
+            help='snapshots to use instead of synthetic maps')
+    run_parser.add_argument('--algorithms', nargs='*', default=None)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--no-memory', action='store_true')
+
+    snapshot_parser = commands.add_parser('snapshot')
+    snapshot_parser.add_argument('path')
+
+    args = parser.parse_args()
+
+    # Per-agent logging would dominate the measurements
+    logging.getLogger('libscout.algorithm').setLevel(logging.WARNING)
+
+    if args.command == 'snapshot':
+        return snapshot(args.path)
+
+    if args.command != 'run':
+        return parser.print_help()
+
+    maps = [(os.path.basename(p), load_map(p)) for p in args.map]
+
+    if not maps or args.sizes:
+        sizes = DEFAULT_SIZES
+
+        if args.sizes:
+            sizes = [tuple(int(v) for v in s.split(':')) for s in args.sizes]
+
+        for outposts, agents in sizes:
+            maps.append(('%d/%d' % (outposts, agents),
+                make_map(outposts, agents, args.seed)))
+
+    run(maps, args.algorithms or Balancer().names(), not args.no_memory)
+
+
+if __name__ == '__main__':
+    main()
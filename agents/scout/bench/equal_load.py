@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the 'equal' balancing algorithm.
+
+Compares the heap-based implementation with the previous one, which sorted
+the list of loads for every agent, on synthetic fleets and checks that both
+produce the same placement. Every size is also run on a tied fleet, where
+all outposts have the same MIPS and agents share a few MIPS values, so that
+the order in which ties are resolved is exercised. The benchmark exits with
+an error if any placement differs.
+
+Usage: python3 bench/equal_load.py [outposts agents ...]
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'lib'))
+
+from libscout.algorithm import Balancer
+
+
+def legacy_equal_load(outmap):
+    """ Previous implementation of the algorithm, used as reference.
+
+        outmap - map of outposts and agents they contain
+    """
+    total_mips = {}
+    current_load = []
+    agentsmap = {}
+
+    result = {}
+
+    for outpost in outmap.keys():
+        result[outpost] = []
+
+        current_load.append((outpost, 0))
+        total_mips[outpost] = float(outmap[outpost]['mips'])
+        agentsmap.update(outmap[outpost]['agents'])
+
+    for agent in agentsmap.keys():
+        location = agentsmap[agent]['location']
+        mips = agentsmap[agent]['mips']
+        is_free = agentsmap[agent]['is_free']
+
+        ag_load = float(mips / total_mips[location])
+
+        if not is_free:
+            for index, load in enumerate(current_load):
+                if load[0] == location:
+                    current_load[index] = (location, load[1] + ag_load)
+                    break
+            continue
+
+        current_load.sort(key=lambda tup: tup[1])
+
+        new_location = current_load[0][0]
+        new_ag_load = float(mips / total_mips[new_location])
+
+        current_load[0] = (new_location, current_load[0][1] + new_ag_load)
+        result[new_location].append(agent)
+
+    return result
+
+def make_fleet(outposts, agents, seed=0, tied=False):
+    """ Build a synthetic outpost map.
+
+        outposts - number of outposts (besides central)
+        agents   - number of agents
+        seed     - random seed
+        tied     - whether outposts and agents should share MIPS values
+    """
+    rand = random.Random(seed)
+
+    outmap = {'central': {'mips': '20000', 'agents': {}}}
+
+    for i in range(outposts):
+        outmap['outpost%d' % i] = {
+            'mips': '20000' if tied else str(rand.randint(1000, 50000)),
+            'agents': {}
+        }
+
+    names = list(outmap.keys())
+
+    for i in range(agents):
+        location = rand.choice(names)
+
+        outmap[location]['agents']['agent%d' % i] = {
+            'location': location,
+            'mips': rand.choice((0, 100, 200, 400)) if tied \
+                    else rand.uniform(1, 500),
+            'timestamp': 0,
+            'is_free': rand.random() < 0.9
+        }
+
+    return outmap
+
+def measure(func, outmap):
+    """ Run an algorithm and return (result, seconds).
+
+        func   - algorithm to run
+        outmap - map of outposts and agents they contain
+    """
+    start = time.perf_counter()
+    result = func(outmap)
+
+    return result, time.perf_counter() - start
+
+def main(sizes):
+    """ Run the benchmark for the given (outposts, agents) sizes.
+
+        sizes - list of tuples with (outposts, agents)
+    """
+    # Per-agent logging would dominate the measurements
+    logging.getLogger('libscout.algorithm').setLevel(logging.WARNING)
+
+    equal = Balancer().get_algorithm('equal')
+
+    print('%8s %8s %6s %12s %12s %8s %6s' % (
+        'outposts', 'agents', 'tied', 'legacy (s)', 'heap (s)', 'speedup',
+        'same'))
+
+    mismatches = 0
+
+    for outposts, agents in sizes:
+        for tied in (False, True):
+            outmap = make_fleet(outposts, agents, tied=tied)
+
+            expected, legacy_time = measure(legacy_equal_load, outmap)
+            result, heap_time = measure(equal, outmap)
+
+            if expected != result:
+                mismatches += 1
+
+            print('%8d %8d %6s %12.4f %12.4f %7.1fx %6s' % (
+                outposts, agents, tied, legacy_time, heap_time,
+                legacy_time / heap_time, expected == result))
+
+    if mismatches:
+        sys.exit('%d placements differ from the previous implementation'
+                % mismatches)
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+
+    if args:
+        sizes = list(zip(args[::2], args[1::2]))
+
+    else:
+        sizes = [(10, 1000), (100, 10000), (1000, 10000), (1000, 50000)]
+
+    main(sizes)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the storage engines of the agent and zone books.
+
+Simulates travel bursts: agents leave for an outpost, the messages sent to
+them meanwhile arrive in bursts and are stored in group-committed batches,
+and when they come back the messages are replayed in acknowledged pages.
+Resource samples of the whole fleet are stored every gathering round.
+
+For each engine it reports:
+
+    time        - seconds taken by the whole workload
+    msg/s       - deferred messages stored per second
+    store p50   - median seconds to store a batch of messages
+    store p99   - 99th percentile seconds to store a batch of messages
+    page p99    - 99th percentile seconds to replay and delete a page
+    gather p99  - 99th percentile seconds to store a gathering round
+    open (s)    - seconds to open the books again (recovery)
+    disk KB     - size of the books
+
+Usage:
+    python3 bench/storage.py [--agents 500] [--travels 2000] [--engines ...]
+
+The scout library is imported with a scratch ZOE_HOME, so no live
+installation is used or modified.
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'lib'))
+
+_SCRATCH = tempfile.mkdtemp(prefix='scout-bench-')
+os.makedirs(os.path.join(_SCRATCH, 'etc', 'scout'))
+os.environ['ZOE_HOME'] = _SCRATCH
+
+from libscout.storage import ENGINES, open_storage
+
+# Messages per replayed page
+PAGE_SIZE = 20
+
+# Agents gathered between travels
+GATHER_EVERY = 50
+
+
+def make_workload(agents, travels, seed=0):
+    """ Build the sequence of operations of the benchmark.
+
+        Returns a tuple with the names of the agents and the list of
+        ('burst', agent, size), ('return', agent) and ('gather',) tuples.
+
+        agents  - number of agents
+        travels - number of travels
+        seed    - random seed
+    """
+    rand = random.Random(seed)
+    names = ['agent%d' % i for i in range(agents)]
+
+    operations = []
+    away = []
+
+    for travel in range(travels):
+        agent = rand.choice(names)
+
+        if agent not in away:
+            away.append(agent)
+
+        # Bursts are heavy tailed: most travels receive a few messages
+        for _ in range(rand.randint(1, 4)):
+            operations.append(('burst', rand.choice(away),
+                min(int(rand.paretovariate(1.2) * 5), 500)))
+
+        if len(away) > 10 or rand.random() < 0.3:
+            operations.append(('return', away.pop(0)))
+
+        if travel % GATHER_EVERY == 0:
+            operations.append(('gather',))
+
+    for agent in away:
+        operations.append(('return', agent))
+
+    return names, operations
+
+def percentile(values, percentile):
+    """ Obtain a percentile of the values (nearest rank).
+
+        values     - list of values
+        percentile - percentile between 0 and 100
+    """
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = int(percentile / 100.0 * len(ordered) + 0.5)
+
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+def run(engine, names, operations, batch_size, max_messages):
+    """ Run the workload on an engine and return its metrics.
+
+        engine       - name of the engine
+        names        - names of the agents
+        operations   - list of operations (see `make_workload()`)
+        batch_size   - messages written per transaction
+        max_messages - maximum number of messages stored per agent
+    """
+    directory = tempfile.mkdtemp(dir=_SCRATCH)
+    agent_storage, zone_storage = open_storage(engine, directory)
+
+    zone_storage.write_refresh(['central', 'outpost0'], names, [])
+
+    stored = 0
+    seq = 0
+    store_times = []
+    page_times = []
+    gather_times = []
+    payload = 'x' * 400
+
+    start = time.perf_counter()
+
+    for operation in operations:
+        if operation[0] == 'burst':
+            _, agent, size = operation
+
+            for first in range(0, size, batch_size):
+                rows = []
+
+                for _ in range(min(batch_size, size - first)):
+                    seq += 1
+                    rows.append({'agent': agent, 'seq': seq,
+                        'timestamp': time.time(), 'message': payload})
+
+                began = time.perf_counter()
+                agent_storage.append_messages(rows, max_messages)
+                store_times.append(time.perf_counter() - began)
+
+                stored += len(rows)
+
+        elif operation[0] == 'return':
+            after = 0
+
+            while True:
+                began = time.perf_counter()
+                page = agent_storage.get_messages(operation[1], after,
+                        PAGE_SIZE)
+
+                if page:
+                    after = page[-1][0]
+                    agent_storage.delete_messages(operation[1], after)
+
+                page_times.append(time.perf_counter() - began)
+
+                if len(page) < PAGE_SIZE:
+                    break
+
+            zone_storage.write_location(operation[1], 'central')
+
+        else:
+            now = time.time()
+            samples = [{'agent': a, 'timestamp': now,
+                'mips': random.uniform(1, 500),
+                'memory': random.uniform(1e6, 1e8),
+                'bandwidth': random.uniform(0, 1e4)} for a in names]
+
+            began = time.perf_counter()
+            zone_storage.write_resources(samples,
+                    {names[0]: {names[1]: 1.0}})
+            gather_times.append(time.perf_counter() - began)
+
+    elapsed = time.perf_counter() - start
+
+    agent_storage.close()
+    zone_storage.close()
+
+    began = time.perf_counter()
+    agent_storage, zone_storage = open_storage(engine, directory)
+    reopen = time.perf_counter() - began
+
+    agent_storage.close()
+    zone_storage.close()
+
+    size = 0
+
+    for root, _, files in os.walk(directory):
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+
+    return {
+        'time': elapsed,
+        'rate': stored / elapsed,
+        'store_p50': percentile(store_times, 50),
+        'store_p99': percentile(store_times, 99),
+        'page_p99': percentile(page_times, 99),
+        'gather_p99': percentile(gather_times, 99),
+        'open': reopen,
+        'disk': size / 1024.0
+    }
+
+def main():
+    """ Parse the arguments and run the benchmark. """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=500)
+    parser.add_argument('--travels', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=16,
+            help='messages written per transaction (group commit)')
+    parser.add_argument('--max-messages', type=int, default=1000)
+    parser.add_argument('--engines', nargs='*', default=list(ENGINES))
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    # Discarded messages would dominate the measurements
+    logging.getLogger('libscout').setLevel(logging.ERROR)
+
+    names, operations = make_workload(args.agents, args.travels, args.seed)
+
+    print('%-8s %8s %9s %10s %10s %10s %10s %9s %9s' % (
+        'engine', 'time (s)', 'msg/s', 'store p50', 'store p99',
+        'page p99', 'gather p99', 'open (s)', 'disk KB'))
+
+    try:
+        for engine in args.engines:
+            m = run(engine, names, operations, args.batch, args.max_messages)
+
+            print('%-8s %8.2f %9.0f %10.5f %10.5f %10.5f %10.5f %9.3f %9.0f' % (
+                engine, m['time'], m['rate'], m['store_p50'],
+                m['store_p99'], m['page_p99'], m['gather_p99'], m['open'],
+                m['disk']))
+
+    finally:
+        shutil.rmtree(_SCRATCH)
+
+
+if __name__ == '__main__':
+    main()
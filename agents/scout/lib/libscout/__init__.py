@@ -1,6 +1,8 @@
 from .log import get_logger
 from .algorithm import Balancer
 from .book import AgentBook, ZoneBook
-from . import messages
-from . import static
-from . import util
+from .config import ConfigCache
+from .forecast import Forecaster
+from .journal import MigrationJournal
+from .replay import ReplayTracker
+from .ssh import SSHPool
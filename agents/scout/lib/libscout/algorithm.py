@@ -18,69 +18,507 @@
 
 """Load balancing algorithms."""
 
+import collections
+import functools
+import heapq
+import importlib.util
+import os
+import time
+
 from libscout import get_logger
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from importlib.metadata import entry_points
+except ImportError:
+    entry_points = None
+
 # Logging
 scoutlog = get_logger('libscout.algorithm')
 
+# Entry point group of the external algorithms
+ENTRY_POINT_GROUP = 'libscout.balancers'
+
+# Resources considered by the vector balancer: configuration key of the
+# capacity and the factor to convert it to the units of the agent demand
+# (MIPS, bytes of memory and bytes per second)
+VECTOR_RESOURCES = (
+    ('mips', 1),
+    ('memory', 1048576),
+    ('bandwidth', 1024)
+)
+
 
 class Balancer(object):
     """ Class that contains load balancing algorithms.
 
-        All the functions must return a map with the format:
+        An algorithm is a callable `algorithm(outmap, options)`.
+
+        `outmap` contains every running outpost and central:
+
+        outmap = {
+            outpost_id: {
+                # Values of the outpost in outpost.list (strings), or the
+                # `general` section of scout.conf for central. Usually
+                # `mips`, `priority`, `memory`, `bandwidth` and ceilings
+                'mips': '2000',
+                ...
+                'agents': {
+                    agent_name: {
+                        'location': outpost_id,
+                        'mips': float (predicted demand),
+                        'sampled_mips': float (latest measurement),
+                        'memory': float (bytes),
+                        'bandwidth': float (received bytes per second),
+                        'peers': {sender: messages per second},
+                        'size': int (bytes of agent files),
+                        'timestamp': last update,
+                        'is_free': bool (False if the agent is held)
+                    }
+                }
+            }
+        }
+
+        `options` contains the values (strings) of the `[balancer NAME]`
+        section of scout.conf, or is empty.
+
+        The algorithm must return a map with the format:
 
         result = {
             outpost_id: [name of agents that should be here]
         }
+
+        Only agents that appear in a different outpost are migrated, so held
+        agents may be omitted. Every outpost_id must be a key of `outmap`.
+
+        Besides the built-in algorithms, external ones are registered from:
+
+        - Python modules in `etc/scout/balancers` (see `load_plugins()`),
+          which define an `ALGORITHMS` dict mapping names to callables.
+        - Entry points in the `libscout.balancers` group, whose name is the
+          name of the algorithm.
+
+        External algorithms cannot replace the built-in ones.
     """
 
     def __init__(self):
         """ Initialize the map that contains the relations name-algorithm. """
         self._algorithms = {
+            'affinity': self._affinity,
             'equal': self._equal_load,
-            'prio': self._user_prio
+            'optimal': self._optimal,
+            'prio': self._user_prio,
+            'stable': self._stable,
+            'vector': self._vector
         }
 
-    def get_algorithm(self, name):
+        # Statistics of the last run of each algorithm (if any)
+        self._stats = {}
+
+        if numpy is not None:
+            self._algorithms['ffd'] = self._first_fit_decreasing
+
+        else:
+            scoutlog.warning('numpy not found, "ffd" algorithm not available')
+
+        self._builtin = frozenset(self._algorithms.keys())
+
+        # Modification time of the loaded plugin files, and file that
+        # registered each plugin algorithm
+        self._plugin_files = {}
+        self._plugin_names = {}
+
+        self._load_entry_points()
+
+    def get_algorithm(self, name, options=None):
         """ Get the algorithm to execute from the map given the name.
 
-            This is the only method that should be accessed directly.
+            name    - unique name of the algorithm to use
+            options - map of options for the algorithm
+        """
+        algorithm = self._algorithms.get(name, None)
+
+        if not algorithm:
+            return None
+
+        return functools.partial(algorithm, options=options or {})
+
+    def names(self):
+        """ Return a sorted list with the names of the available algorithms.
+        """
+        return sorted(self._algorithms.keys())
+
+    def get_stats(self, name):
+        """ Get the statistics of the last run of an algorithm.
+
+            Returns None if the algorithm does not provide statistics.
+
+            name - unique name of the algorithm
+        """
+        return self._stats.get(name)
+
+    def load_plugins(self, directory):
+        """ Load the algorithms defined in the Python modules of a directory.
+
+            Each module must define an `ALGORITHMS` dict that maps the name
+            of each algorithm to the callable that implements it. Modules
+            are only loaded again when they change, and files starting with
+            `_` are ignored. Algorithms of modules that were removed, or
+            that no longer define them, are unregistered.
+
+            Returns the number of registered algorithms.
+
+            directory - path to the directory
+        """
+        if not os.path.isdir(directory):
+            return 0
+
+        registered = 0
+        paths = set()
+
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.py') or filename.startswith('_'):
+                continue
+
+            path = os.path.join(directory, filename)
+            mtime = os.path.getmtime(path)
+            paths.add(path)
+
+            if self._plugin_files.get(path) == mtime:
+                continue
+
+            self._plugin_files[path] = mtime
+            names = set()
 
-            name - unique name of the algorithm to use
+            try:
+                spec = importlib.util.spec_from_file_location(
+                        'libscout_balancer_' + filename[:-3], path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+
+            except Exception as e:
+                scoutlog.exception('could not load balancer plugin %s' % path)
+                module = None
+
+            algorithms = getattr(module, 'ALGORITHMS', None)
+
+            if module and not isinstance(algorithms, dict):
+                scoutlog.error('balancer plugin %s has no ALGORITHMS dict' %
+                        path)
+
+            if isinstance(algorithms, dict):
+                for name, algorithm in algorithms.items():
+                    if self.register(name, algorithm, path):
+                        self._plugin_names[name] = path
+                        names.add(name)
+                        registered += 1
+
+            self._remove_plugin_algorithms(path, names)
+
+        # Plugin files that no longer exist
+        for path in set(self._plugin_files.keys()) - paths:
+            del self._plugin_files[path]
+            self._remove_plugin_algorithms(path)
+
+        return registered
+
+    def register(self, name, algorithm, source='unknown'):
+        """ Register an external algorithm, replacing any previous external
+            algorithm with the same name.
+
+            name      - unique name of the algorithm
+            algorithm - callable with the `algorithm(outmap, options)`
+                        signature
+            source    - where the algorithm comes from (for logging)
         """
-        return self._algorithms.get(name, None)
+        if name in self._builtin:
+            scoutlog.error('cannot replace built-in algorithm "%s" (%s)' % (
+                name, source))
+            return False
+
+        if not callable(algorithm):
+            scoutlog.error('algorithm "%s" is not callable (%s)' % (
+                name, source))
+            return False
+
+        self._algorithms[name] = algorithm
+        scoutlog.info('registered algorithm "%s" from %s' % (name, source))
+
+        return True
+
+    def _load_entry_points(self):
+        """ Register the algorithms declared as entry points. """
+        if entry_points is None:
+            return
+
+        try:
+            found = entry_points()
+
+            if hasattr(found, 'select'):
+                found = found.select(group=ENTRY_POINT_GROUP)
+            else:
+                found = found.get(ENTRY_POINT_GROUP, [])
+
+        except Exception as e:
+            scoutlog.exception('could not read balancer entry points')
+            return
+
+        for entry_point in found:
+            try:
+                algorithm = entry_point.load()
+
+            except Exception as e:
+                scoutlog.exception('could not load balancer entry point %s' %
+                        entry_point.name)
+                continue
+
+            self.register(entry_point.name, algorithm,
+                    'entry point %s' % entry_point.value)
+
+    def _remove_plugin_algorithms(self, path, keep=()):
+        """ Unregister the algorithms that were registered from a plugin
+            file.
+
+            path - path to the plugin file
+            keep - names of the algorithms that are still defined in it
+        """
+        for name, source in list(self._plugin_names.items()):
+            if source != path or name in keep:
+                continue
+
+            del self._plugin_names[name]
+            self._algorithms.pop(name, None)
+            self._stats.pop(name, None)
+
+            scoutlog.info('unregistered algorithm "%s" from %s' % (
+                name, path))
+
+    def _affinity(self, outmap, options):
+        """ Place agents that exchange many messages in the same outpost.
+
+            The messages exchanged between agents form a weighted graph that
+            is partitioned among the outposts, reducing the weight of the
+            edges between different outposts (messages that go through
+            central) while keeping the load of each outpost under the
+            ceiling.
+
+            Free agents start in their current location if it has room for
+            them, the ones that communicate the most first. The rest are
+            sent to the outpost they exchange most messages with (lowest load
+            in case of a tie). The partition is then refined by moving single
+            agents to the outpost they exchange most messages with, as long
+            as the saved traffic is greater than `min_gain`, until a pass
+            makes no moves. Held agents keep their location. Agents that do
+            not fit anywhere are sent to central.
+
+            Options:
+                ceiling  - maximum load of an outpost (default 0.8)
+                min_gain - messages per second a move must save (default 0)
+                passes   - maximum number of refinement passes (default 10)
+
+            outmap  - map of outposts and agents they contain
+            options - map of options
+        """
+        ceiling = _float_option(options, 'ceiling', 0.8)
+        min_gain = _float_option(options, 'min_gain', 0.0)
+        passes = int(_float_option(options, 'passes', 10))
+
+        capacity = {}
+        used = {}
+        agentsmap = {}
+        location = {}
+        free_agents = []
+
+        # Parse the necessary information
+        for outpost in outmap.keys():
+            total = _float_option(outmap[outpost], 'mips', 0)
+
+            capacity[outpost] = total * ceiling if total > 0 else None
+            used[outpost] = 0.0
+
+            for agent, info in outmap[outpost]['agents'].items():
+                agentsmap[agent] = info
+
+                if info['is_free']:
+                    free_agents.append(agent)
+                    continue
+
+                # Held agents consume capacity in their current location
+                location[agent] = outpost
+                used[outpost] += _float_option(info, 'mips', 0)
 
-    def _equal_load(self, outmap):
+        # Messages exchanged between each pair of agents (both directions)
+        weights = collections.defaultdict(
+                lambda: collections.defaultdict(float))
+
+        for agent, info in agentsmap.items():
+            for peer, rate in (info.get('peers') or {}).items():
+                if peer in agentsmap and peer != agent:
+                    weights[agent][peer] += rate
+                    weights[peer][agent] += rate
+
+        def fits(agent, outpost):
+            cap = capacity[outpost]
+            mips = _float_option(agentsmap[agent], 'mips', 0)
+
+            return cap is not None and used[outpost] + mips < cap
+
+        def links(agent):
+            # Messages exchanged with the agents of each outpost
+            per_outpost = collections.defaultdict(float)
+
+            for peer, weight in weights[agent].items():
+                if peer in location:
+                    per_outpost[location[peer]] += weight
+
+            return per_outpost
+
+        def assign(agent, outpost):
+            mips = _float_option(agentsmap[agent], 'mips', 0)
+
+            if agent in location:
+                used[location[agent]] -= mips
+
+            location[agent] = outpost
+            used[outpost] += mips
+
+        # Initial partition
+        free_agents.sort(key=lambda a: (-sum(weights[a].values()), a))
+        pending = []
+
+        for agent in free_agents:
+            if fits(agent, agentsmap[agent]['location']):
+                assign(agent, agentsmap[agent]['location'])
+
+            else:
+                pending.append(agent)
+
+        for agent in pending:
+            per_outpost = links(agent)
+            candidates = [o for o in outmap.keys() if fits(agent, o)]
+
+            if not candidates:
+                scoutlog.info('forcing migration of "%s" to central' % agent)
+                assign(agent, 'central')
+                continue
+
+            assign(agent, max(candidates, key=lambda o: (
+                per_outpost.get(o, 0.0), -used[o] / capacity[o])))
+
+        # Refinement
+        for iteration in range(passes):
+            moves = 0
+
+            for agent in free_agents:
+                current = location[agent]
+                per_outpost = links(agent)
+
+                best = None
+                best_gain = min_gain
+
+                for outpost, weight in per_outpost.items():
+                    gain = weight - per_outpost.get(current, 0.0)
+
+                    if outpost != current and gain > best_gain and \
+                            fits(agent, outpost):
+                        best = outpost
+                        best_gain = gain
+
+                if best:
+                    assign(agent, best)
+                    moves += 1
+
+            scoutlog.debug('refinement pass %d: %d moves' % (iteration, moves))
+
+            if not moves:
+                break
+
+        # Build result
+        result = {outpost: [] for outpost in outmap.keys()}
+
+        for agent in free_agents:
+            if location[agent] != agentsmap[agent]['location']:
+                scoutlog.info('agent "%s" will be moved to outpost "%s"' % (
+                    agent, location[agent]))
+
+            result[location[agent]].append(agent)
+
+        cut = sum(weight for agent in weights
+                for peer, weight in weights[agent].items()
+                if location[agent] != location[peer]) / 2
+
+        scoutlog.info('traffic between outposts: %f messages/s' % cut)
+        scoutlog.debug('Balancer result: ' + str(result))
+
+        return result
+
+    def _equal_load(self, outmap, options):
         """ Maintains an equal load among all outposts.
 
             This requires the MIPS a machine is capable of and current MIPS
             obtained from the agents.
 
-            outmap - map of outposts and agents they contain
+            Each free agent is sent to the outpost with the lowest load,
+            found through a min-heap.
+
+            Ties are resolved exactly as the original implementation did,
+            which stable-sorted the list of loads before placing each free
+            agent: tied outposts keep the order they had in the previous
+            sort. The key of an outpost is therefore (load, -epoch, key at
+            the previous sort), where the epoch is the number of sorts done
+            when its load changed, and initial keys follow the map order.
+
+            outmap  - map of outposts and agents they contain
+            options - not used
         """
         total_mips = {}
-        current_load = []
+        current_load = {}
         agentsmap = {}
 
+        # Sort key of each outpost, the epoch of its last change and the
+        # number of sorts done
+        key = {}
+        changed = {}
+        sorts = 0
+
+        # Heap of (key, outpost), outdated entries are discarded when they
+        # reach the top
+        heap = []
+
         result = {}
 
         # Parse the necessary information
         for outpost in outmap.keys():
             result[outpost] = []
 
-            current_load.append((outpost, 0))
+            current_load[outpost] = 0
+            key[outpost] = (0, float('inf'), len(key))
+            changed[outpost] = None
+            heap.append((key[outpost], outpost))
+
             total_mips[outpost] = float(outmap[outpost]['mips'])
             agentsmap.update(outmap[outpost]['agents'])
 
-            # Update current load values
-            # for agent in outmap[outpost]['agents']:
-            #     ag_load = float(agentsmap[agent]['mips'] / total_mips[outpost])
+        heapq.heapify(heap)
+
+        def set_load(outpost, load):
+            """ Change the load of an outpost and push its new key. """
+            if load == current_load[outpost]:
+                return
+
+            # Several changes between sorts keep the key of the last sort
+            previous = key[outpost] if changed[outpost] != sorts \
+                    else key[outpost][2]
+
+            current_load[outpost] = load
+            changed[outpost] = sorts
+            key[outpost] = (load, -sorts, previous)
 
-            #     for index, load in enumerate(current_load):
-            #         if load[0] == outpost:
-            #             load[1] = load[1] + ag_load
-            #             current_load[index] = load
-            #             break
+            heapq.heappush(heap, (key[outpost], outpost))
 
         # Balance the load
         for agent in agentsmap.keys():
@@ -88,39 +526,33 @@ class Balancer(object):
             mips = agentsmap[agent]['mips']
             is_free = agentsmap[agent]['is_free']
 
-            ag_load = float(mips / total_mips[location])
-
             # Can be moved?
             if not is_free:
-                for index, load in enumerate(current_load):
-                    if load[0] == location:
-                        scoutlog.info('agent "%s" on hold in outpost "%s"' % (
-                            agent, location))
+                scoutlog.info('agent "%s" on hold in outpost "%s"' % (
+                    agent, location))
 
-                        outpost_load = load[1] + ag_load
+                outpost_load = current_load[location] + float(
+                        mips / total_mips[location])
 
-                        current_load[index] = (location, outpost_load)
-                        scoutlog.debug('new load of outpost %s: %f' % (
-                            location, outpost_load))
-                        break
+                set_load(location, outpost_load)
+
+                scoutlog.debug('new load of outpost %s: %f' % (
+                    location, outpost_load))
                 continue
 
-            # Remove load from its current machine
-            # for index, load in enumerate(current_load):
-            #     if load[0] == location:
-            #         load[1] = load[1] - ag_load
-            #         current_load[index] = load
-            #         break
+            # Discard outdated entries
+            while heap[0][0] is not key[heap[0][1]]:
+                heapq.heappop(heap)
 
-            # Order machine loads
-            current_load.sort(key=lambda tup: tup[1])
+            sorts += 1
 
-            # Add to first outpost
-            new_location = current_load[0][0]
-            new_ag_load = float(mips / total_mips[new_location])
-            outpost_load = current_load[0][1] + new_ag_load
+            # Add to outpost with lowest load
+            new_location = heap[0][1]
+            outpost_load = current_load[new_location] + float(
+                    mips / total_mips[new_location])
+
+            set_load(new_location, outpost_load)
 
-            current_load[0] = (new_location, outpost_load)
             scoutlog.debug('new load of outpost %s: %f' % (
                 new_location, outpost_load))
 
@@ -131,13 +563,434 @@ class Balancer(object):
 
         return result
 
-    def _user_prio(self, outmap):
+    def _first_fit_decreasing(self, outmap, options):
+        """ Pack agents into outposts using First-Fit Decreasing.
+
+            Free agents are sorted by their MIPS (highest first) and placed
+            in the first outpost, in order of priority (lowest value first),
+            in which they fit without exceeding the load ceiling. Held agents
+            keep their location and consume capacity. Agents that do not
+            fit anywhere are sent to central.
+
+            Filling one outpost at a time over the sorted agents is
+            equivalent to first-fit, and allows finding the next agent that
+            fits with a binary search instead of checking every outpost for
+            every agent.
+
+            Options:
+                ceiling - maximum load of an outpost (default 0.8)
+
+            outmap  - map of outposts and agents they contain
+            options - map of options
+        """
+        ceiling = _float_option(options, 'ceiling', 0.8)
+
+        result = {outpost: [] for outpost in outmap.keys()}
+
+        # Outposts without MIPS information cannot receive agents
+        outposts = [o for o in outmap.keys()
+                if _float_option(outmap[o], 'mips', 0) > 0]
+
+        outposts.sort(key=lambda o: (
+            _float_option(outmap[o], 'priority', float('inf')), o))
+
+        index = {outpost: i for i, outpost in enumerate(outposts)}
+
+        free_space = numpy.array(
+                [_float_option(outmap[o], 'mips', 0) for o in outposts],
+                dtype=float) * ceiling
+
+        # Held agents consume capacity in their current location
+        free_agents = []
+
+        for outpost in outmap.keys():
+            for agent, info in outmap[outpost]['agents'].items():
+                if info['is_free']:
+                    free_agents.append((agent, info['mips']))
+
+                elif outpost in index:
+                    scoutlog.info('agent "%s" on hold in outpost "%s"' % (
+                        agent, outpost))
+                    free_space[index[outpost]] -= info['mips']
+
+        # Sort by demand (highest first), ties by name
+        free_agents.sort()
+
+        names = numpy.array([a[0] for a in free_agents], dtype=object)
+        demand = numpy.array([a[1] for a in free_agents], dtype=float)
+
+        order = numpy.argsort(-demand, kind='stable')
+        names = names[order]
+        demand = demand[order]
+
+        for outpost in outposts:
+            if not len(demand):
+                break
+
+            space = free_space[index[outpost]]
+
+            # Negated demand is in ascending order, as required by searchsorted
+            neg_demand = -demand
+            taken = []
+            pos = 0
+
+            while pos < len(demand):
+                # First agent (from pos) whose demand is lower than the space
+                # left. Skipped agents will not fit later either, as the
+                # space only decreases
+                pos = max(pos, int(numpy.searchsorted(
+                    neg_demand, -space, side='right')))
+
+                if pos >= len(demand):
+                    break
+
+                space -= demand[pos]
+                taken.append(pos)
+                pos += 1
+
+            if not taken:
+                continue
+
+            free_space[index[outpost]] = space
+            result[outpost].extend(names[taken].tolist())
+
+            scoutlog.info('%d agents will be placed in outpost "%s"' % (
+                len(taken), outpost))
+
+            # Remove placed agents
+            pending = numpy.ones(len(demand), dtype=bool)
+            pending[taken] = False
+
+            names = names[pending]
+            demand = demand[pending]
+
+        # Force migration to central
+        if len(names):
+            scoutlog.info('forcing migration of %d agents to central' %
+                    len(names))
+
+            result['central'].extend(names.tolist())
+
+        scoutlog.debug('Balancer result: ' + str(result))
+
+        return result
+
+    def _optimal(self, outmap, options):
+        """ Search the best placement using branch and bound.
+
+            Intended for small fleets (a few dozen agents and outposts).
+            The cost of a placement is the maximum load of the outposts
+            (objective `load`) or the average priority value of the outposts
+            weighted by the MIPS of the agents (objective `priority`), plus
+            `migration_cost` for each agent that changes location.
+
+            Agents are assigned in order of MIPS (highest first), trying the
+            most promising outposts first, and branches whose lower bound is
+            not better than the best placement found are pruned. When the
+            time budget runs out, the best placement found is returned. The
+            optimality gap of the result (0 if the search was completed) is
+            available through `get_stats('optimal')`.
+
+            Held agents keep their location. Outposts cannot exceed the load
+            ceiling, except for central.
+
+            Options:
+                objective      - `load` or `priority` (default load)
+                migration_cost - cost of each migration (default 0.01)
+                ceiling        - maximum load of an outpost (default 0.8)
+                time_budget    - seconds to search (default 5)
+
+            outmap  - map of outposts and agents they contain
+            options - map of options
+        """
+        objective = options.get('objective', 'load')
+        migration_cost = _float_option(options, 'migration_cost', 0.01)
+        ceiling = _float_option(options, 'ceiling', 0.8)
+        deadline = time.time() + _float_option(options, 'time_budget', 5.0)
+
+        result = {outpost: [] for outpost in outmap.keys()}
+
+        # Outposts without MIPS information cannot receive agents
+        outposts = [o for o in outmap.keys()
+                if _float_option(outmap[o], 'mips', 0) > 0]
+
+        if 'central' not in outposts:
+            scoutlog.error('MIPS of central are unknown, cannot balance')
+            return result
+
+        index = {outpost: i for i, outpost in enumerate(outposts)}
+
+        total = [_float_option(outmap[o], 'mips', 0) for o in outposts]
+        limit = [float('inf') if o == 'central' else t * ceiling
+                for o, t in zip(outposts, total)]
+
+        # Outposts without priority are the least preferred
+        known = [_float_option(outmap[o], 'priority', None) for o in outposts]
+        worst = max([p for p in known if p is not None] or [0])
+        prio = [worst if p is None else p for p in known]
+
+        used = [0.0] * len(outposts)
+        agents = []
+
+        for outpost in outmap.keys():
+            for agent, info in outmap[outpost]['agents'].items():
+                mips = _float_option(info, 'mips', 0)
+
+                if info['is_free']:
+                    agents.append((agent, mips, index.get(outpost)))
+
+                elif outpost in index:
+                    # Held agents consume capacity in their current location
+                    used[index[outpost]] += mips
+
+        agents.sort(key=lambda a: (-a[1], a[0]))
+
+        # MIPS of the agents not yet assigned at each depth
+        remaining = [0.0] * (len(agents) + 1)
+        for depth in range(len(agents) - 1, -1, -1):
+            remaining[depth] = remaining[depth + 1] + agents[depth][1]
+
+        total_capacity = sum(total)
+        free_mips = remaining[0] or 1.0
+        by_prio = sorted(range(len(outposts)), key=lambda i: prio[i])
+
+        def bound(depth, prio_cost, migrations):
+            # Lower bound of any placement that completes the current one
+            if objective == 'priority':
+                # Fill the free space of the preferred outposts first,
+                # allowing agents to be split
+                pending = remaining[depth]
+                value = prio_cost
+
+                for i in by_prio:
+                    if pending <= 0:
+                        break
+
+                    amount = min(pending, max(limit[i] - used[i], 0))
+                    value += amount * prio[i]
+                    pending -= amount
+
+                value /= free_mips
+
+            else:
+                value = max(max(u / t for u, t in zip(used, total)),
+                        (sum(used) + remaining[depth]) / total_capacity)
+
+            return value + migration_cost * migrations
+
+        assignment = [None] * len(agents)
+        best = {'cost': float('inf'), 'assignment': None}
+        stats = {'nodes': 0, 'complete': True, 'open_bound': float('inf')}
+
+        def search(depth, prio_cost, migrations):
+            stats['nodes'] += 1
+
+            if depth == len(agents):
+                cost = bound(depth, prio_cost, migrations)
+
+                if cost < best['cost']:
+                    best['cost'] = cost
+                    best['assignment'] = list(assignment)
+
+                return
+
+            agent, mips, current = agents[depth]
+            children = []
+
+            for i in range(len(outposts)):
+                if used[i] + mips > limit[i]:
+                    continue
+
+                moved = 0 if i == current else 1
+
+                used[i] += mips
+                child_bound = bound(depth + 1,
+                        prio_cost + mips * prio[i], migrations + moved)
+                used[i] -= mips
+
+                children.append((child_bound, moved, i))
+
+            children.sort()
+
+            for position, (child_bound, moved, i) in enumerate(children):
+                if child_bound >= best['cost']:
+                    # Remaining children have higher bounds
+                    break
+
+                # Out of time, the first placement is always completed
+                if best['assignment'] is not None and time.time() > deadline:
+                    stats['complete'] = False
+                    stats['open_bound'] = min(
+                            stats['open_bound'], children[position][0])
+                    break
+
+                assignment[depth] = i
+                used[i] += mips
+
+                search(depth + 1, prio_cost + mips * prio[i],
+                        migrations + moved)
+
+                used[i] -= mips
+
+        search(0, 0.0, 0)
+
+        if best['assignment'] is None:
+            scoutlog.error('no valid placement found')
+            return result
+
+        lower_bound = min(best['cost'], stats['open_bound'])
+        gap = 0.0
+
+        if not stats['complete'] and best['cost'] > 0:
+            gap = (best['cost'] - lower_bound) / best['cost']
+
+        self._stats['optimal'] = {
+            'objective': objective,
+            'cost': best['cost'],
+            'lower_bound': lower_bound,
+            'gap': gap,
+            'nodes': stats['nodes'],
+            'complete': stats['complete']
+        }
+
+        scoutlog.info('optimal search: cost %f, gap %.2f%%, %d nodes%s' % (
+            best['cost'], gap * 100, stats['nodes'],
+            '' if stats['complete'] else ' (time budget exhausted)'))
+
+        # Build result
+        for (agent, mips, current), i in zip(agents, best['assignment']):
+            if i != current:
+                scoutlog.info('agent "%s" will be moved to outpost "%s"' % (
+                    agent, outposts[i]))
+
+            result[outposts[i]].append(agent)
+
+        scoutlog.debug('Balancer result: ' + str(result))
+
+        return result
+
+    def _stable(self, outmap, options):
+        """ Improve the current placement only when it pays off.
+
+            Starting from the current location of the agents, the balancer
+            moves free agents one at a time to reduce the sum of squared
+            outpost loads. A move is only performed when that reduction is
+            greater than the cost of migrating the agent increased by a
+            margin, so small fluctuations in MIPS do not cause agents to
+            bounce between outposts. Destinations cannot exceed the load
+            ceiling, except for central.
+
+            The cost of a migration is `base_cost + size_cost * MB`, where
+            MB is the size of the files of the agent.
+
+            Options:
+                base_cost - fixed cost of any migration (default 0.01)
+                size_cost - cost per MB of agent files (default 0.001)
+                margin    - relative margin the gain must exceed the cost
+                            by (default 0.2)
+                ceiling   - maximum load of an outpost (default 0.8)
+
+            outmap  - map of outposts and agents they contain
+            options - map of options
+        """
+        base_cost = _float_option(options, 'base_cost', 0.01)
+        size_cost = _float_option(options, 'size_cost', 0.001)
+        margin = _float_option(options, 'margin', 0.2)
+        ceiling = _float_option(options, 'ceiling', 0.8)
+
+        total_mips = {}
+        current_load = {}
+        agentsmap = {}
+
+        result = {}
+
+        # Current placement
+        for outpost in outmap.keys():
+            total_mips[outpost] = _float_option(outmap[outpost], 'mips', 0)
+            agentsmap.update(outmap[outpost]['agents'])
+
+            result[outpost] = list(outmap[outpost]['agents'].keys())
+
+            current_load[outpost] = 0.0
+            if total_mips[outpost] <= 0:
+                continue
+
+            for info in outmap[outpost]['agents'].values():
+                current_load[outpost] += info['mips'] / total_mips[outpost]
+
+        # Outposts without MIPS information cannot receive agents
+        destinations = [o for o in outmap.keys() if total_mips[o] > 0]
+
+        candidates = [a for a in agentsmap.keys()
+                if agentsmap[a]['is_free']
+                and total_mips[agentsmap[a]['location']] > 0]
+
+        # Apply the best move until none of them is worth its cost
+        while candidates:
+            best = None
+
+            for agent in candidates:
+                location = agentsmap[agent]['location']
+                mips = agentsmap[agent]['mips']
+
+                origin_load = current_load[location]
+                new_origin_load = origin_load - mips / total_mips[location]
+
+                cost = base_cost + size_cost * (
+                        agentsmap[agent].get('size', 0) / 1048576.0)
+
+                for outpost in destinations:
+                    if outpost == location:
+                        continue
+
+                    dest_load = current_load[outpost]
+                    new_dest_load = dest_load + mips / total_mips[outpost]
+
+                    if new_dest_load > ceiling and outpost != 'central':
+                        continue
+
+                    gain = (origin_load ** 2 + dest_load ** 2) - (
+                            new_origin_load ** 2 + new_dest_load ** 2)
+
+                    benefit = gain - cost * (1 + margin)
+
+                    if benefit > 0 and (not best or benefit > best[0]):
+                        best = (benefit, agent, outpost,
+                                new_origin_load, new_dest_load)
+
+            if not best:
+                break
+
+            _, agent, outpost, new_origin_load, new_dest_load = best
+            location = agentsmap[agent]['location']
+
+            scoutlog.info('agent "%s" will be moved to outpost "%s"' % (
+                agent, outpost))
+
+            result[location].remove(agent)
+            result[outpost].append(agent)
+
+            current_load[location] = new_origin_load
+            current_load[outpost] = new_dest_load
+
+            scoutlog.debug('new load of outpost %s: %f' % (
+                outpost, new_dest_load))
+
+            # Each agent is moved at most once per run
+            candidates.remove(agent)
+
+        scoutlog.debug('Balancer result: ' + str(result))
+
+        return result
+
+    def _user_prio(self, outmap, options):
         """ Assign agents to outposts based on user priority.
 
             This balancer will try to fill an outpost up to its 80% available
             MIPS using information gathered and the 'priority' configuration.
 
-            outmap - map of outposts and agents they contain
+            outmap  - map of outposts and agents they contain
+            options - not used
         """
         total_mips = {}
         current_load = {}
@@ -222,3 +1075,140 @@ class Balancer(object):
         scoutlog.debug('Balancer result: ' + str(result))
 
         return result
+
+    def _vector(self, outmap, options):
+        """ Pack agents considering CPU, memory and message bandwidth.
+
+            The demand of an agent and the capacity of an outpost are vectors
+            with MIPS, resident memory and received bytes per second. Agents
+            are sorted by their dominant share (largest fraction of the total
+            capacity of any resource they use) and each one is sent to the
+            outpost whose most used resource would be the least used after
+            receiving it, as long as no resource exceeds its ceiling. Held
+            agents keep their location and consume capacity. Agents that do
+            not fit anywhere are sent to central.
+
+            Capacities are read from the `mips`, `memory` (MB) and
+            `bandwidth` (KB/s) keys of each outpost, and their ceilings from
+            `mips_ceiling`, `memory_ceiling` and `bandwidth_ceiling`.
+            Resources without capacity are not limited, but outposts without
+            MIPS information cannot receive agents.
+
+            Options:
+                ceiling - default ceiling of the resources (default 0.8)
+
+            outmap  - map of outposts and agents they contain
+            options - map of options
+        """
+        default_ceiling = _float_option(options, 'ceiling', 0.8)
+
+        capacity = {}
+        used = {}
+        free_agents = []
+
+        result = {}
+
+        # Parse the necessary information
+        for outpost in outmap.keys():
+            result[outpost] = []
+
+            capacity[outpost] = []
+            used[outpost] = [0.0] * len(VECTOR_RESOURCES)
+
+            for key, factor in VECTOR_RESOURCES:
+                total = _float_option(outmap[outpost], key, 0) * factor
+                ceiling = _float_option(
+                        outmap[outpost], key + '_ceiling', default_ceiling)
+
+                capacity[outpost].append(total * ceiling if total > 0 else None)
+
+            for agent, info in outmap[outpost]['agents'].items():
+                demand = _agent_demand(info)
+
+                if info['is_free']:
+                    free_agents.append((agent, demand))
+                    continue
+
+                # Held agents consume capacity in their current location
+                scoutlog.info('agent "%s" on hold in outpost "%s"' % (
+                    agent, outpost))
+
+                for i, value in enumerate(demand):
+                    used[outpost][i] += value
+
+        destinations = [o for o in outmap.keys() if capacity[o][0]]
+        destinations.sort(key=lambda o: (
+            _float_option(outmap[o], 'priority', float('inf')), o))
+
+        # Total capacity of each resource, used to obtain dominant shares
+        totals = [sum(capacity[o][i] or 0 for o in destinations)
+                for i in range(len(VECTOR_RESOURCES))]
+
+        def dominant_share(item):
+            return max(value / totals[i] if totals[i] else 0
+                    for i, value in enumerate(item[1]))
+
+        free_agents.sort(key=lambda item: item[0])
+        free_agents.sort(key=dominant_share, reverse=True)
+
+        # Balance the load
+        for agent, demand in free_agents:
+            best = None
+
+            for outpost in destinations:
+                score = 0.0
+
+                for i, cap in enumerate(capacity[outpost]):
+                    if cap is None:
+                        continue
+
+                    usage = (used[outpost][i] + demand[i]) / cap
+
+                    if usage >= 1:
+                        break
+
+                    score = max(score, usage)
+
+                else:
+                    # Destinations are sorted by priority, keep the first
+                    if best is None or score < best[0]:
+                        best = (score, outpost)
+
+            if best:
+                new_location = best[1]
+                scoutlog.info('agent "%s" will be moved to outpost "%s"' % (
+                    agent, new_location))
+
+            else:
+                new_location = 'central'
+                scoutlog.info('forcing migration of "%s" to central' % agent)
+
+            for i, value in enumerate(demand):
+                used[new_location][i] += value
+
+            result[new_location].append(agent)
+
+        scoutlog.debug('Balancer result: ' + str(result))
+
+        return result
+
+
+def _agent_demand(info):
+    """ Obtain the demand vector of an agent (see VECTOR_RESOURCES).
+
+        info - information of the agent in the outpost map
+    """
+    return [_float_option(info, key, 0) for key, _ in VECTOR_RESOURCES]
+
+def _float_option(options, key, default):
+    """ Obtain a float value from a map of options.
+
+        options - map of options
+        key     - option name
+        default - value returned if the option is missing or invalid
+    """
+    try:
+        return float(options[key])
+
+    except (KeyError, TypeError, ValueError):
+        return default
@@ -18,28 +18,44 @@
 
 """Database managers."""
 
-from .db import agent_book_proxy, zone_book_proxy, \
-        AgentInfo, AgentMessage, \
-        AgentZone, OutpostZone
+from .storage import AgentState, OutpostState, ROLLUP_RESOLUTIONS
 from libscout import get_logger
-from peewee import SqliteDatabase, IntegrityError
+import atexit
+import collections
+import json
+import queue
+import threading
+import time
 import zoe
 
 # Logging
 scoutlog = get_logger('libscout.book')
 
+# Attempts to write a change to the zone book storage before giving up
+WRITE_ATTEMPTS = 3
+
 
 class AgentBook(object):
 
-    def __init__(self, db):
+    def __init__(self, storage):
         """ Initialize the manager for deferred messages and serialized
             information.
 
-            db - absolute path to database file (sqlite)
+            storage - AgentStorage instance (see `storage.open_storage()`)
         """
-        self.db = SqliteDatabase(db)
-        agent_book_proxy.initialize(self.db)
-        self.db.create_tables([AgentInfo, AgentMessage], True)
+        self.storage = storage
+
+        # Last sequence number given to a message
+        self._seq = storage.max_seq()
+
+        # Deferred messages waiting to be written (group commit)
+        self._batch = None
+        self._batch_cond = threading.Condition()
+
+        # Batches created and written, they are written in order so that
+        # messages are committed in the order of their sequence numbers
+        self._batches = 0
+        self._written = 0
 
     def delete_info(self, agent):
         """ Delete stored information for a given agent.
@@ -48,27 +64,43 @@ class AgentBook(object):
         """
         scoutlog.info('deleting stored information of agent %s' % agent)
 
-        try:
-            info = AgentInfo.get(AgentInfo.agent == agent)
-
-        except AgentInfo.DoesNotExist:
+        if not self.storage.delete_info(agent):
             scoutlog.error('no information to delete for agent %s' % agent)
             return False
 
-        info.delete_instance()
         return True
 
-    def delete_messages(self, agent):
+    def delete_messages(self, agent, upto=None):
         """ Delete stored messages for a given agent.
 
             agent - agent name
+            upto  - if provided, only delete messages with a sequence number
+                    lower or equal to this one (already replayed)
         """
         scoutlog.info('deleting stored messages of agent %s' % agent)
 
-        query = AgentMessage.delete().where(AgentMessage.agent == agent)
-        query.execute()
+        self.storage.delete_messages(agent, upto)
         return True
 
+    def flush(self):
+        """ Write the deferred messages waiting in the buffer and wait until
+            every message stored before has been committed.
+        """
+        with self._batch_cond:
+            batch = self._batch
+            self._batch = None
+            last = self._batches
+
+            # Do not keep the leader of the batch waiting
+            self._batch_cond.notify_all()
+
+        if batch:
+            self._write_batch(batch)
+
+        # Previous batches are being written by their leaders
+        with self._batch_cond:
+            self._batch_cond.wait_for(lambda: self._written >= last)
+
     def get_info(self, agent):
         """ Return the stored information (if any).
 
@@ -76,12 +108,12 @@ class AgentBook(object):
         """
         scoutlog.info('obtaining stored information of agent %s' % agent)
 
-        try:
-            return AgentInfo.get(AgentInfo.agent == agent).info
+        info = self.storage.get_info(agent)
 
-        except AgentInfo.DoesNotExist:
+        if info is None:
             scoutlog.error('no information stored for agent %s' % agent)
-            return None
+
+        return info
 
     def get_messages(self, agent):
         """ Return all messages for a given agent.
@@ -90,14 +122,41 @@ class AgentBook(object):
         """
         scoutlog.info('obtaining stored stored messages for agent %s' % agent)
 
-        try:
-            return [a.message for a in AgentMessage.select().where(
-                AgentMessage.agent == agent)]
+        self.flush()
 
-        except:
-            # Not found?
+        messages = [m for _, m in self.storage.get_messages(agent)]
+
+        if not messages:
             scoutlog.warning('no messages for agent %s' % agent)
-            return []
+
+        return messages
+
+    def get_message_page(self, agent, after=0, limit=None):
+        """ Return stored messages for a given agent in the order they were
+            received, as a list of (sequence number, message) tuples.
+
+            agent - agent name
+            after - only return messages with a sequence number greater than
+                    this one
+            limit - maximum number of messages to return
+        """
+        self.flush()
+
+        return self.storage.get_messages(agent, after, limit)
+
+    def purge_messages(self, ttl):
+        """ Delete stored messages older than the given time to live.
+
+            Returns the number of deleted messages.
+
+            ttl - seconds a message may remain stored
+        """
+        removed = self.storage.purge_messages(time.time() - ttl)
+
+        if removed:
+            scoutlog.warning('purged %d expired deferred messages' % removed)
+
+        return removed
 
     def store_info(self, parser):
         """ Store serialized information for a given agent.
@@ -119,17 +178,29 @@ class AgentBook(object):
         # Store message
         raw_msg = zoe.MessageBuilder(new_map).msg()
 
-        try:
-            AgentInfo.create(agent=dst, info=raw_msg)
-
-        except IntegrityError as e:
-            scoutlog.exception('failed to store information of agent %s' % dst)
+        if not self.storage.put_info(dst, raw_msg):
+            scoutlog.error('information of agent %s is already stored' % dst)
 
-    def store_message(self, parser):
+    def store_message(self, parser, max_messages=None, delay=0,
+            batch_size=1):
         """ Store deferred messages. Convert special tags to their original
             counterparts.
 
-            parser  - zoe MessageParser instance
+            Messages stored concurrently are written in a single transaction
+            (group commit): the first one waits up to `delay` seconds or
+            until `batch_size` messages are buffered and writes all of them.
+            The method returns once the message has been committed.
+
+            If the agent already has `max_messages` stored, the oldest ones
+            are discarded.
+
+            Returns whether the message was stored.
+
+            parser       - zoe MessageParser instance
+            max_messages - maximum number of messages stored per agent
+            delay        - seconds to wait for other messages
+            batch_size   - number of messages that are written without
+                           waiting any longer
         """
         dst = parser.get('_outpost_dst')
         src = parser.get('_outpost_src')
@@ -155,28 +226,161 @@ class AgentBook(object):
 
         # Store message
         raw_msg = zoe.MessageBuilder(new_map, parser._map).msg()
-        AgentMessage.create(agent=dst, message=raw_msg)
+
+        with self._batch_cond:
+            self._seq += 1
+
+            batch = self._batch
+            leader = batch is None
+
+            if leader:
+                self._batches += 1
+                batch = self._batch = _MessageBatch(
+                        max_messages, self._batches)
+
+            batch.rows.append({
+                'agent': dst,
+                'message': raw_msg,
+                'seq': self._seq,
+                'timestamp': time.time()
+            })
+
+            if len(batch.rows) >= batch_size:
+                self._batch_cond.notify_all()
+
+            if leader:
+                self._batch_cond.wait_for(
+                        (lambda: len(batch.rows) >= batch_size or
+                            self._batch is not batch), delay)
+
+                # Not written by a flush in the meantime
+                leader = self._batch is batch
+
+                if leader:
+                    self._batch = None
+
+        if leader:
+            self._write_batch(batch)
+
+        else:
+            batch.done.wait()
+
+        return batch.stored
+
+    def _write_batch(self, batch):
+        """ Write a batch of deferred messages in a single transaction and
+            notify the threads waiting for it.
+
+            Batches are written one at a time, in the order they were
+            created.
+
+            batch - _MessageBatch instance
+        """
+        with self._batch_cond:
+            self._batch_cond.wait_for(
+                    lambda: self._written == batch.number - 1)
+
+        scoutlog.debug('writing %d deferred messages' % len(batch.rows))
+
+        try:
+            self.storage.append_messages(batch.rows, batch.max_messages)
+            batch.stored = True
+
+        except Exception as e:
+            scoutlog.exception('failed to store %d deferred messages' % len(
+                batch.rows))
+
+        finally:
+            with self._batch_cond:
+                self._written = batch.number
+                self._batch_cond.notify_all()
+
+            batch.done.set()
+
+
+class _MessageBatch(object):
+    """ Deferred messages written in the same transaction. """
+
+    def __init__(self, max_messages, number):
+        self.rows = []
+        self.max_messages = max_messages
+        self.number = number
+        self.stored = False
+        self.done = threading.Event()
 
 
 class ZoneBook(object):
 
-    def __init__(self, db):
+    def __init__(self, storage):
         """ Initialize the manager for agent locations and outpost resource
             storage.
 
-            db - absolute path to database file (sqlite)
+            Outposts, agents and their locations are kept in memory, loaded
+            from the storage on startup. Reads use an immutable snapshot of
+            the model without locking, while changes replace the snapshot
+            and are written to the storage in order by a background thread.
+
+            Changes to agent locations and outposts wait until they have
+            been written, while resources are written in the background.
+            If a change cannot be written, the model is reloaded from the
+            storage once the pending changes have been written.
+
+            storage - ZoneStorage instance (see `storage.open_storage()`)
+        """
+        self.storage = storage
+
+        self._model = self._load_model()
+        self._model_lock = threading.Lock()
+
+        # Changes pending to be written to the storage, queued while holding
+        # the model lock so that they are written in the order they were
+        # applied to the model
+        self._writes = queue.Queue()
+
+        # Failed writes since the last flush and whether the model has to be
+        # reloaded
+        self._failed = 0
+        self._dirty = False
+
+        # Bytes of the files of each agent, measured outside of the zone book
+        # and only kept in memory: {agent: (static, dynamic, timestamp)}
+        self._sizes = {}
+
+        writer = threading.Thread(target=self._write_loop, daemon=True)
+        writer.start()
+
+        # Do not lose queued changes when the scout stops
+        atexit.register(self.flush)
+
+    @property
+    def version(self):
+        """ Number that changes whenever agents, their locations or
+            resources, or outposts are modified. Used to invalidate data
+            derived from the zone book.
+        """
+        return self._model.version
+
+    def flush(self):
+        """ Wait until all the changes have been written to the storage.
+
+            Returns False if a change could not be written since the
+            previous flush.
         """
-        self.db = SqliteDatabase(db)
-        zone_book_proxy.initialize(self.db)
-        self.db.create_tables([OutpostZone, AgentZone], True)
+        self._writes.join()
+
+        with self._model_lock:
+            failed = self._failed
+            self._failed = 0
+
+        return not failed
 
     def get_agents(self):
         """ Return a list of agents.
 
-            Note that this returns the object rather than just the name in
+            Note that this returns the record rather than just the name in
             case other information is wanted.
         """
-        return list(AgentZone.select())
+        return list(self._model.agents.values())
 
     def get_agent_location(self, name):
         """ Get the location for a given agent.
@@ -185,55 +389,182 @@ class ZoneBook(object):
 
             name - name of the agent
         """
-        scoutlog.info('obtaining location of agent %s' % name)
-
-        try:
-            return AgentZone.get(AgentZone.name == name).location.name
+        agent = self._model.agents.get(name)
 
-        except Exception as e:
+        if not agent:
             scoutlog.warning('could not get location of agent %s' % name)
             return None
 
+        return agent.location
+
+    def get_agent_size(self, name, max_age=None):
+        """ Get the cached size of the files of an agent.
+
+            Returns a tuple with (static bytes, dynamic bytes) as returned by
+            `util.get_agent_size()`, or None if the size is unknown or older
+            than `max_age` seconds.
+
+            name    - name of the agent
+            max_age - maximum age of the cached size in seconds
+        """
+        size = self._sizes.get(name)
+
+        if not size or (max_age is not None and
+                time.time() - size[2] > max_age):
+            return None
+
+        return size[:2]
+
     def get_agents_in(self, outpost_id):
         """ Get the agents found in a given location.
 
             outpost_id - outpost id to search for
         """
-        scoutlog.info('obtaining agents located in %s' % outpost_id)
+        model = self._model
 
-        try:
-            outpost = OutpostZone.get(OutpostZone.name == outpost_id)
-
-        except OutpostZone.DoesNotExist as e:
+        if outpost_id not in model.outposts:
             scoutlog.warning('outpost %s not found in zone book' % outpost_id)
             return []
 
-        return outpost.agents
+        return [model.agents[a]
+            for a in sorted(model.locations.get(outpost_id, ()))]
 
     def get_agent_names_in(self, outpost_id):
         """ Get the agent names found in a given location.
 
             outpost_id - outpost id to search for
         """
-        scoutlog.info('obtaining agent names located in %s' % outpost_id)
-
-        try:
-            outpost = OutpostZone.get(OutpostZone.name == outpost_id)
+        model = self._model
 
-        except OutpostZone.DoesNotExist as e:
+        if outpost_id not in model.outposts:
             scoutlog.warning('outpost %s not found in zone book' % outpost_id)
             return []
 
-        return [agent.name for agent in outpost.agents]
+        return sorted(model.locations.get(outpost_id, ()))
+
+    def get_agent_summary(self):
+        """ Return the name, location, MIPS and last update of every agent
+            as a list of tuples, sorted by location and name.
+        """
+        return sorted(((a.name, a.location, a.mips, a.timestamp)
+            for a in self._model.agents.values()),
+            key=lambda a: (a[1], a[0]))
+
+    def get_demand_history(self, agent, start, end):
+        """ Obtain the MIPS history of an agent at the finest resolution
+            available: raw samples where they are kept and one-minute
+            rollups before the oldest sample.
+
+            Returns a list of (timestamp, MIPS) tuples in chronological
+            order.
+
+            agent - name of the agent
+            start - start of the range (seconds since epoch)
+            end   - end of the range (seconds since epoch)
+        """
+        oldest = self.storage.oldest_sample(agent)
+        history = []
+
+        if oldest is None or oldest > start:
+            resolution = ROLLUP_RESOLUTIONS[0]
+            until = end if oldest is None else oldest
+
+            # Buckets completely before the oldest sample
+            history.extend((r['bucket'], r['mips_sum'] / r['samples'])
+                for r in self.storage.get_rollups(
+                    agent, resolution, start, until - resolution)
+                if r['samples'])
+
+        history.extend((s['timestamp'], s['mips'])
+            for s in self.storage.get_samples(agent, start, end))
+
+        return history
+
+    def get_migration_stats(self, agent=None):
+        """ Obtain average timings of past migrations.
+
+            Returns a dict with the number of migrations (`count`), average
+            downtime and transfer time in seconds (`downtime`, `transfer`)
+            and the average transfer throughput in bytes per second
+            (`throughput`, None if unknown).
+
+            agent - only take into account migrations of this agent
+        """
+        return self.storage.get_migration_stats(agent)
 
     def get_outposts(self):
         """ Return a list of outposts.
 
-            Note that this returns the object rather than just the name in
+            Note that this returns the record rather than just the name in
             case other information is wanted.
         """
-        return list(OutpostZone.select())
+        return list(self._model.outposts.values())
+
+    def get_running_outposts(self):
+        """ Return a set with the names of the outposts that are known to be
+            running.
+        """
+        return set(self._model.running)
+
+    def get_resource_history(self, agent, start, end, max_points=500):
+        """ Obtain the resources of an agent in a time range.
+
+            Raw samples are used if there are few enough of them, otherwise
+            the finest rollup that covers the range with at most
+            `max_points` buckets. Raw samples or rollups are only skipped
+            when they were purged from the range (older data remains in a
+            coarser rollup), not when the agent is younger than the range.
+
+            Returns a list of dicts with `timestamp`, `mips` (average),
+            `mips_max`, `memory` and `bandwidth` in chronological order.
+            Memory and bandwidth are None where they were not measured.
+
+            agent      - name of the agent
+            start      - start of the range (seconds since epoch)
+            end        - end of the range (seconds since epoch)
+            max_points - maximum number of points to return
+        """
+        # Oldest sample (resolution 0) and bucket of every resolution
+        oldest = {0: self.storage.oldest_sample(agent)}
+
+        for resolution in ROLLUP_RESOLUTIONS:
+            oldest[resolution] = self.storage.oldest_rollup(agent, resolution)
+
+        if not self._history_purged(oldest, 0, start) and \
+                self.storage.count_samples(agent, start, end) <= max_points:
+            return [dict(s, mips_max=s['mips'])
+                for s in self.storage.get_samples(agent, start, end)]
+
+        for resolution in ROLLUP_RESOLUTIONS:
+            last = resolution == ROLLUP_RESOLUTIONS[-1]
+
+            if (end - start) / resolution > max_points and not last:
+                continue
 
+            if oldest[resolution] is None or (not last and
+                    self._history_purged(oldest, resolution, start)):
+                continue
+
+            rollups = self.storage.get_rollups(
+                    agent, resolution, start - resolution, end)
+
+            return [{
+                'timestamp': r['bucket'],
+                'mips': r['mips_sum'] / r['samples'],
+                'mips_max': r['mips_max'],
+                'memory': _average(r['memory_sum'], r['memory_samples']),
+                'bandwidth': _average(
+                    r['bandwidth_sum'], r['bandwidth_samples'])
+            } for r in rollups if r['samples']]
+
+        return []
+
+    def get_traffic_matrix(self):
+        """ Obtain the messages per second exchanged between agents.
+
+            Returns a dict with (src, dst) tuples as keys.
+        """
+        return self.storage.get_traffic_matrix()
 
     def is_outpost_running(self, name):
         """ Check if an outpost is known to be running or not.
@@ -242,126 +573,404 @@ class ZoneBook(object):
 
             name - name of the outpost
         """
-        scoutlog.info('checking if outpost %s is currently running' % name)
-
-        try:
-            return OutpostZone.get(OutpostZone.name == name).is_running
+        outpost = self._model.outposts.get(name)
 
-        except OutpostZone.DoesNotExist as e:
+        if not outpost:
             scoutlog.warning('outpost %s not found in zone book' % name)
             return None
 
+        return outpost.is_running
+
     def move_agent(self, name, location):
         """ Move an agent to the given location.
 
+            Returns whether the new location was written to the storage.
+
             name     - name of the agent
             location - new location of the agent
         """
         scoutlog.info('moving agent %s to %s' % (name, location))
 
-        try:
-            outpost = OutpostZone.get(OutpostZone.name == location)
+        with self._model_lock:
+            model = self._model
 
-            query = AgentZone.update(location=outpost).where(
-                    AgentZone.name == name)
-            query.execute()
-            return True
+            if name not in model.agents or location not in model.outposts:
+                scoutlog.error('could not update location of agent %s' % name)
+                return False
+
+            agents = dict(model.agents)
+            agents[name] = agents[name]._replace(location=location)
+
+            self._model = model.replace(agents=agents)
+
+            write = self._queue(self.storage.write_location, name, location)
+
+        return write.wait()
+
+    def purge_resources(self, retention):
+        """ Remove resource history older than its retention period.
+
+            Returns the number of removed rows.
+
+            retention - dict with the seconds to keep for raw samples (key 0)
+                        and each rollup resolution
+        """
+        now = time.time()
+
+        try:
+            return self.storage.purge_resources(
+                    {k: now - v for k, v in retention.items()})
 
         except Exception as e:
-            scoutlog.exception('could not update location of agent %s' % name)
-            return False
+            scoutlog.exception('error while purging resource history')
+            return 0
 
-    def refresh_agents(self, agent_list):
-        """ Refresh the agents table with those in the given list.
+    def refresh(self, agent_list, outpost_list):
+        """ Refresh the agents and outposts with the given lists.
 
-            Agents that do not exist will be created, while agents that no
-            longer exist will be removed.
+            Agents that do not exist will be created in central, while agents
+            that no longer exist will be removed. Outposts that do not exist
+            will be created. Outposts that no longer exist are kept for
+            historic purposes and to prevent issues with keys.
 
-            agent_list - list of agent names
+            The changes are written to the storage in a single transaction.
+
+            Returns True if the zone book was refreshed and written to the
+            storage.
+
+            agent_list   - list of agent names
+            outpost_list - list of outpost names
         """
-        scoutlog.info('refreshing agent list')
+        scoutlog.info('refreshing agent and outpost lists')
 
-        current_list = [agent.name for agent in AgentZone.select()]
-        diff_list = list(set(current_list) - set(agent_list))
+        with self._model_lock:
+            model = self._model
 
-        # Add new agents
-        central, created = OutpostZone.get_or_create(name='central')
+            new_outposts = sorted(
+                    set(outpost_list).union(['central']) -
+                    set(model.outposts.keys()))
+            new_agents = sorted(set(agent_list) - set(model.agents.keys()))
+            removed = sorted(set(model.agents.keys()) - set(agent_list))
 
-        for agent in agent_list:
-            new, created = AgentZone.get_or_create(
-                name=agent,
-                defaults={'location': central})
+            if not (new_outposts or new_agents or removed):
+                return True
 
-        # Remove non-existing agents
-        if diff_list:
-            query = AgentZone.delete().where(AgentZone.name << diff_list)
-            query.execute()
+            outposts = dict(model.outposts)
+            agents = dict(model.agents)
 
-    def refresh_outposts(self, outpost_list):
-        """ Refresh the outposts table with those in the given list.
+            for name in new_outposts:
+                outposts[name] = OutpostState(name, False, time.time())
 
-            Outposts that do not exist will be created. Outposts that no longer
-            exist are kept for historic purposes and to prevent issues with
-            keys.
+            for name in new_agents:
+                agents[name] = AgentState(
+                        name, 'central', 0.0, 0.0, 0.0, time.time())
 
-            outpost_list - ConfigParser instance of the outpost list
+            for name in removed:
+                del agents[name]
+                self._sizes.pop(name, None)
+
+            self._model = model.replace(agents=agents, outposts=outposts)
+
+            write = self._queue(self.storage.write_refresh,
+                    new_outposts, new_agents, removed)
+
+        scoutlog.info('adding %d outposts and %d agents, removing %d agents' % (
+            len(new_outposts), len(new_agents), len(removed)))
+
+        return write.wait()
+
+    def refresh_agents(self, agent_list):
+        """ Refresh the agents with those in the given list.
+
+            agent_list - list of agent names
         """
-        scoutlog.info('refreshing outpost list')
+        return self.refresh(agent_list, [])
 
-        # Add new outposts
-        for outpost in filter(
-            (lambda o: o.startswith('outpost ')), outpost_list.sections()):
+    def refresh_outposts(self, outpost_list):
+        """ Refresh the outposts with those in the given list.
+
+            outpost_list - list of outpost names
+        """
+        return self.refresh(self._model.agents.keys(), outpost_list)
 
-            name = outpost.replace('outpost ', '', 1)
-            outpost, created = OutpostZone.get_or_create(name=name)
+    def set_agent_size(self, name, static_size, dynamic_size):
+        """ Cache the size of the files of an agent.
+
+            name         - name of the agent
+            static_size  - bytes of static files
+            dynamic_size - bytes of dynamic files (None if unknown)
+        """
+        self._sizes[name] = (static_size, dynamic_size, time.time())
 
     def set_outpost_running(self, name, value):
         """ Change the `is_running` flag of an outpost to indicate whether it
             has been started or not.
 
+            Returns whether the flag was written to the storage.
+
             name  - name of the outpost to change
             value - boolean indicating whether it is running or not
         """
         scoutlog.info('setting running status of outpost %s to: %r' % (
             name, value))
 
+        with self._model_lock:
+            model = self._model
+
+            if name not in model.outposts:
+                scoutlog.error('could not set running status of outpost %s' %
+                        name)
+                return False
+
+            outposts = dict(model.outposts)
+            outposts[name] = outposts[name]._replace(is_running=bool(value))
+
+            self._model = model.replace(outposts=outposts)
+
+            write = self._queue(self.storage.write_running, name, bool(value))
+
+        return write.wait()
+
+    def store_migration(self, agent, origin, destination, size, phases):
+        """ Store the timings of a completed migration.
+
+            agent       - name of the agent
+            origin      - previous location of the agent
+            destination - new location of the agent
+            size        - bytes of agent files that were moved
+            phases      - PhaseTimer instance used during the migration
+        """
+        scoutlog.info('storing timings of migration of agent %s' % agent)
+
         try:
-            query = OutpostZone.update(is_running=value).where(
-                    OutpostZone.name == name)
-            query.execute()
+            self.storage.write_migration({
+                'agent': agent,
+                'origin': origin,
+                'destination': destination,
+                'size': size,
+                'downtime': phases.downtime(),
+                'transfer': phases.transfer(),
+                'phases': json.dumps(phases.durations()),
+                'timestamp': time.time()
+            })
             return True
 
         except Exception as e:
-            scoutlog.exception('could not set running status of outpost %s' %
-                    name)
+            scoutlog.exception('could not store migration of %s' % agent)
             return False
 
-    def store_agent_resources(self, name, **info):
-        """ Update the resources for a given agent.
+    def store_resources(self, samples, traffic=None):
+        """ Store the resources gathered in a location.
 
-            If no record for an outpost exists, it will be created.
+            The latest values are kept in memory and in the agents table,
+            while every sample is added to the history and its rollups. The
+            storage is updated in a single transaction, in the background
+            (see `flush()`).
 
-            name - name of the agent
-            info - parameters containing the information
+            samples - list of dicts with `agent`, `timestamp`, `mips`,
+                      `memory` and `bandwidth` keys (missing resources are
+                      not updated)
+            traffic - dict with the messages per second received by each
+                      agent from each sender
         """
-        scoutlog.info('updating resources of agent %s' % name)
+        scoutlog.info('storing resources of %d agents' % len(samples))
 
-        # Create agent record if necessary
-        agent, created = AgentZone.get_or_create(
-            name=name,
-            defaults=info)
+        with self._model_lock:
+            model = self._model
+            agents = dict(model.agents)
 
-        if created:
-            # Was updated when created
-            return True
+            for sample in samples:
+                if sample['agent'] not in agents:
+                    continue
 
-        # Update information
-        try:
-            query = AgentZone.update(**info).where(
-                    AgentZone.name == name)
-            query.execute()
+                values = {k: v for k, v in sample.items() if k != 'agent'}
+                agents[sample['agent']] = agents[sample['agent']]._replace(
+                        **values)
+
+            self._model = model.replace(agents=agents)
+
+            self._queue(self.storage.write_resources, samples, traffic or {})
+
+    def _history_purged(self, oldest, resolution, start):
+        """ Check whether the history of a resolution was purged from a
+            time range: there is no data in that resolution, or its oldest
+            data is newer than `start` and a coarser rollup has buckets
+            before it.
+
+            oldest     - dict with the oldest sample (key 0) or bucket of
+                         each resolution (None if there is no data)
+            resolution - resolution to check (0 for raw samples)
+            start      - start of the range (seconds since epoch)
+        """
+        first = oldest[resolution]
+
+        if first is None:
             return True
 
-        except Exception as e:
-            scoutlog.exception('error while updating resources of %s' % name)
+        if first <= start:
             return False
+
+        for coarser in ROLLUP_RESOLUTIONS:
+            if coarser <= resolution or oldest[coarser] is None:
+                continue
+
+            # Whole coarser buckets before the finer data
+            if oldest[coarser] < first // coarser * coarser:
+                return True
+
+        return False
+
+    def _load_model(self, version=0):
+        """ Load the outposts, agents and their locations from the
+            storage.
+
+            version - number of the loaded snapshot
+        """
+        outposts, agents = self.storage.load()
+
+        scoutlog.info('loaded %d outposts and %d agents' % (
+            len(outposts), len(agents)))
+
+        return _ZoneModel({a.name: a for a in agents},
+                {o.name: o for o in outposts}, version)
+
+    def _queue(self, func, *args):
+        """ Queue a change to be written to the storage.
+
+            Must be called with the model lock acquired.
+
+            Returns the _PendingWrite of the change.
+
+            func - method that writes the change
+            args - arguments of the method
+        """
+        write = _PendingWrite(func, args)
+        self._writes.put(write)
+
+        return write
+
+    def _reload_model(self):
+        """ Replace the model with the one in the storage, discarding the
+            changes that could not be written.
+
+            Nothing is done while there are changes waiting to be written,
+            as they are already applied to the model.
+        """
+        with self._model_lock:
+            if self._writes.qsize():
+                return
+
+            try:
+                self._model = self._load_model(self._model.version + 1)
+                self._dirty = False
+
+            except Exception as e:
+                scoutlog.exception('failed to reload the zone book')
+
+    def _write(self, write):
+        """ Write a change to the storage, retrying if it fails.
+
+            Returns whether the change was written.
+
+            write - _PendingWrite instance
+        """
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                write.func(*write.args)
+                return True
+
+            except Exception as e:
+                scoutlog.exception('error while writing to the zone book '
+                        '(attempt %d of %d)' % (attempt, WRITE_ATTEMPTS))
+
+            if attempt < WRITE_ATTEMPTS:
+                time.sleep(0.5 * attempt)
+
+        scoutlog.error('discarding change of the zone book, reloading it')
+
+        with self._model_lock:
+            self._failed += 1
+            self._dirty = True
+
+        return False
+
+    def _write_loop(self):
+        """ Write the queued changes to the storage in order. """
+        while True:
+            write = self._writes.get()
+
+            try:
+                write.ok = self._write(write)
+
+            finally:
+                write.done.set()
+                self._writes.task_done()
+
+            if self._dirty:
+                self._reload_model()
+
+
+class _PendingWrite(object):
+    """ Change waiting to be written to the zone book storage. """
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.ok = False
+        self.done = threading.Event()
+
+    def wait(self):
+        """ Wait until the change is written and return whether it was. """
+        self.done.wait()
+        return self.ok
+
+
+class _ZoneModel(object):
+    """ Immutable snapshot of the outposts, agents and their locations.
+
+        Changes create a new snapshot, so readers never see a partially
+        updated model.
+    """
+
+    def __init__(self, agents, outposts, version):
+        """ Build the snapshot and its indexes.
+
+            agents   - dict with the AgentState of each agent
+            outposts - dict with the OutpostState of each outpost
+            version  - number of the snapshot
+        """
+        self.agents = agents
+        self.outposts = outposts
+        self.version = version
+
+        locations = collections.defaultdict(set)
+
+        for agent in agents.values():
+            locations[agent.location].add(agent.name)
+
+        # Names of the agents in each outpost
+        self.locations = {o: frozenset(a) for o, a in locations.items()}
+
+        # Names of the running outposts
+        self.running = frozenset(
+                o.name for o in outposts.values() if o.is_running)
+
+    def replace(self, agents=None, outposts=None):
+        """ Obtain a new snapshot with different agents or outposts.
+
+            agents   - new dict of agents (None to keep the current one)
+            outposts - new dict of outposts (None to keep the current one)
+        """
+        return _ZoneModel(
+                self.agents if agents is None else agents,
+                self.outposts if outposts is None else outposts,
+                self.version + 1)
+
+
+def _average(total, count):
+    """ Average of a sum of values (None if there are no values).
+
+        total - sum of the values
+        count - number of values
+    """
+    return total / count if count else None
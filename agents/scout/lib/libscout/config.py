@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cached configuration snapshots."""
+
+import collections.abc
+import configparser
+import os
+import re
+import threading
+import types
+
+from libscout import get_logger
+
+# Logging
+scoutlog = get_logger('libscout.config')
+
+
+class ConfigCache(object):
+    """ Cache of parsed configuration files.
+
+        A file is only parsed again when its modification time or size
+        change. The cached objects are immutable snapshots, so they can be
+        shared between threads without locking.
+    """
+
+    def __init__(self):
+        """ Initialize the cache. """
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, snapshot_cls):
+        """ Obtain the snapshot of a file.
+
+            path         - path to the file
+            snapshot_cls - class used to build the snapshot, must implement
+                           the `from_file(path)` class method
+        """
+        stamp = self._stamp(path)
+
+        with self._lock:
+            entry = self._entries.get((path, snapshot_cls))
+
+            if entry and entry[0] == stamp:
+                return entry[1]
+
+        scoutlog.debug('parsing configuration file %s' % path)
+
+        # The file is stat'ed before being read, a change during the read
+        # will be detected the next time
+        snapshot = snapshot_cls.from_file(path)
+
+        with self._lock:
+            self._entries[(path, snapshot_cls)] = (stamp, snapshot)
+
+        return snapshot
+
+    def invalidate(self, path=None):
+        """ Discard cached snapshots.
+
+            Used after writing a file, in case the filesystem does not have
+            enough resolution to notice the change.
+
+            path - path of the file to discard, or None to discard all
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+
+            for key in [k for k in self._entries if k[0] == path]:
+                del self._entries[key]
+
+    def _stamp(self, path):
+        """ Obtain the modification time and size of a file.
+
+            path - path to the file
+        """
+        try:
+            st = os.stat(path)
+
+        except OSError:
+            # Missing file is also a valid (empty) state
+            return None
+
+        return st.st_mtime_ns, st.st_size
+
+
+class _IniSnapshot(object):
+    """ Base class for snapshots of INI files. """
+
+    @classmethod
+    def from_file(cls, path):
+        """ Parse an INI file and build the snapshot.
+
+            path - path to the file
+        """
+        conf = configparser.ConfigParser()
+        conf.read(path)
+
+        return cls(conf)
+
+    @staticmethod
+    def _freeze(section):
+        """ Return a read-only copy of a ConfigParser section.
+
+            section - ConfigParser section (or None)
+        """
+        return types.MappingProxyType(dict(section) if section else {})
+
+    @staticmethod
+    def _to_bool(value, default):
+        """ Convert a configuration value to boolean.
+
+            value   - string value (or None)
+            default - value returned when there is no valid value
+        """
+        if value is None:
+            return default
+
+        return configparser.ConfigParser.BOOLEAN_STATES.get(
+                value.lower(), default)
+
+    @staticmethod
+    def _to_type(value, cast, default):
+        """ Convert a configuration value to the given type.
+
+            value   - string value (or None)
+            cast    - type to convert to (int, float...)
+            default - value returned when there is no valid value
+        """
+        if value is None or value == '':
+            return default
+
+        try:
+            return cast(value)
+
+        except ValueError:
+            return default
+
+
+class OutpostRecord(collections.abc.Mapping):
+    """ Read-only information of an outpost from the outpost list.
+
+        Behaves as the original ConfigParser section, so it can be passed
+        to the functions that expect one.
+    """
+
+    def __init__(self, name, section):
+        """ Store the information.
+
+            name    - name of the outpost
+            section - ConfigParser section of the outpost
+        """
+        self._name = name
+        self._data = _IniSnapshot._freeze(section)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def host(self):
+        return self._data['host']
+
+    @property
+    def username(self):
+        return self._data.get('username') or None
+
+    @property
+    def directory(self):
+        return self._data['directory']
+
+    @property
+    def remote_port(self):
+        return _IniSnapshot._to_type(self._data.get('remote_port'), int, -1)
+
+    @property
+    def local_tunnel(self):
+        return _IniSnapshot._to_type(self._data.get('local_tunnel'), int, -1)
+
+    @property
+    def remote_tunnel(self):
+        return _IniSnapshot._to_type(self._data.get('remote_tunnel'), int, -1)
+
+    @property
+    def mips(self):
+        return _IniSnapshot._to_type(self._data.get('mips'), float, -1)
+
+    @property
+    def priority(self):
+        return _IniSnapshot._to_type(self._data.get('priority'), int, -1)
+
+
+class OutpostList(_IniSnapshot, collections.abc.Mapping):
+    """ Snapshot of the outpost list (etc/scout/outpost.list).
+
+        Maps outpost names (without the 'outpost ' prefix) to OutpostRecord
+        instances, keeping the order of the file.
+    """
+
+    def __init__(self, conf):
+        """ Build the snapshot.
+
+            conf - ConfigParser instance
+        """
+        records = collections.OrderedDict()
+
+        for section in filter(
+            (lambda o: o.startswith('outpost ')), conf.sections()):
+
+            # Mind the blank space
+            name = section.replace('outpost ', '', 1)
+            records[name] = OutpostRecord(name, conf[section])
+
+        self._records = records
+
+    def __getitem__(self, name):
+        return self._records[name]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def names(self):
+        """ Return a list with the names of the outposts. """
+        return list(self._records.keys())
+
+
+class ScoutSettings(_IniSnapshot):
+    """ Snapshot of the scout configuration (etc/scout/scout.conf). """
+
+    def __init__(self, conf):
+        """ Build the snapshot.
+
+            conf - ConfigParser instance
+        """
+        self._sections = types.MappingProxyType(
+                {name: self._freeze(conf[name]) for name in conf.sections()})
+
+        agents = self.section('agents')
+
+        self._hold = tuple(a for a in agents.get('hold', '').split(' ') if a)
+        self._free = tuple(a for a in agents.get('free', '').split(' ') if a)
+
+        self._hold_set = frozenset(self._hold)
+        self._free_set = frozenset(self._free)
+
+    @property
+    def general(self):
+        """ Raw values of the `general` section. """
+        return self.section('general')
+
+    @property
+    def balance(self):
+        """ Name of the balancing algorithm (None if disabled). """
+        return self.general.get('balance') or None
+
+    @property
+    def perf_path(self):
+        return self.general.get('perf_path')
+
+    @property
+    def mips(self):
+        return self.get_float('mips', -1)
+
+    @property
+    def priority(self):
+        return self.get_int('priority', -1)
+
+    @property
+    def hold(self):
+        """ Set of agents held in their current location. """
+        return self._hold_set
+
+    @property
+    def free(self):
+        """ Set of agents that can be moved by the balancer. """
+        return self._free_set
+
+    def balancer_options(self, name):
+        """ Return the options of a balancing algorithm, found in the
+            `balancer NAME` section.
+
+            name - name of the algorithm
+        """
+        return self.section('balancer %s' % name)
+
+    def can_migrate(self, agent):
+        """ Check whether an agent is registered for migration.
+
+            agent - agent name
+        """
+        return agent in self._hold_set or agent in self._free_set
+
+    def history_retention(self):
+        """ Return the seconds of resource history kept for raw samples
+            (key 0) and each rollup resolution, configured in days in the
+            `history` section.
+        """
+        return {
+            0: self.get_float('raw_days', 2.0, 'history') * 86400,
+            60: self.get_float('minute_days', 14.0, 'history') * 86400,
+            3600: self.get_float('hour_days', 180.0, 'history') * 86400,
+            86400: self.get_float('day_days', 1825.0, 'history') * 86400
+        }
+
+    def is_free(self, agent):
+        """ Check whether an agent can be moved automatically.
+
+            agent - agent name
+        """
+        return agent in self._free_set
+
+    def is_held(self, agent):
+        """ Check whether an agent is held in its current location.
+
+            agent - agent name
+        """
+        return agent in self._hold_set
+
+    def section(self, name):
+        """ Return the read-only values of a section (empty if missing).
+
+            name - name of the section
+        """
+        return self._sections.get(name, types.MappingProxyType({}))
+
+    def get_bool(self, key, default=None, section='general'):
+        """ Obtain a boolean value.
+
+            key     - option name
+            default - value returned if the option is missing or invalid
+            section - section in which the option is found
+        """
+        return self._to_bool(self.section(section).get(key), default)
+
+    def get_float(self, key, default=None, section='general'):
+        """ Obtain a float value.
+
+            key     - option name
+            default - value returned if the option is missing or invalid
+            section - section in which the option is found
+        """
+        return self._to_type(self.section(section).get(key), float, default)
+
+    def get_int(self, key, default=None, section='general'):
+        """ Obtain an integer value.
+
+            key     - option name
+            default - value returned if the option is missing or invalid
+            section - section in which the option is found
+        """
+        return self._to_type(self.section(section).get(key), int, default)
+
+
+class UserList(object):
+    """ Snapshot of the users file (etc/zoe-users.conf).
+
+        Keeps the raw contents, which are sent to the outposts, and the
+        members of the admins group.
+    """
+
+    def __init__(self, raw, admins):
+        """ Build the snapshot.
+
+            raw    - contents of the file (None if it could not be read)
+            admins - iterable with the unique IDs of the admins
+        """
+        self._raw = raw
+        self._admins = frozenset(admins)
+
+    @classmethod
+    def from_file(cls, path):
+        """ Read the users file.
+
+            The admins are the `members` of the `group admins` section, read
+            from the same contents that are sent to the outposts. A missing
+            or invalid file has no admins.
+
+            path - path to the file
+        """
+        try:
+            with open(path, 'r') as f:
+                raw = f.read()
+
+        except OSError as e:
+            scoutlog.error('could not read users file %s: %s' % (path, e))
+            return cls(None, [])
+
+        conf = configparser.ConfigParser()
+
+        try:
+            conf.read_string(raw, path)
+            members = conf['group admins']['members']
+
+        except configparser.Error as e:
+            scoutlog.error('could not parse users file %s: %s' % (path, e))
+            return cls(raw, [])
+
+        except KeyError:
+            scoutlog.warning('no admins group found in %s' % path)
+            return cls(raw, [])
+
+        return cls(raw, [m for m in re.split(r'[\s,]+', members) if m])
+
+    @property
+    def raw(self):
+        """ Contents of the file (None if it could not be read). """
+        return self._raw
+
+    @property
+    def admins(self):
+        """ Set of users in the admins group. """
+        return self._admins
+
+    def is_admin(self, user):
+        """ Check whether a user belongs to the admins group.
+
+            user - unique ID of the user
+        """
+        return user in self._admins
+
+
+class ZoeSettings(_IniSnapshot):
+    """ Snapshot of the main Zoe configuration (etc/zoe.conf). """
+
+    def __init__(self, conf):
+        """ Build the snapshot.
+
+            conf - ConfigParser instance
+        """
+        ports = {}
+
+        for section in filter(
+            (lambda a: a.startswith('agent ')), conf.sections()):
+
+            ports[section.replace('agent ', '', 1)] = conf[section].get('port')
+
+        self._ports = types.MappingProxyType(ports)
+
+    def agent_port(self, agent):
+        """ Obtain the port assigned to an agent (None if unknown).
+
+            agent - agent name
+        """
+        return self._ports.get(agent)
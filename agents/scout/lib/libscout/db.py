@@ -48,8 +48,18 @@ class AgentMessage(BookModel):
     agent = peewee.CharField(max_length=128, null=False)
     message = peewee.TextField()
 
+    # Insertion order (unlike row IDs, never reused after deletions)
+    seq = peewee.IntegerField(default=0)
+
+    # Time at which the message was stored
+    timestamp = peewee.FloatField(default=time.time)
+
     class Meta:
         db_table = 'agent_messages'
+        indexes = (
+            (('agent', 'seq'), False),
+            (('timestamp',), False),
+        )
 
 
 # Zone book
@@ -80,6 +90,10 @@ class AgentZone(ZoneModel):
     # MIPS
     mips = peewee.FloatField(default=0.0)
 
+    # Resident memory (bytes) and received messages (bytes per second)
+    memory = peewee.FloatField(default=0.0)
+    bandwidth = peewee.FloatField(default=0.0)
+
     # Current location
     location = peewee.ForeignKeyField(OutpostZone, related_name='agents')
 
@@ -88,3 +102,92 @@ class AgentZone(ZoneModel):
 
     class Meta:
         db_table = 'agents'
+
+
+class AgentTraffic(ZoneModel):
+    """ Used for storing the messages exchanged between agents. """
+    # Sender and receiver of the messages
+    src = peewee.CharField(max_length=128, null=False)
+    dst = peewee.CharField(max_length=128, null=False, index=True)
+
+    # Messages per second
+    rate = peewee.FloatField(default=0.0)
+
+    # Last update
+    timestamp = peewee.DateTimeField(default=time.time)
+
+    class Meta:
+        db_table = 'traffic'
+        indexes = ((('src', 'dst'), True),)
+
+
+class MigrationHistory(ZoneModel):
+    """ Used for storing the duration of completed migrations. """
+    agent = peewee.CharField(max_length=128, null=False, index=True)
+
+    origin = peewee.CharField(max_length=128)
+    destination = peewee.CharField(max_length=128)
+
+    # Bytes of static and dynamic files moved
+    size = peewee.BigIntegerField(default=0)
+
+    # Seconds the agent was not running and seconds spent copying files
+    downtime = peewee.FloatField(default=0.0)
+    transfer = peewee.FloatField(default=0.0)
+
+    # Serialized duration of each phase
+    phases = peewee.TextField(default='')
+
+    # When the migration finished
+    timestamp = peewee.DateTimeField(default=time.time)
+
+    class Meta:
+        db_table = 'migrations'
+
+
+class ResourceSample(ZoneModel):
+    """ Used for storing every resource sample of the agents. """
+    agent = peewee.CharField(max_length=128, null=False)
+    timestamp = peewee.FloatField(null=False)
+
+    mips = peewee.FloatField(default=0.0)
+
+    # NULL when the outpost did not measure them
+    memory = peewee.FloatField(null=True)
+    bandwidth = peewee.FloatField(null=True)
+
+    class Meta:
+        db_table = 'samples'
+        indexes = (
+            (('agent', 'timestamp'), False),
+            (('timestamp',), False),
+        )
+
+
+class ResourceRollup(ZoneModel):
+    """ Used for storing aggregated resource samples of the agents. """
+    agent = peewee.CharField(max_length=128, null=False)
+
+    # Seconds covered by each bucket (60, 3600 or 86400)
+    resolution = peewee.IntegerField(null=False)
+
+    # Start of the bucket
+    bucket = peewee.IntegerField(null=False)
+
+    # Number of samples, sums (for averages) and maximum MIPS
+    samples = peewee.IntegerField(default=0)
+    mips_sum = peewee.FloatField(default=0.0)
+    mips_max = peewee.FloatField(default=0.0)
+    memory_sum = peewee.FloatField(default=0.0)
+    bandwidth_sum = peewee.FloatField(default=0.0)
+
+    # Number of samples with memory and bandwidth measurements
+    memory_samples = peewee.IntegerField(default=0)
+    bandwidth_samples = peewee.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'rollups'
+        indexes = (
+            (('agent', 'resolution', 'bucket'), True),
+            (('resolution', 'bucket'), False),
+        )
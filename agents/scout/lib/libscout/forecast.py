@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Demand forecasting from resource history."""
+
+import collections
+import math
+import threading
+import time
+
+from libscout import get_logger
+
+# Logging
+scoutlog = get_logger('libscout.forecast')
+
+# Seconds in a day, used for daily seasonality
+DAY = 86400
+
+
+class Forecaster(object):
+    """ Keeps the MIPS history of each agent and predicts its demand.
+
+        The prediction is configured in the `forecast` section of scout.conf:
+
+            method        - `last` (latest sample), `ewma` or `percentile`
+                            (default ewma)
+            alpha         - smoothing factor of the EWMA (default 0.3)
+            beta          - smoothing factor of the trend, 0 disables trend
+                            detection (default 0)
+            percentile    - percentile used by the `percentile` method
+                            (default 90)
+            window        - seconds of history used by the `ewma` and
+                            `percentile` methods (default 3600)
+            horizon       - seconds ahead to predict (default 600)
+            seasonality   - adjust the prediction with the average demand
+                            at the same time of the day (default false)
+            season_bucket - seconds of each time of the day bucket
+                            (default 3600)
+            history_days  - days of history kept (default 7)
+    """
+
+    def __init__(self):
+        """ Initialize the history. """
+        self._history = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+
+    def add_sample(self, agent, value, timestamp=None, history_days=7):
+        """ Store a new sample for an agent.
+
+            agent        - agent name
+            value        - MIPS of the agent
+            timestamp    - time of the sample (defaults to now)
+            history_days - days of history kept for the agent
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        oldest = timestamp - history_days * DAY
+
+        with self._lock:
+            history = self._history[agent]
+            history.append((timestamp, float(value)))
+
+            while history and history[0][0] < oldest:
+                history.popleft()
+
+    def forget(self, agent):
+        """ Remove the history of an agent.
+
+            agent - agent name
+        """
+        with self._lock:
+            self._history.pop(agent, None)
+
+    def predict(self, agent, conf, default=None, now=None):
+        """ Predict the demand of an agent.
+
+            Returns `default` if there is no history for the agent.
+
+            agent   - agent name
+            conf    - ScoutSettings snapshot of the scout configuration
+            default - value returned when there is no history
+            now     - current time (defaults to now)
+        """
+        now = time.time() if now is None else now
+
+        method = conf.section('forecast').get('method', 'ewma')
+        horizon = conf.get_float('horizon', 600.0, 'forecast')
+        window = conf.get_float('window', 3600.0, 'forecast')
+        seasonality = conf.get_bool('seasonality', False, 'forecast')
+
+        # Only the samples in the window are copied, the seasonal index is
+        # computed on the whole history while holding the lock
+        with self._lock:
+            history = self._history.get(agent)
+
+            if not history:
+                return default
+
+            recent = _window(history, now - window) or [history[-1]]
+            index = _seasonal_index(history, now + horizon,
+                    conf.get_float('season_bucket', 3600.0, 'forecast')) \
+                    if seasonality else 1.0
+
+        if method == 'last':
+            value = recent[-1][1]
+
+        elif method == 'percentile':
+            value = _percentile([s[1] for s in recent],
+                    conf.get_float('percentile', 90.0, 'forecast'))
+
+        else:
+            if method != 'ewma':
+                scoutlog.warning('unknown forecast method "%s", using ewma' %
+                        method)
+
+            value = _ewma(recent,
+                    conf.get_float('alpha', 0.3, 'forecast'),
+                    conf.get_float('beta', 0.0, 'forecast'),
+                    horizon)
+
+        return max(value * index, 0.0)
+
+
+def _ewma(samples, alpha, beta, horizon):
+    """ Exponentially weighted moving average of the samples.
+
+        When `beta` is greater than 0, the trend is also smoothed (Holt's
+        method) and extrapolated `horizon` seconds.
+
+        samples - list of (timestamp, value) tuples in chronological order
+        alpha   - smoothing factor of the level
+        beta    - smoothing factor of the trend
+        horizon - seconds ahead to predict
+    """
+    level = samples[0][1]
+    trend = 0.0
+
+    for _, value in samples[1:]:
+        previous = level
+        level = alpha * value + (1 - alpha) * (level + trend)
+
+        if beta > 0:
+            trend = beta * (level - previous) + (1 - beta) * trend
+
+    if beta <= 0 or len(samples) < 2:
+        return level
+
+    # Trend is per sample, convert the horizon to samples
+    step = (samples[-1][0] - samples[0][0]) / (len(samples) - 1)
+
+    if step <= 0:
+        return level
+
+    return level + trend * horizon / step
+
+def _percentile(values, percentile):
+    """ Obtain a percentile of the values (nearest rank).
+
+        values     - list of values
+        percentile - percentile between 0 and 100
+    """
+    ordered = sorted(values)
+    rank = int(math.ceil(percentile / 100.0 * len(ordered)))
+
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+def _seasonal_index(history, target, bucket):
+    """ Ratio between the average demand at the time of the day of `target`
+        and the overall average demand.
+
+        Returns 1 if the time of the day has not been observed in at least
+        two different days.
+
+        history - deque of (timestamp, value) tuples
+        target  - time for which the index is computed
+        bucket  - seconds of each time of the day bucket
+    """
+    target_bucket = int((target % DAY) // bucket)
+
+    values = []
+    days = set()
+
+    for timestamp, value in history:
+        if int((timestamp % DAY) // bucket) == target_bucket:
+            values.append(value)
+            days.add(int(timestamp // DAY))
+
+    overall = sum(v for _, v in history) / len(history)
+
+    if len(days) < 2 or overall <= 0:
+        return 1.0
+
+    return (sum(values) / len(values)) / overall
+
+def _window(history, start):
+    """ Obtain the samples of the history taken since the given time.
+
+        history - deque of (timestamp, value) tuples in chronological order
+        start   - time of the oldest sample returned
+    """
+    recent = []
+
+    for sample in reversed(history):
+        if sample[0] < start:
+            break
+
+        recent.append(sample)
+
+    recent.reverse()
+
+    return recent
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Durable journal of agent migrations."""
+
+import json
+import os
+import threading
+import time
+
+from libscout import get_logger
+
+# Logging
+scoutlog = get_logger('libscout.journal')
+
+# Phases before the agent is told to terminate, so an interrupted migration
+# is just cancelled (the agent is still running in its origin)
+CANCEL_PHASES = (None, 'travel')
+
+# Phases after which the files of the agent have not been modified in its
+# origin, so an interrupted migration is rolled back
+ROLLBACK_PHASES = ('terminate',)
+
+# Phases of a migration in its destination
+DESTINATION_PHASES = ('premig', 'transfer', 'postmig', 'add', 'launch')
+
+# Number of finished migrations after which the journal is compacted
+COMPACT_AFTER = 100
+
+
+class MigrationJournal(object):
+    """ Records the phases of every migration in a file, one JSON record per
+        line, before each phase is started.
+
+        Migrations that were not finished when the journal was opened (the
+        scout stopped in the middle of them) or that failed are kept as
+        interrupted, to be resumed or rolled back. Finished migrations are
+        discarded from the file every time it is opened and every
+        COMPACT_AFTER finished migrations.
+    """
+
+    def __init__(self, path):
+        """ Load the journal.
+
+            path - path to the journal file
+        """
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+        # Entries of the unfinished migrations by id, and of the interrupted
+        # ones by agent
+        self._entries = {}
+        self._interrupted = {}
+
+        # Migrations finished since the journal was last compacted
+        self._finished = 0
+
+        entries = self._load()
+        self._rewrite(entries)
+
+        self._entries = dict((entry.id, entry) for entry in entries)
+
+        for entry in entries:
+            self.interrupt(entry)
+
+        if entries:
+            scoutlog.warning('found %d interrupted migrations' % len(entries))
+
+    def begin(self, agent, origin, destination, timer=None):
+        """ Start recording a migration.
+
+            Returns the MigrationEntry of the migration.
+
+            agent       - agent name
+            origin      - current location of the agent
+            destination - new location of the agent
+            timer       - PhaseTimer that measures the phases (if any)
+        """
+        with self._lock:
+            entry = MigrationEntry(self, self._next_id, agent, origin,
+                    destination, timer)
+            self._next_id += 1
+
+            self._append({'id': entry.id, 'agent': agent, 'origin': origin,
+                'destination': destination, 'time': time.time()})
+            self._entries[entry.id] = entry
+
+        return entry
+
+    def interrupt(self, entry):
+        """ Mark a migration as interrupted, to be recovered.
+
+            entry - MigrationEntry of the migration
+        """
+        entry.recovered = True
+
+        with self._lock:
+            self._interrupted[entry.agent] = entry
+
+    def interrupted(self):
+        """ Return the entries of the interrupted migrations that have not
+            been recovered yet.
+        """
+        with self._lock:
+            return list(self._interrupted.values())
+
+    def is_interrupted(self, agent):
+        """ Check whether an agent has an interrupted migration.
+
+            agent - agent name
+        """
+        return agent in self._interrupted
+
+    def write(self, record):
+        """ Write a record durably and apply it to its entry.
+
+            The journal is compacted once COMPACT_AFTER migrations have
+            finished since the last time.
+
+            record - JSON serializable dict with the `id` of the migration
+        """
+        with self._lock:
+            self._append(record)
+
+            entry = self._entries.get(record['id'])
+
+            if not entry:
+                return
+
+            if 'phase' in record:
+                entry.phases.append(record['phase'])
+
+            elif 'reroute' in record:
+                entry.destination = record['reroute']
+
+            elif 'result' in record:
+                del self._entries[entry.id]
+
+                if self._interrupted.get(entry.agent) is entry:
+                    del self._interrupted[entry.agent]
+
+                self._finished += 1
+
+                if self._finished >= COMPACT_AFTER:
+                    self._rewrite(sorted(self._entries.values(),
+                        key=lambda e: e.id))
+                    self._finished = 0
+
+    def _append(self, record):
+        """ Append a record to the journal file and sync it.
+
+            Must be called with the lock acquired.
+
+            record - JSON serializable dict with the `id` of the migration
+        """
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load(self):
+        """ Read the journal and return the entries of the unfinished
+            migrations.
+        """
+        entries = {}
+
+        if not os.path.isfile(self.path):
+            return []
+
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+
+                except ValueError:
+                    # Last record was not completely written
+                    scoutlog.warning('discarding incomplete record in %s' %
+                            self.path)
+                    break
+
+                self._next_id = max(self._next_id, record['id'] + 1)
+
+                if 'agent' in record:
+                    entries[record['id']] = MigrationEntry(self,
+                            record['id'], record['agent'], record['origin'],
+                            record['destination'])
+
+                entry = entries.get(record['id'])
+
+                if not entry:
+                    continue
+
+                if 'phase' in record:
+                    entry.phases.append(record['phase'])
+
+                elif 'reroute' in record:
+                    entry.destination = record['reroute']
+
+                elif 'result' in record:
+                    del entries[record['id']]
+
+        return sorted(entries.values(), key=lambda e: e.id)
+
+    def _rewrite(self, entries):
+        """ Replace the journal with the records of the given entries.
+
+            entries - list of MigrationEntry
+        """
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'w') as f:
+            for entry in entries:
+                for record in entry.records():
+                    f.write(json.dumps(record) + '\n')
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
+
+
+class MigrationEntry(object):
+    """ Migration recorded in the journal. """
+
+    def __init__(self, journal, entry_id, agent, origin, destination,
+            timer=None):
+        """ Initialize the entry.
+
+            journal     - MigrationJournal the entry belongs to
+            entry_id    - unique number of the migration
+            agent       - agent name
+            origin      - location of the agent before the migration
+            destination - new location of the agent
+            timer       - PhaseTimer that measures the phases (if any)
+        """
+        self.journal = journal
+        self.id = entry_id
+        self.agent = agent
+        self.origin = origin
+        self.destination = destination
+
+        # Phases started, in order
+        self.phases = []
+
+        # Whether the migration was interrupted, and phase from which it
+        # continues
+        self.recovered = False
+        self.resume_from = None
+
+        self.timer = timer
+
+    @property
+    def last_phase(self):
+        """ Last phase that was started (None if none). """
+        return self.phases[-1] if self.phases else None
+
+    def enter(self, phase):
+        """ Start a phase, recording it in the journal first.
+
+            When resuming an interrupted migration, phases before the one
+            that was interrupted are skipped and this returns False.
+
+            phase - name of the phase
+        """
+        if self.resume_from:
+            if phase != self.resume_from:
+                return False
+
+            self.resume_from = None
+
+        self.journal.write({'id': self.id, 'phase': phase})
+
+        if self.timer:
+            self.timer.start(phase)
+
+        return True
+
+    def finish(self, result):
+        """ Record the end of the migration.
+
+            result - short description of the outcome (e.g. `done`)
+        """
+        if self.timer:
+            self.timer.stop()
+
+        self.journal.write({'id': self.id, 'result': result})
+
+    def recovery_action(self):
+        """ Decide how to recover an interrupted migration.
+
+            Returns `cancel` if the agent was not terminated, `rollback` if
+            it can be launched again in its origin (its files were not
+            modified), `abort` if the migration was being aborted and
+            `resume` otherwise.
+        """
+        phase = self.last_phase
+
+        if phase in CANCEL_PHASES:
+            return 'cancel'
+
+        if phase in ROLLBACK_PHASES or (
+                phase == 'backup' and self.origin == 'central'):
+            return 'rollback'
+
+        if phase == 'abort':
+            return 'abort'
+
+        return 'resume'
+
+    def records(self):
+        """ Return the journal records that rebuild the entry. """
+        records = [{'id': self.id, 'agent': self.agent,
+            'origin': self.origin, 'destination': self.destination}]
+        records.extend({'id': self.id, 'phase': p} for p in self.phases)
+
+        return records
+
+    def reroute(self, destination):
+        """ Change the destination of a migration being resumed. The phases
+            in the destination (and the final move) are started again, while
+            pending phases in the origin are kept.
+
+            destination - new destination of the agent
+        """
+        self.journal.write({'id': self.id, 'reroute': destination})
+
+        if self.resume_from in DESTINATION_PHASES + ('move',):
+            self.resume_from = DESTINATION_PHASES[0]
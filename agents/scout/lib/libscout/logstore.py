@@ -0,0 +1,1068 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Append-only log storage engine of the agent and zone books.
+
+Each book is a directory with a snapshot of its whole state and a log with
+the changes made after the snapshot, one JSON record per line. The state is
+kept in memory (indexed by agent), so reads never touch the disk and every
+write is a single sequential append followed by an fsync.
+
+When the log grows larger than the snapshot, the state is compacted into a
+new snapshot and the log starts over, which keeps the cost of compacting
+proportional to the data written since the last time.
+
+Raw resource samples of the zone book are not part of the snapshot: on
+compaction, the samples written since the previous one are appended to
+segment files (one per day) and the snapshot records the size of every
+segment. Segments are only removed once all of their samples have expired.
+"""
+
+import bisect
+import collections
+import heapq
+import json
+import os
+import threading
+import time
+
+from libscout import get_logger
+from libscout.storage import AgentStorage, ZoneStorage, AgentState, \
+        OutpostState, ROLLUP_RESOLUTIONS
+
+# Logging
+scoutlog = get_logger('libscout.logstore')
+
+# Minimum size (bytes) of the log before compacting it
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+
+# Name of the snapshot file
+SNAPSHOT_FILE = 'snapshot.json'
+
+# Seconds of raw samples stored in each segment file
+SEGMENT_SECONDS = 86400
+
+# Fields of an agent in the order they are kept in memory
+AGENT_FIELDS = ('location', 'mips', 'memory', 'bandwidth', 'timestamp')
+
+
+class LogAgentStorage(AgentStorage):
+
+    def __init__(self, path, compact_bytes=COMPACT_MIN_BYTES):
+        """ Open the agent book log.
+
+            path          - directory of the log
+            compact_bytes - minimum size of the log before compacting it
+        """
+        self._lock = threading.Lock()
+
+        # Messages of each agent: {agent: {seq: (timestamp, message)}}
+        self._messages = collections.defaultdict(dict)
+        self._info = {}
+        self._seq = 0
+
+        self._log = _AppendLog(path, compact_bytes)
+
+        with self._lock:
+            state, records = self._log.open()
+
+            if state:
+                self._load_state(state)
+
+            for record in records:
+                self._apply(record)
+
+        scoutlog.info('loaded %d deferred messages from %s' % (
+            sum(len(m) for m in self._messages.values()), path))
+
+    def append_messages(self, rows, max_messages=None):
+        """ Store messages durably in a single transaction.
+
+            rows         - list of message dicts
+            max_messages - maximum number of messages stored per agent
+        """
+        self._write({'op': 'msg', 'rows': [[r['agent'], r['seq'],
+            r['timestamp'], r['message']] for r in rows],
+            'max': max_messages})
+
+    def close(self):
+        """ Close the log. """
+        with self._lock:
+            self._log.close()
+
+    def delete_info(self, agent):
+        """ Delete the information of an agent.
+
+            agent - agent name
+        """
+        return self._write({'op': 'delinfo', 'agent': agent}) > 0
+
+    def delete_messages(self, agent, upto=None):
+        """ Delete the messages of an agent.
+
+            agent - agent name
+            upto  - only delete messages up to this sequence number
+        """
+        return self._write({'op': 'del', 'agent': agent, 'upto': upto})
+
+    def export_data(self):
+        """ Return the information and messages of every agent. """
+        with self._lock:
+            messages = [{'agent': a, 'seq': s, 'timestamp': m[0],
+                'message': m[1]} for a, msgs in self._messages.items()
+                for s, m in msgs.items()]
+
+            return {
+                'info': dict(self._info),
+                'messages': sorted(messages, key=lambda m: m['seq'])
+            }
+
+    def get_info(self, agent):
+        """ Return the information of an agent.
+
+            agent - agent name
+        """
+        return self._info.get(agent)
+
+    def get_messages(self, agent, after=0, limit=None):
+        """ Return the messages of an agent in insertion order.
+
+            agent - agent name
+            after - only return messages after this sequence number
+            limit - maximum number of messages to return
+        """
+        with self._lock:
+            messages = self._messages.get(agent, {})
+
+            if limit:
+                seqs = heapq.nsmallest(limit,
+                        (s for s in messages if s > after))
+
+            else:
+                seqs = sorted(s for s in messages if s > after)
+
+            return [(s, messages[s][1]) for s in seqs]
+
+    def import_data(self, data):
+        """ Store the data obtained from another engine.
+
+            data - dict with `info` and `messages`
+        """
+        with self._lock:
+            self._info.update(data['info'])
+
+            for row in data['messages']:
+                self._messages[row['agent']][row['seq']] = (
+                        row['timestamp'], row['message'])
+                self._seq = max(self._seq, row['seq'])
+
+            self._log.compact(self._dump_state())
+
+    def max_seq(self):
+        """ Return the greatest sequence number stored. """
+        return self._seq
+
+    def purge_messages(self, before):
+        """ Delete messages stored before the given time.
+
+            before - seconds since epoch
+        """
+        return self._write({'op': 'purge', 'before': before})
+
+    def put_info(self, agent, info):
+        """ Store the information of an agent.
+
+            agent - agent name
+            info  - raw message with the information
+        """
+        return self._write({'op': 'info', 'agent': agent, 'info': info}) > 0
+
+    def _apply(self, record):
+        """ Apply a change to the in-memory state.
+
+            Returns the number of affected messages.
+
+            record - dict with the change
+        """
+        op = record['op']
+
+        if op == 'msg':
+            for agent, seq, timestamp, message in record['rows']:
+                self._messages[agent][seq] = (timestamp, message)
+                self._seq = max(self._seq, seq)
+
+            if record['max']:
+                for agent in set(r[0] for r in record['rows']):
+                    self._enforce_limit(agent, record['max'])
+
+            return len(record['rows'])
+
+        if op == 'del':
+            messages = self._messages.get(record['agent'], {})
+
+            if record['upto'] is None:
+                self._messages.pop(record['agent'], None)
+                return len(messages)
+
+            removed = [s for s in messages if s <= record['upto']]
+
+            for seq in removed:
+                del messages[seq]
+
+            return len(removed)
+
+        if op == 'purge':
+            removed = 0
+
+            for messages in self._messages.values():
+                expired = [s for s, m in messages.items()
+                    if m[0] < record['before']]
+
+                for seq in expired:
+                    del messages[seq]
+
+                removed += len(expired)
+
+            return removed
+
+        if op == 'info':
+            # Information is never overwritten
+            if record['agent'] in self._info:
+                return 0
+
+            self._info[record['agent']] = record['info']
+            return 1
+
+        if op == 'delinfo':
+            return int(self._info.pop(record['agent'], None) is not None)
+
+        return 0
+
+    def _dump_state(self):
+        """ Return the in-memory state as a JSON serializable dict. """
+        return {
+            'seq': self._seq,
+            'info': self._info,
+            'messages': [[a, s, m[0], m[1]]
+                for a, msgs in self._messages.items()
+                for s, m in sorted(msgs.items())]
+        }
+
+    def _enforce_limit(self, agent, max_messages):
+        """ Discard the oldest messages of an agent above the limit.
+
+            agent        - agent name
+            max_messages - maximum number of messages stored for the agent
+        """
+        messages = self._messages[agent]
+        excess = len(messages) - max_messages
+
+        if excess <= 0:
+            return
+
+        scoutlog.warning('discarding %d old messages of agent %s' % (
+            excess, agent))
+
+        for seq in heapq.nsmallest(excess, messages):
+            del messages[seq]
+
+    def _load_state(self, state):
+        """ Load the state stored in a snapshot.
+
+            state - dict obtained from `_dump_state()`
+        """
+        self._seq = state['seq']
+        self._info = state['info']
+
+        for agent, seq, timestamp, message in state['messages']:
+            self._messages[agent][seq] = (timestamp, message)
+
+    def _write(self, record):
+        """ Append a change to the log and apply it.
+
+            Returns the result of applying the change.
+
+            record - dict with the change
+        """
+        with self._lock:
+            self._log.append(record)
+            result = self._apply(record)
+
+            if self._log.needs_compaction():
+                self._log.compact(self._dump_state())
+
+            return result
+
+
+class LogZoneStorage(ZoneStorage):
+
+    def __init__(self, path, compact_bytes=COMPACT_MIN_BYTES):
+        """ Open the zone book log.
+
+            path          - directory of the log
+            compact_bytes - minimum size of the log before compacting it
+        """
+        self._lock = threading.Lock()
+
+        self._outposts = {}
+        self._agents = {}
+
+        # Messages per second: {(src, dst): rate}
+        self._traffic = {}
+
+        # Samples of each agent in chronological order:
+        # {agent: [[timestamp, mips, memory, bandwidth], ...]}
+        self._samples = collections.defaultdict(list)
+
+        # Buckets of each agent and resolution: {(agent, resolution):
+        # {bucket: [samples, mips_sum, mips_max, memory_sum, bandwidth_sum,
+        #           memory_samples, bandwidth_samples]}}
+        self._rollups = collections.defaultdict(dict)
+
+        self._migrations = []
+
+        # Samples not written to the segments yet (added since the last
+        # compaction) and time before which raw samples were purged
+        self._unsegmented = []
+        self._purged_before = None
+
+        self._log = _AppendLog(path, compact_bytes)
+        self._segments = _SampleSegments(path)
+
+        with self._lock:
+            state, records = self._log.open()
+
+            if state:
+                self._load_state(state)
+
+            # Only the part of the segments committed by the snapshot
+            for row in self._segments.open(
+                    state.get('segments', {}) if state else {}):
+                if self._purged_before is None or \
+                        row[1] >= self._purged_before:
+                    self._samples[row[0]].append(row[1:])
+
+            for samples in self._samples.values():
+                samples.sort()
+
+            for record in records:
+                self._apply(record)
+
+    def close(self):
+        """ Close the log. """
+        with self._lock:
+            self._log.close()
+
+    def count_samples(self, agent, start, end):
+        """ Return the number of samples of an agent in a time range.
+
+            agent - agent name
+            start - start of the range
+            end   - end of the range
+        """
+        with self._lock:
+            first, last = self._sample_range(agent, start, end)
+            return last - first
+
+    def export_data(self):
+        """ Return every record of the zone book. """
+        with self._lock:
+            outposts, agents = self._states()
+
+            return {
+                'outposts': outposts,
+                'agents': agents,
+                'traffic': [(s, d, r) for (s, d), r in self._traffic.items()],
+                'samples': [dict(_sample_dict(s), agent=a)
+                    for a, samples in self._samples.items()
+                    for s in samples],
+                'rollups': [dict(_rollup_dict(b, r), agent=a, resolution=res)
+                    for (a, res), buckets in self._rollups.items()
+                    for b, r in buckets.items()],
+                'migrations': list(self._migrations)
+            }
+
+    def get_migration_stats(self, agent=None):
+        """ Obtain average timings of past migrations.
+
+            agent - only take into account migrations of this agent
+        """
+        with self._lock:
+            rows = [m for m in self._migrations
+                if not agent or m['agent'] == agent]
+
+        stats = {
+            'count': len(rows),
+            'downtime': 0.0,
+            'transfer': 0.0,
+            'throughput': None
+        }
+
+        if not rows:
+            return stats
+
+        total_transfer = sum(r['transfer'] for r in rows)
+
+        stats['downtime'] = sum(r['downtime'] for r in rows) / len(rows)
+        stats['transfer'] = total_transfer / len(rows)
+
+        if total_transfer:
+            stats['throughput'] = sum(r['size'] for r in rows) / total_transfer
+
+        return stats
+
+    def get_rollups(self, agent, resolution, start, end):
+        """ Return the rollups of an agent with buckets in a time range.
+
+            agent      - agent name
+            resolution - seconds of each bucket
+            start      - start of the range
+            end        - end of the range
+        """
+        with self._lock:
+            buckets = self._rollups.get((agent, resolution), {})
+
+            return [_rollup_dict(b, buckets[b]) for b in sorted(buckets)
+                if start <= b <= end]
+
+    def get_samples(self, agent, start, end):
+        """ Return the samples of an agent in a time range.
+
+            agent - agent name
+            start - start of the range
+            end   - end of the range
+        """
+        with self._lock:
+            first, last = self._sample_range(agent, start, end)
+
+            return [_sample_dict(s)
+                for s in self._samples[agent][first:last]]
+
+    def get_traffic_matrix(self):
+        """ Return the messages per second exchanged between agents. """
+        with self._lock:
+            return dict(self._traffic)
+
+    def import_data(self, data):
+        """ Store the data obtained from another engine.
+
+            data - dict with the iterables of each kind of data
+        """
+        with self._lock:
+            for outpost in data['outposts']:
+                self._outposts[outpost.name] = list(outpost[1:])
+
+            for agent in data['agents']:
+                self._agents[agent.name] = list(agent[1:])
+
+            for src, dst, rate in data['traffic']:
+                self._traffic[(src, dst)] = rate
+
+            for sample in data['samples']:
+                row = _sample_list(sample)
+
+                self._insert_sample(row)
+                self._unsegmented.append(row)
+
+            for rollup in data['rollups']:
+                self._rollups[(rollup['agent'], rollup['resolution'])][
+                    rollup['bucket']] = [rollup['samples'],
+                        rollup['mips_sum'], rollup['mips_max'],
+                        rollup['memory_sum'], rollup['bandwidth_sum'],
+                        rollup.get('memory_samples', rollup['samples']),
+                        rollup.get('bandwidth_samples', rollup['samples'])]
+
+            self._migrations.extend(dict(m) for m in data['migrations'])
+
+            self._compact()
+
+    def load(self):
+        """ Return the outposts and agents stored. """
+        with self._lock:
+            return self._states()
+
+    def oldest_rollup(self, agent, resolution):
+        """ Return the start of the oldest bucket of an agent.
+
+            agent      - agent name
+            resolution - seconds of each bucket
+        """
+        with self._lock:
+            return min(self._rollups.get((agent, resolution)) or [None])
+
+    def oldest_sample(self, agent):
+        """ Return the time of the oldest sample of an agent.
+
+            agent - agent name
+        """
+        with self._lock:
+            samples = self._samples.get(agent)
+            return samples[0][0] if samples else None
+
+    def purge_resources(self, before):
+        """ Delete samples and rollups older than the given times.
+
+            before - dict with the time before which raw samples (key 0)
+                     and the rollups of each resolution are deleted
+        """
+        return self._write({'op': 'purge',
+            'before': [[k, v] for k, v in before.items()]})
+
+    def write_location(self, name, location):
+        """ Change the location of an agent.
+
+            name     - agent name
+            location - outpost name
+        """
+        self._write({'op': 'location', 'name': name, 'location': location})
+
+    def write_migration(self, row):
+        """ Store a completed migration.
+
+            row - dict with the fields of the migration
+        """
+        self._write({'op': 'migration', 'row': row})
+
+    def write_refresh(self, outposts, agents, removed):
+        """ Add outposts and agents (in central) and remove agents in a
+            single transaction.
+
+            outposts - names of the outposts to add
+            agents   - names of the agents to add
+            removed  - names of the agents to remove
+        """
+        self._write({'op': 'refresh', 'outposts': outposts,
+            'agents': agents, 'removed': removed, 'time': time.time()})
+
+    def write_resources(self, samples, traffic):
+        """ Write the latest resources, history and traffic of the agents in
+            a single transaction.
+
+            samples - list of sample dicts
+            traffic - dict with the messages per second received by each
+                      agent from each sender
+        """
+        self._write({'op': 'resources', 'samples': samples,
+            'traffic': traffic})
+
+    def write_running(self, name, value):
+        """ Change the running status of an outpost.
+
+            name  - outpost name
+            value - whether the outpost is running
+        """
+        self._write({'op': 'running', 'name': name, 'value': value})
+
+    def _add_to_rollups(self, agent, sample):
+        """ Aggregate a sample in the rollups of every resolution.
+
+            agent  - agent name
+            sample - [timestamp, mips, memory, bandwidth] list
+        """
+        timestamp, mips, memory, bandwidth = sample
+
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket = int(timestamp // resolution * resolution)
+            rollup = self._rollups[(agent, resolution)].setdefault(
+                    bucket, [0, 0.0, 0.0, 0.0, 0.0, 0, 0])
+
+            rollup[0] += 1
+            rollup[1] += mips
+            rollup[2] = max(rollup[2], mips)
+
+            # Missing resources are not aggregated
+            if memory is not None:
+                rollup[3] += memory
+                rollup[5] += 1
+
+            if bandwidth is not None:
+                rollup[4] += bandwidth
+                rollup[6] += 1
+
+    def _apply(self, record):
+        """ Apply a change to the in-memory state.
+
+            Returns the number of affected rows.
+
+            record - dict with the change
+        """
+        op = record['op']
+
+        if op == 'resources':
+            for sample in record['samples']:
+                agent = self._agents.get(sample['agent'])
+
+                # Latest values
+                if agent:
+                    for index, key in enumerate(AGENT_FIELDS):
+                        if key in sample:
+                            agent[index] = sample[key]
+
+                # History
+                row = _sample_list(sample)
+
+                self._insert_sample(row)
+                self._unsegmented.append(row)
+                self._add_to_rollups(sample['agent'], row[1:])
+
+            # Messages received from other agents
+            for dst, peers in record['traffic'].items():
+                for key in [k for k in self._traffic if k[1] == dst]:
+                    del self._traffic[key]
+
+                for src, rate in peers.items():
+                    self._traffic[(src, dst)] = rate
+
+            return len(record['samples'])
+
+        if op == 'location':
+            if record['name'] in self._agents:
+                self._agents[record['name']][0] = record['location']
+
+        elif op == 'running':
+            if record['name'] in self._outposts:
+                self._outposts[record['name']][0] = record['value']
+
+        elif op == 'refresh':
+            for name in record['outposts']:
+                self._outposts[name] = [False, record['time']]
+
+            for name in record['agents']:
+                self._agents[name] = ['central', 0.0, 0.0, 0.0,
+                    record['time']]
+
+            for name in record['removed']:
+                self._agents.pop(name, None)
+
+        elif op == 'migration':
+            self._migrations.append(record['row'])
+
+        elif op == 'purge':
+            return self._purge(dict(record['before']))
+
+        return 0
+
+    def _compact(self):
+        """ Write the pending samples to the segments, replace the snapshot
+            and remove the segments whose samples expired.
+        """
+        self._segments.append(self._unsegmented)
+        self._unsegmented = []
+
+        self._log.compact(self._dump_state())
+
+        if self._purged_before is not None:
+            self._segments.purge(self._purged_before)
+
+    def _dump_state(self):
+        """ Return the in-memory state (except raw samples, see
+            `_compact()`) as a JSON serializable dict.
+        """
+        return {
+            'outposts': self._outposts,
+            'agents': self._agents,
+            'traffic': [[s, d, r] for (s, d), r in self._traffic.items()],
+            'segments': self._segments.sizes(),
+            'samples_before': self._purged_before,
+            'rollups': [[a, res, buckets]
+                for (a, res), buckets in self._rollups.items()],
+            'migrations': self._migrations
+        }
+
+    def _insert_sample(self, row):
+        """ Add a sample to the history, keeping it in chronological order.
+
+            row - [agent, timestamp, mips, memory, bandwidth] list
+        """
+        samples = self._samples[row[0]]
+
+        if samples and samples[-1][0] > row[1]:
+            bisect.insort(samples, row[1:])
+
+        else:
+            samples.append(row[1:])
+
+    def _load_state(self, state):
+        """ Load the state stored in a snapshot.
+
+            state - dict obtained from `_dump_state()`
+        """
+        self._outposts = state['outposts']
+        self._agents = state['agents']
+        self._traffic = {(s, d): r for s, d, r in state['traffic']}
+        self._purged_before = state.get('samples_before')
+        self._migrations = state['migrations']
+
+        # Snapshots without segments, the samples are moved to segments in
+        # the next compaction
+        for agent, samples in state.get('samples', {}).items():
+            self._samples[agent].extend(samples)
+            self._unsegmented.extend([agent] + s for s in samples)
+
+        # JSON object keys are always strings. Rollups of previous versions
+        # aggregated missing resources as 0
+        for agent, resolution, buckets in state['rollups']:
+            self._rollups[(agent, resolution)] = {
+                int(b): r if len(r) > 5 else r + [r[0], r[0]]
+                for b, r in buckets.items()}
+
+    def _purge(self, before):
+        """ Delete samples and rollups older than the given times.
+
+            Returns the number of deleted samples and rollups.
+
+            before - dict with the time before which raw samples (key 0)
+                     and the rollups of each resolution are deleted
+        """
+        removed = 0
+
+        if 0 in before:
+            self._purged_before = max(self._purged_before or 0, before[0])
+
+            for agent in list(self._samples):
+                samples = self._samples[agent]
+                index = bisect.bisect_left(samples, [before[0]])
+
+                del samples[:index]
+                removed += index
+
+                if not samples:
+                    del self._samples[agent]
+
+        for (agent, resolution), buckets in list(self._rollups.items()):
+            if resolution not in before:
+                continue
+
+            expired = [b for b in buckets if b < before[resolution]]
+
+            for bucket in expired:
+                del buckets[bucket]
+
+            removed += len(expired)
+
+            if not buckets:
+                del self._rollups[(agent, resolution)]
+
+        return removed
+
+    def _sample_range(self, agent, start, end):
+        """ Return the indexes of the first sample of an agent in a time
+            range and of the one after the last.
+
+            agent - agent name
+            start - start of the range
+            end   - end of the range
+        """
+        samples = self._samples.get(agent, [])
+
+        return (bisect.bisect_left(samples, [start]),
+                bisect.bisect_left(samples, [end, float('inf')]))
+
+    def _states(self):
+        """ Return the lists of OutpostState and AgentState. """
+        return ([OutpostState(n, *o) for n, o in self._outposts.items()],
+                [AgentState(n, *a) for n, a in self._agents.items()])
+
+    def _write(self, record):
+        """ Append a change to the log and apply it.
+
+            Returns the result of applying the change.
+
+            record - dict with the change
+        """
+        with self._lock:
+            self._log.append(record)
+            result = self._apply(record)
+
+            if self._log.needs_compaction():
+                self._compact()
+
+            return result
+
+
+class _AppendLog(object):
+    """ Snapshot and log of changes of a book, stored in a directory.
+
+        Every compaction starts a new generation: the snapshot records the
+        generation whose log follows it, so a crash while compacting leaves
+        either the old snapshot and log or the new ones.
+    """
+
+    def __init__(self, path, compact_bytes):
+        """ Initialize the log.
+
+            path          - directory of the log
+            compact_bytes - minimum size of the log before compacting it
+        """
+        self.path = path
+        self.compact_bytes = compact_bytes
+
+        self._file = None
+        self._generation = 0
+        self._snapshot_bytes = 0
+
+    def append(self, record):
+        """ Write a record durably.
+
+            record - JSON serializable dict
+        """
+        self._file.write(json.dumps(record, separators=(',', ':'),
+            default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """ Close the log file. """
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def compact(self, state):
+        """ Replace the snapshot with the given state and start a new log.
+
+            state - JSON serializable state of the book
+        """
+        generation = self._generation + 1
+        snapshot = os.path.join(self.path, SNAPSHOT_FILE)
+
+        with open(snapshot + '.tmp', 'w') as f:
+            json.dump({'generation': generation, 'state': state}, f,
+                    separators=(',', ':'), default=str)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(snapshot + '.tmp', snapshot)
+        self._sync_dir()
+
+        scoutlog.debug('compacted %s' % self.path)
+
+        self.close()
+        self._remove_logs()
+
+        self._generation = generation
+        self._snapshot_bytes = os.path.getsize(snapshot)
+        self._file = open(self._log_path(generation), 'a')
+
+    def needs_compaction(self):
+        """ Check whether the log is larger than the snapshot (and the
+            minimum size).
+        """
+        return self._file.tell() > max(self.compact_bytes,
+                self._snapshot_bytes)
+
+    def open(self):
+        """ Read the snapshot and log and open the log for appending.
+
+            Returns a tuple with the state of the snapshot (None if there
+            is no snapshot) and the list of records in the log.
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        snapshot = os.path.join(self.path, SNAPSHOT_FILE)
+        state = None
+
+        if os.path.isfile(snapshot):
+            with open(snapshot, 'r') as f:
+                data = json.load(f)
+
+            self._generation = data['generation']
+            self._snapshot_bytes = os.path.getsize(snapshot)
+            state = data['state']
+
+        # Logs of previous generations (compaction interrupted)
+        self._remove_logs(keep=self._generation)
+
+        records = []
+        valid = 0
+        log_path = self._log_path(self._generation)
+
+        if os.path.isfile(log_path):
+            with open(log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line.decode('utf-8')))
+
+                    except ValueError:
+                        # Last record was not completely written
+                        scoutlog.warning('discarding incomplete record in %s'
+                                % log_path)
+                        break
+
+                    valid += len(line)
+
+            with open(log_path, 'r+b') as f:
+                f.truncate(valid)
+
+        self._file = open(log_path, 'a')
+
+        return state, records
+
+    def _log_path(self, generation):
+        """ Path to the log of a generation.
+
+            generation - number of the generation
+        """
+        return os.path.join(self.path, 'log.%d.jsonl' % generation)
+
+    def _remove_logs(self, keep=None):
+        """ Remove the logs of the directory.
+
+            keep - generation whose log is kept
+        """
+        kept = None if keep is None else os.path.basename(
+                self._log_path(keep))
+
+        for name in os.listdir(self.path):
+            if name.startswith('log.') and name != kept:
+                os.remove(os.path.join(self.path, name))
+
+    def _sync_dir(self):
+        """ Make the changes of the directory (renames) durable. """
+        fd = os.open(self.path, os.O_RDONLY)
+
+        try:
+            os.fsync(fd)
+
+        finally:
+            os.close(fd)
+
+
+class _SampleSegments(object):
+    """ Raw samples of the zone book stored in append-only files, one for
+        each `SEGMENT_SECONDS` of samples.
+
+        The segments are only appended to during a compaction, before the
+        new snapshot is written. The snapshot records their sizes, so data
+        appended by an interrupted compaction is discarded when opening.
+    """
+
+    def __init__(self, path):
+        """ Initialize the segments.
+
+            path - directory of the segments (the log directory)
+        """
+        self.path = path
+
+    def append(self, rows):
+        """ Write samples durably to their segments.
+
+            rows - list of [agent, timestamp, mips, memory, bandwidth] lists
+        """
+        segments = collections.defaultdict(list)
+
+        for row in rows:
+            segments[int(row[1] // SEGMENT_SECONDS * SEGMENT_SECONDS)].append(
+                    json.dumps(row, separators=(',', ':')) + '\n')
+
+        for start, lines in segments.items():
+            with open(self._segment_path(start), 'a') as f:
+                f.write(''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def open(self, sizes):
+        """ Read the committed samples of every segment and discard the
+            rest.
+
+            Returns the list of samples.
+
+            sizes - dict with the committed size of each segment file
+        """
+        os.makedirs(self.path, exist_ok=True)
+        rows = []
+
+        for name in sorted(self._names()):
+            segment = os.path.join(self.path, name)
+
+            if name not in sizes:
+                # Written by an interrupted compaction
+                os.remove(segment)
+                continue
+
+            with open(segment, 'r+b') as f:
+                f.truncate(sizes[name])
+                rows.extend(json.loads(line.decode('utf-8')) for line in f)
+
+        return rows
+
+    def purge(self, before):
+        """ Remove the segments whose samples are all older than the given
+            time.
+
+            before - seconds since epoch
+        """
+        for name in self._names():
+            if int(name.split('.')[1]) + SEGMENT_SECONDS <= before:
+                os.remove(os.path.join(self.path, name))
+
+    def sizes(self):
+        """ Return a dict with the size of each segment file. """
+        return {n: os.path.getsize(os.path.join(self.path, n))
+            for n in self._names()}
+
+    def _names(self):
+        """ Return the names of the segment files. """
+        return [n for n in os.listdir(self.path)
+            if n.startswith('samples.')]
+
+    def _segment_path(self, start):
+        """ Path to the segment of the samples starting at a given time.
+
+            start - start of the segment
+        """
+        return os.path.join(self.path, 'samples.%d.jsonl' % start)
+
+
+def _rollup_dict(bucket, rollup):
+    """ Build the dict of a rollup.
+
+        bucket - start of the bucket
+        rollup - [samples, mips_sum, mips_max, memory_sum, bandwidth_sum,
+                  memory_samples, bandwidth_samples]
+    """
+    return {
+        'bucket': bucket,
+        'samples': rollup[0],
+        'mips_sum': rollup[1],
+        'mips_max': rollup[2],
+        'memory_sum': rollup[3],
+        'bandwidth_sum': rollup[4],
+        'memory_samples': rollup[5],
+        'bandwidth_samples': rollup[6]
+    }
+
+def _sample_dict(sample):
+    """ Build the dict of a sample.
+
+        sample - [timestamp, mips, memory, bandwidth] list
+    """
+    return {
+        'timestamp': sample[0],
+        'mips': sample[1],
+        'memory': sample[2],
+        'bandwidth': sample[3]
+    }
+
+def _sample_list(sample):
+    """ Build the history row of a sample, with missing memory and bandwidth
+        as None.
+
+        sample - sample dict
+    """
+    return [sample['agent'], sample['timestamp'], sample.get('mips', 0.0),
+        sample.get('memory'), sample.get('bandwidth')]
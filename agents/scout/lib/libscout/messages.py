@@ -18,12 +18,24 @@
 
 """Message generation code."""
 
+import base64
+import collections
 import datetime
+import json
+import math
 import os
+import threading
 import zoe
-from libscout.static import \
-        ZONE_BOOK, SCOUT_CONF, ZOE_CONF, OUTPOST_LIST, RULES_DIR, ZOE_LAUNCHER
-from libscout.util import read_config
+from libscout.static import ZONE_BOOK
+from libscout.util import PAD_CHAR, \
+        load_outpost_list, load_scout_conf, load_zoe_conf
+
+# Reports kept for each set of arguments and zone book version
+REPORT_CACHE_SIZE = 32
+
+_report_cache = collections.OrderedDict()
+_report_lock = threading.Lock()
+
 
 def add_agent(outpost_id, agent):
     """ Add an agent to the remote outpost list.
@@ -32,8 +44,7 @@ def add_agent(outpost_id, agent):
         agent      - agent name
     """
     # Get port
-    main_conf = read_config(ZOE_CONF)
-    port = main_conf['agent '+ agent]['port']
+    port = load_zoe_conf().agent_port(agent)
 
     add = {
         'dst': outpost_id,
@@ -61,56 +72,103 @@ def clean_static(outpost_id, path_list):
 
     return zoe.MessageBuilder(remove).msg()
 
-def feedback_agent_locations(outpost_list):
+def feedback_agent_locations(outpost_list, outpost=None):
     """ Build feedback message with agent locations.
 
-        outpost_list - ConfigParser instance from outpost list
+        outpost_list - OutpostList snapshot of the outpost list
+        outpost      - only show the agents in this outpost
     """
-    msg = '# Agent locations\n\n'
-
     # Get list of outposts (+ central)
-    outposts = [s for s in outpost_list.sections() if s.startswith('outpost ')]
+    outposts = outpost_list.names()
     outposts.append('central')
 
-    for s in outposts:
+    if outpost:
+        outposts = [o for o in outposts if o == outpost]
 
-        # Mind the blank space
-        outpost = s.replace('outpost ', '', 1)
+    key = ('locations', ZONE_BOOK.version, tuple(outposts))
 
-        # Get agents in this outpost
-        msg += '%s\n' % outpost
-        msg += '---------\n'
+    return _cached(key, lambda: _agent_locations(outposts))
 
-        o_agents = ZONE_BOOK.get_agent_names_in(outpost)
+def feedback_agent_status(filters=None, page=1, page_size=50):
+    """ Build feedback message with agent status.
 
-        for agent in o_agents:
-            msg += '%s\n' % agent
+        filters   - dict with optional `outpost` (location of the agents),
+                    `hold` (True for held agents, False for free ones) and
+                    `load` (minimum percentage of the MIPS of its location
+                    used by the agent)
+        page      - page to show (starting at 1)
+        page_size - agents per page
+    """
+    # Read scout config for status and outpost config for capacity
+    conf = load_scout_conf()
+    capacity = _capacities(conf, load_outpost_list())
 
-        msg += '\n'
+    filters = filters or {}
 
-    return msg
+    key = ('status', ZONE_BOOK.version, tuple(sorted(filters.items())),
+            page, page_size, conf.hold, tuple(sorted(capacity.items())))
 
-def feedback_agent_status(agent_list):
-    """ Build feedback message with agent status.
+    return _cached(key, lambda: _agent_status(
+        conf, capacity, filters, page, page_size))
 
-        agent_list - list of known outpost agents (database objects)
+def feedback_migration_plan(plan, algorithm, stats=None):
+    """ Build feedback message with the migrations proposed by a balancing
+        algorithm.
+
+        plan      - dict obtained from `planner.make_plan()`
+        algorithm - name of the algorithm used
+        stats     - statistics of the algorithm run (if any)
     """
-    # Read scout config for status
-    conf = read_config(SCOUT_CONF)
+    def _load(value):
+        return 'N/A' if value is None else '%.2f%%' % (value * 100)
+
+    msg = '# Migration plan (%s)\n\n' % algorithm
+
+    if not plan['migrations']:
+        msg += 'No migrations needed\n\n'
 
-    msg = '# Agent status\n\n'
+    for mig in plan['migrations']:
+        static_size = mig['static']
+        dynamic_size = mig['dynamic']
 
-    for agent in agent_list:
-        msg += '%s\n' % agent.name
+        msg += '%s\n' % mig['agent']
         msg += '---------\n'
-        msg += 'ON HOLD\n' if agent.name in conf['agents']['hold'] else 'FREE\n'
-        msg += '- Location: %s\n' % agent.location.name
-        msg += '- MIPS: %f\n' % agent.mips
-        msg += '- Last update: %s\n\n' % datetime.datetime.fromtimestamp(
-                agent.timestamp).strftime('%d-%m-%Y %H:%M:%S')
+        msg += '- From: %s\n' % mig['origin']
+        msg += '- To: %s\n' % mig['outpost_id']
+        msg += '- Static files: %d bytes\n' % static_size
+
+        if dynamic_size is None:
+            msg += '- Dynamic files: unknown (remote)\n'
+        else:
+            msg += '- Dynamic files: %d bytes\n' % dynamic_size
+
+        if mig['downtime'] is None:
+            msg += '- Expected downtime: unknown (no history)\n\n'
+        else:
+            msg += '- Expected downtime: %.1f seconds\n\n' % mig['downtime']
+
+    msg += 'Outpost load (before -> after)\n'
+    msg += '---------\n'
+
+    for outpost in sorted(plan['load_before'].keys()):
+        msg += '- %s: %s -> %s\n' % (outpost,
+                _load(plan['load_before'][outpost]),
+                _load(plan['load_after'].get(outpost)))
 
     msg += '\n'
 
+    if stats and 'gap' in stats:
+        msg += 'Search statistics\n'
+        msg += '---------\n'
+        msg += '- Cost: %f\n' % stats['cost']
+        msg += '- Optimality gap: %.2f%%\n' % (stats['gap'] * 100)
+        msg += '- Explored nodes: %d\n' % stats['nodes']
+
+        if not stats['complete']:
+            msg += '- Time budget exhausted\n'
+
+        msg += '\n'
+
     return msg
 
 def feedback_outpost_status(outpost_list):
@@ -119,8 +177,8 @@ def feedback_outpost_status(outpost_list):
         outposts_list - list of known outposts
     """
     # Read outpost config for details
-    scout_conf = read_config(SCOUT_CONF)
-    out_conf = read_config(OUTPOST_LIST)
+    scout_conf = load_scout_conf()
+    out_conf = load_outpost_list()
 
     msg = '# Outpost status\n\n'
 
@@ -129,31 +187,29 @@ def feedback_outpost_status(outpost_list):
             msg += '%s\n' % outpost.name
             msg += '---------\n'
             msg += 'ONLINE\n' # If this is working, then it is online
-            msg += '- Balancer: %s\n' % scout_conf['general'].get(
-                    'balance','N/A')
-            msg += '- MIPS: %f\n' % scout_conf['general'].getfloat('mips', -1)
-            msg += '- Priority: %d\n' % scout_conf['general'].getint(
-                    'priority', -1)
+            msg += '- Balancer: %s\n' % (scout_conf.balance or 'N/A')
+            msg += '- MIPS: %f\n' % scout_conf.mips
+            msg += '- Priority: %d\n' % scout_conf.priority
             msg += '- Last update: %s\n\n' % datetime.datetime.fromtimestamp(
                     outpost.timestamp).strftime('%d-%m-%Y %H:%M:%S')
 
             continue
 
-        if 'outpost ' + outpost.name not in out_conf.sections():
+        if outpost.name not in out_conf:
             continue
 
-        conf = out_conf['outpost ' + outpost.name]
+        conf = out_conf[outpost.name]
 
         msg += '%s\n' % outpost.name
         msg += '---------\n'
         msg += 'ONLINE\n' if outpost.is_running else 'OFFLINE\n'
-        msg += '- Host: %s\n' % conf['host']
-        msg += '- Remote port: %d\n' % conf.getint('remote_port')
-        msg += '- Local tunnel: %d\n' % conf.getint('local_tunnel')
-        msg += '- Remote tunnel: %d\n' % conf.getint('remote_tunnel')
-        msg += '- Remote directory: %s\n' % conf['directory']
-        msg += '- MIPS: %f\n' % conf.getfloat('mips', -1)
-        msg += '- Priority: %d\n' % conf.getint('priority', -1)
+        msg += '- Host: %s\n' % conf.host
+        msg += '- Remote port: %d\n' % conf.remote_port
+        msg += '- Local tunnel: %d\n' % conf.local_tunnel
+        msg += '- Remote tunnel: %d\n' % conf.remote_tunnel
+        msg += '- Remote directory: %s\n' % conf.directory
+        msg += '- MIPS: %f\n' % conf.mips
+        msg += '- Priority: %d\n' % conf.priority
         msg += '- Last update: %s\n\n' % datetime.datetime.fromtimestamp(
                 outpost.timestamp).strftime('%d-%m-%Y %H:%M:%S')
 
@@ -167,6 +223,25 @@ def feedback_permissions():
     """
     return 'You do not have the required permissions'
 
+def feedback_replay_status(replays):
+    """ Build feedback message containing the deferred message replays in
+        progress.
+
+        replays - dict with the statistics of each replay
+    """
+    msg = '# Message replays\n\n'
+
+    if not replays:
+        return msg + 'No replays in progress\n'
+
+    for agent in sorted(replays.keys()):
+        stats = replays[agent]
+
+        msg += '- %s: %d messages in %.1f seconds (%.2f messages/s)\n' % (
+            agent, stats['messages'], stats['seconds'], stats['rate'])
+
+    return msg
+
 def launch_agent(outpost_id, agent):
     """ Tell the outpost to launch an agent.
 
@@ -190,11 +265,32 @@ def moving_agent(agent):
 
     return zoe.MessageBuilder(moving).msg()
 
+def replay_page(agent, seq, messages=None):
+    """ Create message that ends a page of replayed deferred messages.
+
+        The agent acknowledges the page with a `replay-ack` message.
+
+        agent    - agent name
+        seq      - sequence number of the last message of the page
+        messages - list of raw messages, when the page is bundled in a
+                   single message (sent as base64 encoded JSON)
+    """
+    replay = {
+        'dst': agent,
+        'tag': 'replay!',
+        'seq': str(seq)
+    }
+
+    if messages:
+        replay['messages'] = base64.b64encode(
+                json.dumps(messages).encode()).decode().replace('=', PAD_CHAR)
+
+    return zoe.MessageBuilder(replay).msg()
+
 def register_local(agent):
     """ Register a local agent with the server. """
     # Get port
-    main_conf = read_config(ZOE_CONF)
-    port = main_conf['agent '+ agent]['port']
+    port = load_zoe_conf().agent_port(agent)
 
     register = {
         'dst': 'server',
@@ -254,3 +350,112 @@ def outpost_gather_agents(outpost_id):
     }
 
     return zoe.MessageBuilder(gather).msg()
+
+def _agent_locations(outposts):
+    """ Build the agent locations report.
+
+        outposts - names of the outposts to show
+    """
+    located = collections.defaultdict(list)
+
+    for name, location, _, _ in ZONE_BOOK.get_agent_summary():
+        located[location].append(name)
+
+    lines = ['# Agent locations', '']
+
+    for outpost in outposts:
+        lines.append(outpost)
+        lines.append('---------')
+        lines.extend(located.get(outpost, []))
+        lines.append('')
+
+    return '\n'.join(lines) + '\n'
+
+def _agent_status(conf, capacity, filters, page, page_size):
+    """ Build a page of the agent status report.
+
+        conf      - ScoutSettings snapshot of the scout configuration
+        capacity  - dict with the MIPS of each outpost
+        filters   - filters of the report (see `feedback_agent_status()`)
+        page      - page to show (starting at 1)
+        page_size - agents per page
+    """
+    rows = []
+
+    for name, location, mips, timestamp in ZONE_BOOK.get_agent_summary():
+        if filters.get('outpost') and location != filters['outpost']:
+            continue
+
+        held = conf.is_held(name)
+
+        if 'hold' in filters and held != filters['hold']:
+            continue
+
+        load = None
+        if capacity.get(location, 0) > 0 and mips is not None:
+            load = 100.0 * mips / capacity[location]
+
+        if 'load' in filters and (load is None or load < filters['load']):
+            continue
+
+        rows.append((name, location, mips, timestamp, held, load))
+
+    pages = max(int(math.ceil(len(rows) / float(page_size))), 1)
+    page = min(max(page, 1), pages)
+
+    lines = ['# Agent status', '']
+
+    for name, location, mips, timestamp, held, load in rows[
+            (page - 1) * page_size:page * page_size]:
+        lines.append(name)
+        lines.append('---------')
+        lines.append('ON HOLD' if held else 'FREE')
+        lines.append('- Location: %s' % location)
+        lines.append('- MIPS: %f' % (mips or 0))
+
+        if load is not None:
+            lines.append('- Load: %.1f%%' % load)
+
+        lines.append('- Last update: %s' % (
+            datetime.datetime.fromtimestamp(timestamp).strftime(
+                '%d-%m-%Y %H:%M:%S') if timestamp else 'never'))
+        lines.append('')
+
+    lines.append('Page %d of %d (%d agents)' % (page, pages, len(rows)))
+
+    return '\n'.join(lines) + '\n'
+
+def _cached(key, build):
+    """ Obtain a report from the cache, building it if needed.
+
+        Keys include the version of the zone book, so reports are rebuilt
+        after any change and old ones are eventually evicted.
+
+        key   - arguments that identify the report
+        build - function that builds the report
+    """
+    with _report_lock:
+        if key in _report_cache:
+            _report_cache.move_to_end(key)
+            return _report_cache[key]
+
+    report = build()
+
+    with _report_lock:
+        _report_cache[key] = report
+
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+
+    return report
+
+def _capacities(conf, outpost_list):
+    """ Obtain the MIPS of each outpost and central.
+
+        conf         - ScoutSettings snapshot of the scout configuration
+        outpost_list - OutpostList snapshot of the outpost list
+    """
+    capacity = {name: outpost_list[name].mips for name in outpost_list.names()}
+    capacity['central'] = conf.mips
+
+    return capacity
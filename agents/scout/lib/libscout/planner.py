@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Migration planning."""
+
+import collections
+import time
+
+from libscout import get_logger
+from libscout import util
+from libscout.static import FORECASTER, ZONE_BOOK
+
+# Logging
+scoutlog = get_logger('libscout.planner')
+
+# Phases in which the agent files are being copied
+TRANSFER_PHASES = ('fetch', 'transfer')
+
+# Prefix of the agents that represent the load of unchanged outposts
+PINNED_PREFIX = '@pinned:'
+
+
+class BalanceState(object):
+    """ Remembers the load and agents of each outpost after the last
+        balancing in order to re-plan only the outposts that changed
+        (incremental balancing).
+
+        An outpost changed if its agents (or whether they can be moved) are
+        not the ones expected after the last plan, or if its load moved more
+        than a threshold. Agents in the rest of outposts are replaced by a
+        single held agent with their combined resources, so the balancing
+        algorithms only place the agents of changed outposts.
+    """
+
+    def __init__(self):
+        self._loads = {}
+        self._members = {}
+        self._runs = 0
+
+    def reset(self):
+        """ Forget the last plan, forcing a full balancing. """
+        self._loads = {}
+        self._members = {}
+        self._runs = 0
+
+    def restrict(self, outpost_map, threshold, full_every=0):
+        """ Obtain the map to balance with the agents of unchanged outposts
+            pinned in their location.
+
+            The whole map is returned when there is no previous plan, when
+            outposts were added or removed, or every `full_every` runs.
+
+            Returns a tuple with the map and the set of changed outposts.
+
+            outpost_map - map of outposts and agents they contain
+            threshold   - load difference for an outpost to be re-planned
+            full_every  - runs between full balancings (0 disables them)
+        """
+        members = _memberships(outpost_map)
+
+        if not self._members or set(members) != set(self._members) or (
+                full_every and self._runs >= full_every):
+            scoutlog.info('balancing every outpost')
+
+            self._runs = 0
+            return outpost_map, set(outpost_map.keys())
+
+        self._runs += 1
+
+        placement = {o: list(e['agents'].keys())
+            for o, e in outpost_map.items()}
+        loads = compute_loads(outpost_map, placement)
+
+        changed = set()
+
+        for outpost in outpost_map.keys():
+            if members[outpost] != self._members[outpost]:
+                scoutlog.debug('agents of outpost %s changed' % outpost)
+                changed.add(outpost)
+                continue
+
+            before = self._loads.get(outpost)
+            after = loads[outpost]
+
+            if before is None or after is None:
+                if before != after:
+                    changed.add(outpost)
+
+            elif abs(after - before) >= threshold:
+                scoutlog.debug('load of outpost %s changed %.3f -> %.3f' % (
+                    outpost, before, after))
+                changed.add(outpost)
+
+        restricted = {}
+
+        for outpost, entry in outpost_map.items():
+            if outpost in changed:
+                restricted[outpost] = entry
+
+            else:
+                restricted[outpost] = _pin_agents(outpost, entry)
+
+        scoutlog.info('re-planning %d of %d outposts' % (
+            len(changed), len(outpost_map)))
+
+        return restricted, changed
+
+    def update(self, outpost_map, migrations):
+        """ Remember the state expected after performing the migrations of
+            a plan.
+
+            outpost_map - complete map of outposts and agents they contain
+            migrations  - list of dicts with `outpost_id` and `agent` keys
+        """
+        placement = {o: set(e['agents'].keys())
+            for o, e in outpost_map.items()}
+
+        free = {}
+
+        for entry in outpost_map.values():
+            for agent, info in entry['agents'].items():
+                free[agent] = info['is_free']
+
+        for mig in migrations:
+            for agents in placement.values():
+                agents.discard(mig['agent'])
+
+            placement[mig['outpost_id']].add(mig['agent'])
+
+        self._loads = compute_loads(
+                outpost_map, {o: list(a) for o, a in placement.items()})
+        self._members = {o: frozenset((a, free[a]) for a in agents)
+            for o, agents in placement.items()}
+
+
+class PhaseTimer(object):
+    """ Measures the duration of each phase of a migration. """
+
+    def __init__(self):
+        self._phases = collections.OrderedDict()
+        self._current = None
+        self._started = None
+
+    def start(self, phase):
+        """ Finish the current phase (if any) and start a new one.
+
+            phase - name of the phase
+        """
+        self.stop()
+
+        self._current = phase
+        self._started = time.time()
+
+    def stop(self):
+        """ Finish the current phase. """
+        if self._current:
+            self._phases[self._current] = self._phases.get(
+                    self._current, 0.0) + time.time() - self._started
+
+        self._current = None
+
+    def durations(self):
+        """ Return an ordered dict with the duration in seconds of each
+            finished phase.
+        """
+        return self._phases.copy()
+
+    def downtime(self):
+        """ Seconds from the termination of the agent until it was launched
+            again in its new location.
+        """
+        total = 0.0
+        counting = False
+
+        for phase, duration in self._phases.items():
+            if phase == 'terminate':
+                counting = True
+
+            if counting:
+                total += duration
+
+            if phase == 'launch':
+                break
+
+        return total
+
+    def transfer(self):
+        """ Seconds spent copying agent files. """
+        return sum(self._phases.get(p, 0.0) for p in TRANSFER_PHASES)
+
+
+def build_outpost_map(outposts, conf, running):
+    """ Build the map of outposts and agents used by the balancing
+        algorithms from the information in the zone book.
+
+        Only running outposts and central are included.
+
+        outposts - OutpostList snapshot of the outpost list
+        conf     - ScoutSettings snapshot of the scout configuration
+        running  - list of names of the running outposts
+    """
+    outpost_map = {}
+
+    # Messages received by each agent, grouped by receiver
+    received = collections.defaultdict(dict)
+
+    for (src, dst), rate in ZONE_BOOK.get_traffic_matrix().items():
+        received[dst][src] = rate
+
+    for outpost in running:
+        outpost_map[outpost] = _map_entry(
+                outpost, outposts[outpost], conf, received)
+
+    # Information on Central
+    outpost_map['central'] = _map_entry(
+            'central', conf.general, conf, received)
+
+    return outpost_map
+
+def compute_loads(outpost_map, placement):
+    """ Compute the load of each outpost (used MIPS / available MIPS).
+
+        Outposts without MIPS information have a load of None.
+
+        outpost_map - map of outposts and agents they contain
+        placement   - map with outpost_id: [names of the agents]
+    """
+    agents_mips = {}
+
+    for outpost in outpost_map.values():
+        for agent, info in outpost['agents'].items():
+            agents_mips[agent] = info['mips']
+
+    loads = {}
+
+    for outpost, agents in placement.items():
+        try:
+            total = float(outpost_map[outpost].get('mips', 0))
+
+        except (TypeError, ValueError):
+            total = 0
+
+        if total <= 0:
+            loads[outpost] = None
+            continue
+
+        loads[outpost] = sum(agents_mips.get(a, 0.0) for a in agents) / total
+
+    return loads
+
+def estimate_downtime(agent, size, stats=None):
+    """ Estimate the time an agent will not be running while migrating,
+        based on previous migrations.
+
+        The fixed cost is the average downtime without the time spent
+        transferring files, while the transfer time is obtained from the
+        average throughput.
+
+        Returns None if there is no history.
+
+        agent - agent name
+        size  - bytes to transfer
+        stats - global migration statistics (obtained if not provided)
+    """
+    agent_stats = ZONE_BOOK.get_migration_stats(agent)
+
+    if not agent_stats['count']:
+        agent_stats = stats or ZONE_BOOK.get_migration_stats()
+
+    if not agent_stats['count']:
+        return None
+
+    fixed = max(agent_stats['downtime'] - agent_stats['transfer'], 0.0)
+
+    if agent_stats['throughput']:
+        return fixed + size / agent_stats['throughput']
+
+    return agent_stats['downtime']
+
+def get_migrations(outpost_map, balanced_map):
+    """ Compare current locations with the result of a balancing algorithm
+        to obtain the migrations to perform.
+
+        Returns a list of dicts with `outpost_id` and `agent` keys. Agents
+        pinned by incremental balancing are ignored.
+
+        outpost_map  - map of outposts and agents they contain
+        balanced_map - result of the balancing algorithm
+    """
+    migrations = []
+
+    for outpost in balanced_map.keys():
+        scoutlog.info('checking migrations to outpost "%s"' % outpost)
+
+        new_agents = balanced_map[outpost]
+        current_agents = outpost_map[outpost]['agents'].keys()
+
+        incoming = [a for a in set(new_agents) - set(current_agents)
+            if not a.startswith(PINNED_PREFIX)]
+
+        for inc in incoming:
+            scoutlog.debug('registering migration of "%s" to %s' % (
+                inc, outpost))
+
+            migrations.append({
+                'outpost_id': outpost,
+                'agent': inc
+            })
+
+    return migrations
+
+def make_plan(outpost_map, balanced_map):
+    """ Describe the migrations that a balancing result would perform,
+        without moving anything.
+
+        Returns a dict with:
+
+            migrations  - list of dicts with the `agent`, its `origin`,
+                          `outpost_id` (destination), `static` and `dynamic`
+                          bytes (dynamic is None if unknown) and `downtime`
+                          in seconds (None if unknown)
+            load_before - load of each outpost with the current placement
+            load_after  - load of each outpost after the migrations
+
+        outpost_map  - map of outposts and agents they contain
+        balanced_map - result of the balancing algorithm
+    """
+    current = {o: list(outpost_map[o]['agents'].keys()) for o in outpost_map}
+    migrations = get_migrations(outpost_map, balanced_map)
+    stats = ZONE_BOOK.get_migration_stats()
+
+    # Algorithms may leave held agents out of their result, so the placement
+    # after the migrations is obtained from the current one
+    moved = {m['agent']: m['outpost_id'] for m in migrations}
+    after = {o: [a for a in agents if a not in moved]
+        for o, agents in current.items()}
+
+    for agent, outpost in moved.items():
+        after[outpost].append(agent)
+
+    plan = {
+        'migrations': [],
+        'load_before': compute_loads(outpost_map, current),
+        'load_after': compute_loads(outpost_map, after)
+    }
+
+    for mig in migrations:
+        agent = mig['agent']
+        origin = ZONE_BOOK.get_agent_location(agent)
+
+        static_size, dynamic_size = util.get_agent_size(agent, origin)
+
+        plan['migrations'].append({
+            'agent': agent,
+            'origin': origin,
+            'outpost_id': mig['outpost_id'],
+            'static': static_size,
+            'dynamic': dynamic_size,
+            'downtime': estimate_downtime(
+                agent, static_size + (dynamic_size or 0), stats)
+        })
+
+    return plan
+
+def _map_entry(outpost, settings, conf, received):
+    """ Build the entry of an outpost in the outpost map.
+
+        outpost  - outpost name
+        settings - configuration values of the outpost
+        conf     - ScoutSettings snapshot of the scout configuration
+        received - dict with the messages per second received by each agent
+                   from each sender
+    """
+    entry = {'agents': {}}
+
+    for key in settings:
+        entry[key] = settings[key]
+
+    # Measuring the files is expensive, sizes are cached for `size_ttl`
+    # seconds and updated by migrations
+    size_ttl = conf.get_float('size_ttl', 3600.0)
+
+    for agent in ZONE_BOOK.get_agents_in(outpost):
+        size = ZONE_BOOK.get_agent_size(agent.name, size_ttl)
+
+        if size is None:
+            size = util.get_agent_size(agent.name, outpost)
+            ZONE_BOOK.set_agent_size(agent.name, *size)
+
+        static_size, dynamic_size = size
+
+        entry['agents'][agent.name] = {
+            'location': outpost,
+            # Predicted demand, used by the balancing algorithms
+            'mips': FORECASTER.predict(agent.name, conf, agent.mips),
+            # Latest measurement
+            'sampled_mips': agent.mips,
+            'timestamp': agent.timestamp,
+            # Can the agent be moved?
+            'is_free': conf.is_free(agent.name),
+            # Resident memory (bytes) and bandwidth (bytes per second)
+            'memory': agent.memory,
+            'bandwidth': agent.bandwidth,
+            # Messages per second received from other agents
+            'peers': received.get(agent.name, {}),
+            # Bytes to transfer when migrating (used as migration cost)
+            'size': static_size + (dynamic_size or 0)
+        }
+
+    return entry
+
+def _memberships(outpost_map):
+    """ Obtain the agents of each outpost and whether they can be moved.
+
+        outpost_map - map of outposts and agents they contain
+    """
+    return {o: frozenset((a, i['is_free']) for a, i in e['agents'].items())
+        for o, e in outpost_map.items()}
+
+def _pin_agents(outpost, entry):
+    """ Replace the agents of an outpost entry by a single held agent with
+        their combined resources.
+
+        outpost - outpost name
+        entry   - entry of the outpost in the outpost map
+    """
+    pinned = {k: v for k, v in entry.items() if k != 'agents'}
+    agents = entry['agents'].values()
+
+    if not agents:
+        pinned['agents'] = {}
+        return pinned
+
+    pinned['agents'] = {
+        PINNED_PREFIX + outpost: {
+            'location': outpost,
+            'mips': sum(a['mips'] or 0.0 for a in agents),
+            'sampled_mips': sum(a['sampled_mips'] or 0.0 for a in agents),
+            'timestamp': max(a['timestamp'] or 0 for a in agents),
+            'is_free': False,
+            'memory': sum(a['memory'] or 0.0 for a in agents),
+            'bandwidth': sum(a['bandwidth'] or 0.0 for a in agents),
+            'peers': {},
+            'size': 0
+        }
+    }
+
+    return pinned
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Replay of deferred messages."""
+
+import threading
+import time
+
+from libscout import get_logger
+
+# Logging
+scoutlog = get_logger('libscout.replay')
+
+
+class ReplayTracker(object):
+    """ Keeps the state of the deferred message replays in progress.
+
+        Messages are replayed in pages. A page is only deleted from the agent
+        book once the agent acknowledges it, so an interrupted replay resumes
+        from the last acknowledged message.
+    """
+
+    def __init__(self):
+        self._replays = {}
+        self._lock = threading.Lock()
+
+    def acked(self, agent, seq):
+        """ Register the acknowledgement of a page.
+
+            Returns False if the page was not the one being waited for.
+
+            agent - agent name
+            seq   - sequence number of the last message of the page
+        """
+        with self._lock:
+            replay = self._replays.get(agent)
+
+            if not replay or replay['pending'] != seq:
+                return False
+
+            replay['acked'] = seq
+            replay['replayed'] += replay['pending_count']
+            replay['pending'] = None
+            replay['pending_count'] = 0
+            replay['retries'] = 0
+
+            return True
+
+    def expired(self, timeout):
+        """ Obtain the agents whose last page was not acknowledged in time.
+
+            timeout - seconds to wait for an acknowledgement
+        """
+        now = time.time()
+
+        with self._lock:
+            return [a for a, r in self._replays.items()
+                if r['pending'] is not None and now - r['sent'] > timeout]
+
+    def finish(self, agent):
+        """ Stop tracking a replay.
+
+            Returns a dict with the `messages` replayed, `seconds` taken and
+            `rate` (messages per second), or None if there was no replay.
+
+            agent - agent name
+        """
+        with self._lock:
+            replay = self._replays.pop(agent, None)
+
+        if not replay:
+            return None
+
+        return _replay_stats(replay)
+
+    def get(self, agent):
+        """ Return a copy of the state of a replay (None if not replaying).
+
+            agent - agent name
+        """
+        with self._lock:
+            replay = self._replays.get(agent)
+
+            return dict(replay) if replay else None
+
+    def retry(self, agent):
+        """ Count a new attempt to send the pending page.
+
+            Returns the number of attempts, or None if the replay already
+            finished.
+
+            agent - agent name
+        """
+        with self._lock:
+            replay = self._replays.get(agent)
+
+            if not replay:
+                return None
+
+            replay['retries'] += 1
+
+            return replay['retries']
+
+    def sent(self, agent, seq, count):
+        """ Register a page sent to the agent.
+
+            Returns False if the replay already finished.
+
+            agent - agent name
+            seq   - sequence number of the last message of the page
+            count - number of messages in the page
+        """
+        with self._lock:
+            replay = self._replays.get(agent)
+
+            if not replay:
+                return False
+
+            replay['pending'] = seq
+            replay['pending_count'] = count
+            replay['sent'] = time.time()
+
+            return True
+
+    def start(self, agent, user=None, src=None):
+        """ Start tracking the replay for an agent.
+
+            If there was a replay in progress, it is resumed from the last
+            acknowledged page.
+
+            agent - agent name
+            user  - user that requested the replay (for feedback)
+            src   - agent that requested the replay (for feedback)
+        """
+        with self._lock:
+            previous = self._replays.get(agent, {})
+
+            self._replays[agent] = {
+                'acked': previous.get('acked', 0),
+                'pending': None,
+                'pending_count': 0,
+                'replayed': previous.get('replayed', 0),
+                'retries': 0,
+                'sent': None,
+                'started': previous.get('started', time.time()),
+                'user': user,
+                'src': src
+            }
+
+    def status(self):
+        """ Return a dict with the statistics of each replay in progress (see
+            `finish()`).
+        """
+        with self._lock:
+            return {a: _replay_stats(r) for a, r in self._replays.items()}
+
+
+def _replay_stats(replay):
+    """ Obtain the statistics of a replay.
+
+        replay - state of the replay
+    """
+    seconds = time.time() - replay['started']
+
+    return {
+        'messages': replay['replayed'],
+        'seconds': seconds,
+        'rate': replay['replayed'] / seconds if seconds > 0 else 0.0
+    }
@@ -0,0 +1,683 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""SQLite storage engine of the agent and zone books."""
+
+from .db import agent_book_proxy, zone_book_proxy, \
+        AgentInfo, AgentMessage, \
+        AgentZone, AgentTraffic, OutpostZone, MigrationHistory, \
+        ResourceRollup, ResourceSample
+from .storage import AgentStorage, ZoneStorage, AgentState, OutpostState, \
+        ROLLUP_RESOLUTIONS
+from libscout import get_logger
+from peewee import SqliteDatabase, IntegrityError, fn
+from playhouse.migrate import SqliteMigrator, migrate
+import collections
+import time
+
+# Logging
+scoutlog = get_logger('libscout.sqlstore')
+
+# Rows per bulk insert (SQLite limits the variables of a statement)
+INSERT_BATCH = 100
+
+# Resources stored as the latest values of each agent
+LATEST_FIELDS = ('mips', 'memory', 'bandwidth', 'timestamp')
+
+# Connection settings of the databases. WAL lets the threads of the scout
+# read while another one writes, and NORMAL synchronization is safe in WAL
+# mode (only the last transactions may be lost on power failure)
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'wal'),
+    ('synchronous', 'normal'),
+    ('cache_size', -8000),
+    ('temp_store', 'memory')
+)
+
+
+class SqliteAgentStorage(AgentStorage):
+
+    def __init__(self, path):
+        """ Open the agent book database.
+
+            path - absolute path to database file
+        """
+        self.db = SqliteDatabase(path, pragmas=SQLITE_PRAGMAS)
+        agent_book_proxy.initialize(self.db)
+        self.db.create_tables([AgentInfo, AgentMessage], True)
+
+        # Agent books created by previous versions
+        _add_missing_columns(self.db, [AgentMessage])
+        _add_missing_indexes(self.db, [AgentMessage])
+
+        AgentMessage.update(seq=AgentMessage.id).where(
+                AgentMessage.seq == 0).execute()
+
+    def append_messages(self, rows, max_messages=None):
+        """ Store messages durably in a single transaction.
+
+            rows         - list of message dicts
+            max_messages - maximum number of messages stored per agent
+        """
+        with self.db.atomic():
+            _insert_many(AgentMessage, rows)
+
+            if max_messages:
+                for agent in set(r['agent'] for r in rows):
+                    self._enforce_limit(agent, max_messages)
+
+    def close(self):
+        """ Close the database. """
+        self.db.close()
+
+    def delete_info(self, agent):
+        """ Delete the information of an agent.
+
+            agent - agent name
+        """
+        return AgentInfo.delete().where(
+                AgentInfo.agent == agent).execute() > 0
+
+    def delete_messages(self, agent, upto=None):
+        """ Delete the messages of an agent.
+
+            agent - agent name
+            upto  - only delete messages up to this sequence number
+        """
+        query = AgentMessage.delete().where(AgentMessage.agent == agent)
+
+        if upto is not None:
+            query = query.where(AgentMessage.seq <= upto)
+
+        return query.execute()
+
+    def export_data(self):
+        """ Return the information and messages of every agent. """
+        return {
+            'info': {i.agent: i.info for i in AgentInfo.select()},
+            'messages': AgentMessage.select(
+                    AgentMessage.agent, AgentMessage.seq,
+                    AgentMessage.timestamp, AgentMessage.message
+                ).order_by(AgentMessage.seq).dicts().iterator()
+        }
+
+    def get_info(self, agent):
+        """ Return the information of an agent.
+
+            agent - agent name
+        """
+        try:
+            return AgentInfo.get(AgentInfo.agent == agent).info
+
+        except AgentInfo.DoesNotExist:
+            return None
+
+    def get_messages(self, agent, after=0, limit=None):
+        """ Return the messages of an agent in insertion order.
+
+            agent - agent name
+            after - only return messages after this sequence number
+            limit - maximum number of messages to return
+        """
+        query = AgentMessage.select(AgentMessage.seq, AgentMessage.message
+            ).where(
+                (AgentMessage.agent == agent) &
+                (AgentMessage.seq > after)
+            ).order_by(AgentMessage.seq)
+
+        if limit:
+            query = query.limit(limit)
+
+        return [(m.seq, m.message) for m in query]
+
+    def import_data(self, data):
+        """ Store the data obtained from another engine.
+
+            data - dict with `info` and `messages`
+        """
+        with self.db.atomic():
+            _insert_many(AgentInfo, [{'agent': a, 'info': i}
+                for a, i in data['info'].items()])
+            _insert_many(AgentMessage, data['messages'])
+
+    def max_seq(self):
+        """ Return the greatest sequence number stored. """
+        return AgentMessage.select(fn.MAX(AgentMessage.seq)).scalar() or 0
+
+    def purge_messages(self, before):
+        """ Delete messages stored before the given time.
+
+            before - seconds since epoch
+        """
+        return AgentMessage.delete().where(
+                AgentMessage.timestamp < before).execute()
+
+    def put_info(self, agent, info):
+        """ Store the information of an agent.
+
+            agent - agent name
+            info  - raw message with the information
+        """
+        try:
+            AgentInfo.create(agent=agent, info=info)
+            return True
+
+        except IntegrityError as e:
+            return False
+
+    def _enforce_limit(self, agent, max_messages):
+        """ Discard the oldest messages of an agent above the limit.
+
+            agent        - agent name
+            max_messages - maximum number of messages stored for the agent
+        """
+        excess = AgentMessage.select().where(
+                AgentMessage.agent == agent).count() - max_messages
+
+        if excess <= 0:
+            return
+
+        scoutlog.warning('discarding %d old messages of agent %s' % (
+            excess, agent))
+
+        oldest = AgentMessage.select(AgentMessage.id).where(
+                AgentMessage.agent == agent).order_by(
+                AgentMessage.seq).limit(excess)
+
+        AgentMessage.delete().where(AgentMessage.id << oldest).execute()
+
+
+class SqliteZoneStorage(ZoneStorage):
+
+    def __init__(self, path):
+        """ Open the zone book database.
+
+            path - absolute path to database file
+        """
+        self.db = SqliteDatabase(path, pragmas=SQLITE_PRAGMAS)
+        zone_book_proxy.initialize(self.db)
+        self.db.create_tables([OutpostZone, AgentZone, AgentTraffic,
+            MigrationHistory, ResourceSample, ResourceRollup], True)
+
+        # Zone books created by previous versions
+        added = _add_missing_columns(self.db, [AgentZone, ResourceRollup])
+        _drop_not_null(self.db, ResourceSample, ['memory', 'bandwidth'])
+
+        if (ResourceRollup._meta.db_table, 'memory_samples') in added:
+            # Missing resources were aggregated as 0
+            ResourceRollup.update(
+                memory_samples=ResourceRollup.samples,
+                bandwidth_samples=ResourceRollup.samples).execute()
+
+    def close(self):
+        """ Close the database. """
+        self.db.close()
+
+    def count_samples(self, agent, start, end):
+        """ Return the number of samples of an agent in a time range.
+
+            agent - agent name
+            start - start of the range
+            end   - end of the range
+        """
+        return ResourceSample.select().where(
+                (ResourceSample.agent == agent) &
+                (ResourceSample.timestamp >= start) &
+                (ResourceSample.timestamp <= end)).count()
+
+    def export_data(self):
+        """ Return every record of the zone book. """
+        outposts, agents = self.load()
+
+        return {
+            'outposts': outposts,
+            'agents': agents,
+            'traffic': AgentTraffic.select(
+                    AgentTraffic.src, AgentTraffic.dst, AgentTraffic.rate
+                ).tuples().iterator(),
+            'samples': ResourceSample.select(
+                    ResourceSample.agent, ResourceSample.timestamp,
+                    ResourceSample.mips, ResourceSample.memory,
+                    ResourceSample.bandwidth
+                ).order_by(ResourceSample.timestamp).dicts().iterator(),
+            'rollups': ResourceRollup.select(
+                    ResourceRollup.agent, ResourceRollup.resolution,
+                    ResourceRollup.bucket, ResourceRollup.samples,
+                    ResourceRollup.mips_sum, ResourceRollup.mips_max,
+                    ResourceRollup.memory_sum, ResourceRollup.bandwidth_sum,
+                    ResourceRollup.memory_samples,
+                    ResourceRollup.bandwidth_samples
+                ).dicts().iterator(),
+            'migrations': MigrationHistory.select(
+                    MigrationHistory.agent, MigrationHistory.origin,
+                    MigrationHistory.destination, MigrationHistory.size,
+                    MigrationHistory.downtime, MigrationHistory.transfer,
+                    MigrationHistory.phases, MigrationHistory.timestamp
+                ).order_by(MigrationHistory.id).dicts().iterator()
+        }
+
+    def get_migration_stats(self, agent=None):
+        """ Obtain average timings of past migrations.
+
+            agent - only take into account migrations of this agent
+        """
+        query = MigrationHistory.select(
+                fn.COUNT(MigrationHistory.id).alias('count'),
+                fn.AVG(MigrationHistory.downtime).alias('downtime'),
+                fn.AVG(MigrationHistory.transfer).alias('transfer'),
+                fn.SUM(MigrationHistory.size).alias('size'),
+                fn.SUM(MigrationHistory.transfer).alias('total_transfer'))
+
+        if agent:
+            query = query.where(MigrationHistory.agent == agent)
+
+        row = query.dicts().get()
+
+        stats = {
+            'count': row['count'] or 0,
+            'downtime': row['downtime'] or 0.0,
+            'transfer': row['transfer'] or 0.0,
+            'throughput': None
+        }
+
+        if row['total_transfer']:
+            stats['throughput'] = (row['size'] or 0) / row['total_transfer']
+
+        return stats
+
+    def get_rollups(self, agent, resolution, start, end):
+        """ Return the rollups of an agent with buckets in a time range.
+
+            agent      - agent name
+            resolution - seconds of each bucket
+            start      - start of the range
+            end        - end of the range
+        """
+        return list(ResourceRollup.select(
+                ResourceRollup.bucket, ResourceRollup.samples,
+                ResourceRollup.mips_sum, ResourceRollup.mips_max,
+                ResourceRollup.memory_sum, ResourceRollup.bandwidth_sum,
+                ResourceRollup.memory_samples, ResourceRollup.bandwidth_samples
+            ).where(
+                (ResourceRollup.agent == agent) &
+                (ResourceRollup.resolution == resolution) &
+                (ResourceRollup.bucket >= start) &
+                (ResourceRollup.bucket <= end)
+            ).order_by(ResourceRollup.bucket).dicts())
+
+    def get_samples(self, agent, start, end):
+        """ Return the samples of an agent in a time range.
+
+            agent - agent name
+            start - start of the range
+            end   - end of the range
+        """
+        return list(ResourceSample.select(
+                ResourceSample.timestamp, ResourceSample.mips,
+                ResourceSample.memory, ResourceSample.bandwidth
+            ).where(
+                (ResourceSample.agent == agent) &
+                (ResourceSample.timestamp >= start) &
+                (ResourceSample.timestamp <= end)
+            ).order_by(ResourceSample.timestamp).dicts())
+
+    def get_traffic_matrix(self):
+        """ Return the messages per second exchanged between agents. """
+        return {(t.src, t.dst): t.rate for t in AgentTraffic.select()}
+
+    def import_data(self, data):
+        """ Store the data obtained from another engine.
+
+            data - dict with the iterables of each kind of data
+        """
+        with self.db.atomic():
+            _insert_many(OutpostZone, [o._asdict() for o in data['outposts']])
+
+            ids = {o.name: o.id for o in OutpostZone.select()}
+
+            _insert_many(AgentZone, [dict(a._asdict(),
+                location=ids[a.location]) for a in data['agents']])
+
+            _insert_many(AgentTraffic, [{'src': s, 'dst': d, 'rate': r}
+                for s, d, r in data['traffic']])
+
+            _insert_many(ResourceSample, data['samples'])
+            _insert_many(ResourceRollup, data['rollups'])
+            _insert_many(MigrationHistory, data['migrations'])
+
+    def load(self):
+        """ Return the outposts and agents stored. """
+        outposts = [OutpostState(o.name, o.is_running, o.timestamp)
+            for o in OutpostZone.select()]
+
+        query = AgentZone.select(
+                AgentZone.name, OutpostZone.name, AgentZone.mips,
+                AgentZone.memory, AgentZone.bandwidth, AgentZone.timestamp
+            ).join(OutpostZone)
+
+        return outposts, [AgentState(*row) for row in query.tuples()]
+
+    def oldest_rollup(self, agent, resolution):
+        """ Return the start of the oldest bucket of an agent.
+
+            agent      - agent name
+            resolution - seconds of each bucket
+        """
+        return ResourceRollup.select(fn.MIN(ResourceRollup.bucket)).where(
+                (ResourceRollup.agent == agent) &
+                (ResourceRollup.resolution == resolution)).scalar()
+
+    def oldest_sample(self, agent):
+        """ Return the time of the oldest sample of an agent.
+
+            agent - agent name
+        """
+        return ResourceSample.select(fn.MIN(ResourceSample.timestamp)).where(
+                ResourceSample.agent == agent).scalar()
+
+    def purge_resources(self, before):
+        """ Delete samples and rollups older than the given times.
+
+            before - dict with the time before which raw samples (key 0)
+                     and the rollups of each resolution are deleted
+        """
+        removed = 0
+
+        with self.db.atomic():
+            if 0 in before:
+                removed += ResourceSample.delete().where(
+                        ResourceSample.timestamp < before[0]).execute()
+
+            for resolution in ROLLUP_RESOLUTIONS:
+                if resolution not in before:
+                    continue
+
+                removed += ResourceRollup.delete().where(
+                        (ResourceRollup.resolution == resolution) &
+                        (ResourceRollup.bucket < before[resolution])
+                    ).execute()
+
+        return removed
+
+    def write_location(self, name, location):
+        """ Change the location of an agent.
+
+            name     - agent name
+            location - outpost name
+        """
+        outpost = OutpostZone.get(OutpostZone.name == location)
+
+        AgentZone.update(location=outpost).where(
+                AgentZone.name == name).execute()
+
+    def write_migration(self, row):
+        """ Store a completed migration.
+
+            row - dict with the fields of the migration
+        """
+        MigrationHistory.create(**row)
+
+    def write_refresh(self, outposts, agents, removed):
+        """ Add outposts and agents (in central) and remove agents in a
+            single transaction.
+
+            outposts - names of the outposts to add
+            agents   - names of the agents to add
+            removed  - names of the agents to remove
+        """
+        with self.db.atomic():
+            _insert_many(OutpostZone, [{'name': o} for o in outposts])
+
+            if agents:
+                central = OutpostZone.select(OutpostZone.id).where(
+                        OutpostZone.name == 'central').scalar()
+
+                _insert_many(AgentZone, [{'name': a, 'location': central}
+                    for a in agents])
+
+            if removed:
+                AgentZone.delete().where(AgentZone.name << removed).execute()
+
+    def write_resources(self, samples, traffic):
+        """ Write the latest resources, history and traffic of the agents in
+            a single transaction.
+
+            Statements are executed in bulk, so the number of statements does
+            not depend on the number of agents.
+
+            samples - list of sample dicts
+            traffic - dict with the messages per second received by each
+                      agent from each sender
+        """
+        rows = [_sample_row(s) for s in samples]
+
+        with self.db.atomic():
+            # Latest values (missing resources keep their value)
+            self._update_latest(samples)
+
+            # History
+            _insert_many(ResourceSample, rows)
+            self._add_to_rollups(rows)
+
+            # Messages received from other agents
+            self._replace_traffic(traffic, time.time())
+
+    def write_running(self, name, value):
+        """ Change the running status of an outpost.
+
+            name  - outpost name
+            value - whether the outpost is running
+        """
+        OutpostZone.update(is_running=value).where(
+                OutpostZone.name == name).execute()
+
+    def _add_to_rollups(self, rows):
+        """ Aggregate samples in the rollups of every resolution.
+
+            The samples are aggregated per bucket in memory, then missing
+            buckets are created and every bucket is updated with a single
+            statement each.
+
+            rows - list of dicts with the samples
+        """
+        buckets = collections.OrderedDict()
+
+        for row in rows:
+            for resolution in ROLLUP_RESOLUTIONS:
+                key = (row['agent'], resolution,
+                        int(row['timestamp'] // resolution * resolution))
+
+                acc = buckets.setdefault(key, [0, 0.0, 0.0, 0.0, 0.0, 0, 0])
+                acc[0] += 1
+                acc[1] += row['mips']
+                acc[2] = max(acc[2], row['mips'])
+
+                # Missing resources are not aggregated
+                if row['memory'] is not None:
+                    acc[3] += row['memory']
+                    acc[5] += 1
+
+                if row['bandwidth'] is not None:
+                    acc[4] += row['bandwidth']
+                    acc[6] += 1
+
+        if not buckets:
+            return
+
+        table = ResourceRollup._meta.db_table
+        cursor = self.db.get_cursor()
+
+        cursor.executemany(
+            'INSERT OR IGNORE INTO %s (agent, resolution, bucket, samples, '
+            'mips_sum, mips_max, memory_sum, bandwidth_sum, '
+            'memory_samples, bandwidth_samples) '
+            'VALUES (?, ?, ?, 0, 0, 0, 0, 0, 0, 0)' % table,
+            list(buckets.keys()))
+
+        cursor.executemany(
+            'UPDATE %s SET samples = samples + ?, mips_sum = mips_sum + ?, '
+            'mips_max = MAX(mips_max, ?), memory_sum = memory_sum + ?, '
+            'bandwidth_sum = bandwidth_sum + ?, '
+            'memory_samples = memory_samples + ?, '
+            'bandwidth_samples = bandwidth_samples + ? '
+            'WHERE agent = ? AND resolution = ? AND bucket = ?' % table,
+            [tuple(acc) + key for key, acc in buckets.items()])
+
+    def _replace_traffic(self, traffic, timestamp):
+        """ Replace the traffic received by the given agents.
+
+            traffic   - dict with the messages per second received by each
+                        agent (receiver) from each sender
+            timestamp - time of the measurement
+        """
+        if not traffic:
+            return
+
+        AgentTraffic.delete().where(
+                AgentTraffic.dst << list(traffic.keys())).execute()
+
+        _insert_many(AgentTraffic, [{'src': src, 'dst': agent, 'rate': rate,
+            'timestamp': timestamp}
+            for agent, peers in traffic.items()
+            for src, rate in peers.items()])
+
+    def _update_latest(self, samples):
+        """ Update the latest resources of the agents with a single
+            statement. Resources missing from a sample are not modified.
+
+            samples - list of sample dicts
+        """
+        if not samples:
+            return
+
+        columns = ', '.join('%s = COALESCE(?, %s)' % (f, f)
+                for f in LATEST_FIELDS)
+
+        self.db.get_cursor().executemany(
+            'UPDATE %s SET %s WHERE name = ?' % (
+                AgentZone._meta.db_table, columns),
+            [tuple(s.get(f) for f in LATEST_FIELDS) + (s['agent'],)
+                for s in samples])
+
+
+def _add_missing_columns(db, models):
+    """ Add the columns of the models that do not exist in their tables.
+
+        Returns a list of (table, column) tuples with the added columns.
+
+        db     - database instance
+        models - list of models to check
+    """
+    migrator = SqliteMigrator(db)
+    operations = []
+    added = []
+
+    for model in models:
+        table = model._meta.db_table
+        existing = [c.name for c in db.get_columns(table)]
+
+        for field in model._meta.sorted_fields:
+            if field.db_column in existing:
+                continue
+
+            scoutlog.info('adding column %s to table %s' % (
+                field.db_column, table))
+
+            operations.append(
+                    migrator.add_column(table, field.db_column, field))
+            added.append((table, field.db_column))
+
+    if operations:
+        migrate(*operations)
+
+    return added
+
+def _add_missing_indexes(db, models):
+    """ Create the indexes of the models that do not exist in their tables.
+
+        db     - database instance
+        models - list of models to check
+    """
+    for model in models:
+        table = model._meta.db_table
+        existing = [tuple(i.columns) for i in db.get_indexes(table)]
+
+        for names, unique in model._meta.indexes:
+            fields = [model._meta.fields[n] for n in names]
+
+            if tuple(f.db_column for f in fields) in existing:
+                continue
+
+            scoutlog.info('adding index on %s to table %s' % (
+                ', '.join(names), table))
+
+            db.create_index(model, fields, unique)
+
+def _drop_not_null(db, model, names):
+    """ Allow NULL values in columns created as NOT NULL by previous
+        versions.
+
+        db    - database instance
+        model - model of the table
+        names - names of the columns
+    """
+    migrator = SqliteMigrator(db)
+    table = model._meta.db_table
+    operations = []
+
+    for column in db.get_columns(table):
+        if column.name in names and not column.null:
+            scoutlog.info('allowing NULL in column %s of table %s' % (
+                column.name, table))
+
+            operations.append(migrator.drop_not_null(table, column.name))
+
+    if operations:
+        migrate(*operations)
+
+def _insert_many(model, rows):
+    """ Insert rows in bulk, a few at a time.
+
+        model - model of the table
+        rows  - iterable of dicts with the values of each row
+    """
+    chunk = []
+
+    for row in rows:
+        chunk.append(row)
+
+        if len(chunk) == INSERT_BATCH:
+            model.insert_many(chunk).execute()
+            chunk = []
+
+    if chunk:
+        model.insert_many(chunk).execute()
+
+def _sample_row(sample):
+    """ Build the history row of a sample, with missing memory and bandwidth
+        as NULL.
+
+        sample - sample dict
+    """
+    return {
+        'agent': sample['agent'],
+        'timestamp': sample['timestamp'],
+        'mips': sample.get('mips', 0.0),
+        'memory': sample.get('memory'),
+        'bandwidth': sample.get('bandwidth')
+    }
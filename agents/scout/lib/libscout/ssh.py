@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""SSH session pool."""
+
+import contextlib
+import paramiko
+import socket
+import threading
+import time
+
+from libscout import get_logger
+
+# Logging
+scoutlog = get_logger('libscout.ssh')
+
+
+class _Session(object):
+    """ Connected SSH client and its usage information. """
+
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.time()
+        self.in_use = 0
+        self.broken = False
+        self.closed = False
+
+
+class SSHPool(object):
+    """ Pool of SSH sessions shared by all the remote operations.
+
+        Sessions are identified by (host, username) and a single transport is
+        kept for each of them. Commands and file copies open new channels on
+        that transport instead of performing a new handshake.
+    """
+
+    def __init__(self, keepalive=30, max_idle=300, timeout=10):
+        """ Initialize the pool.
+
+            keepalive - seconds between keepalive packets sent by paramiko
+            max_idle  - seconds a session may remain unused before eviction
+            timeout   - timeout for establishing new connections
+        """
+        self._keepalive = keepalive
+        self._max_idle = max_idle
+        self._timeout = timeout
+
+        self._sessions = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def close_all(self):
+        """ Close every session in the pool. """
+        with self._lock:
+            sessions = list(self._sessions.items())
+            self._sessions.clear()
+
+            for key, session in sessions:
+                session.broken = session.closed = True
+
+        for key, session in sessions:
+            self._close(key, session)
+
+    def discard(self, host, username=None, session=None):
+        """ Remove the session for the given host (if any) and close it once
+            no other thread is using it.
+
+            host     - remote host
+            username - remote username used in the connection
+            session  - only discard the session if it is still this one
+        """
+        key = (host, username)
+
+        with self._lock:
+            current = self._sessions.get(key)
+
+            if current and (session is None or current is session):
+                del self._sessions[key]
+
+            target = session or current
+            close = target and self._retire(target)
+
+        if close:
+            self._close(key, target)
+
+    def evict_idle(self):
+        """ Close sessions that have not been used for `max_idle` seconds or
+            whose transport is no longer active.
+
+            Sessions currently in use are never evicted.
+        """
+        now = time.time()
+        evicted = []
+
+        with self._lock:
+            for key, session in list(self._sessions.items()):
+                if session.in_use:
+                    continue
+
+                if now - session.last_used > self._max_idle or \
+                        not self._is_healthy(session, probe=False):
+                    del self._sessions[key]
+
+                    if self._retire(session):
+                        evicted.append((key, session))
+
+        for key, session in evicted:
+            self._close(key, session)
+
+        return len(evicted)
+
+    @contextlib.contextmanager
+    def session(self, host, username=None):
+        """ Obtain a connected SSHClient for the given host.
+
+            An existing session is reused when its transport is healthy,
+            otherwise a new connection is established. If a connection error
+            occurs while the client is being used, the session is discarded
+            so that the next caller reconnects (it is closed when the last
+            thread using it is done).
+
+            host     - remote host
+            username - remote username used in the connection
+        """
+        key = (host, username)
+        session = self._acquire(key)
+        broken = False
+
+        try:
+            yield session.client
+
+        except (paramiko.SSHException, socket.error, EOFError):
+            broken = True
+            raise
+
+        finally:
+            with self._lock:
+                session.in_use -= 1
+                session.last_used = time.time()
+
+                # Deferred close of a discarded session
+                close = session.broken and self._retire(session)
+
+            if broken:
+                self.discard(host, username, session)
+
+            elif close:
+                self._close(key, session)
+
+    def _acquire(self, key):
+        """ Get a healthy session for the key, connecting if necessary.
+
+            key - tuple with (host, username)
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one connection attempt per key, other hosts are not blocked
+        with key_lock:
+            with self._lock:
+                session = self._sessions.get(key)
+
+            if session and self._is_healthy(session):
+                with self._lock:
+                    session.in_use += 1
+
+                return session
+
+            if session:
+                scoutlog.warning('SSH session to %s is no longer active' %
+                        key[0])
+                self.discard(*key, session=session)
+
+            session = _Session(self._connect(*key))
+            session.in_use += 1
+
+            with self._lock:
+                self._sessions[key] = session
+
+            return session
+
+    def _close(self, key, session):
+        """ Close the client of a session.
+
+            key     - tuple with (host, username)
+            session - _Session instance
+        """
+        scoutlog.info('closing SSH session to %s' % key[0])
+
+        try:
+            session.client.close()
+
+        except Exception as e:
+            scoutlog.exception('error while closing SSH session to %s' %
+                    key[0])
+
+    def _connect(self, host, username):
+        """ Establish a new SSH connection.
+
+            host     - remote host
+            username - remote username used in the connection
+        """
+        scoutlog.info('opening SSH session to %s' % host)
+
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(host, username=username, timeout=self._timeout)
+
+        ssh.get_transport().set_keepalive(self._keepalive)
+
+        return ssh
+
+    def _is_healthy(self, session, probe=True):
+        """ Check whether the transport of a session can still be used.
+
+            session - _Session instance
+            probe   - send an ignore packet if the session has been idle for
+                      longer than the keepalive interval
+        """
+        transport = session.client.get_transport()
+
+        if transport is None or not transport.is_active():
+            return False
+
+        if probe and time.time() - session.last_used > self._keepalive:
+            try:
+                transport.send_ignore()
+
+            except Exception as e:
+                return False
+
+        return True
+
+    def _retire(self, session):
+        """ Mark a session as discarded. Must be called with the pool lock
+            held.
+
+            Returns True if the session must be closed by the caller (nobody
+            is using it and it was not closed already).
+
+            session - _Session instance
+        """
+        session.broken = True
+
+        if session.in_use or session.closed:
+            return False
+
+        session.closed = True
+
+        return True
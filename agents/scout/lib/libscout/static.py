@@ -21,23 +21,42 @@
 import os
 from libscout import AgentBook, ZoneBook
 from libscout import Balancer
+from libscout import ConfigCache
+from libscout import Forecaster
+from libscout import MigrationJournal
+from libscout import ReplayTracker
+from libscout import SSHPool
+from libscout.config import ScoutSettings
+from libscout.storage import open_storage
 
 # Base directory for scout files
 _BASE_DIR = os.path.join(os.environ['ZOE_HOME'], 'etc', 'scout')
 
-# Databases
-AGENT_BOOK = AgentBook(os.path.join(_BASE_DIR, 'agentbook.sqlite'))
-ZONE_BOOK = ZoneBook(os.path.join(_BASE_DIR, 'zonebook.sqlite'))
-
 # Config files
 SCOUT_CONF = os.path.join(_BASE_DIR, 'scout.conf')
 OUTPOST_LIST = os.path.join(_BASE_DIR, 'outpost.list')
 ZOE_CONF = os.path.join(os.environ['ZOE_HOME'], 'etc', 'zoe.conf')
 ZOE_USERS = os.path.join(os.environ['ZOE_HOME'], 'etc', 'zoe-users.conf')
 
+# Parsed config files
+CONFIG_CACHE = ConfigCache()
+
+# Databases, stored with the engine set in the `storage` key of the general
+# section of scout.conf (sqlite or log)
+STORAGE_ENGINE = CONFIG_CACHE.get(SCOUT_CONF, ScoutSettings).general.get(
+        'storage', 'sqlite')
+
+_agent_storage, _zone_storage = open_storage(STORAGE_ENGINE, _BASE_DIR)
+
+AGENT_BOOK = AgentBook(_agent_storage)
+ZONE_BOOK = ZoneBook(_zone_storage)
+
 # Base rules directory
 RULES_DIR = os.path.join(_BASE_DIR, 'rules')
 
+# External balancing algorithms
+BALANCERS_DIR = os.path.join(_BASE_DIR, 'balancers')
+
 # Zoe launcher script
 _script_path = os.path.join(os.environ['ZOE_HOME'], 'zoe')
 _fallback_script_path = os.path.join(os.environ['ZOE_HOME'], 'zoe.sh')
@@ -48,4 +67,17 @@ else:
     ZOE_LAUNCHER = _fallback_script_path
 
 # Load balancer
-BALANCER = Balancer() 
+BALANCER = Balancer()
+BALANCER.load_plugins(BALANCERS_DIR)
+
+# Shared SSH sessions to the outposts
+SSH_POOL = SSHPool()
+
+# Agent demand history and prediction
+FORECASTER = Forecaster()
+
+# Deferred message replays in progress
+REPLAYS = ReplayTracker()
+
+# Phases of the migrations in progress, kept across restarts
+MIGRATIONS = MigrationJournal(os.path.join(_BASE_DIR, 'migrations.journal'))
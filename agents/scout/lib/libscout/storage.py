@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Storage engines of the agent and zone books."""
+
+import collections
+import os
+
+# Available engines
+ENGINES = ('sqlite', 'log')
+
+# Read-only records of the zone model
+AgentState = collections.namedtuple('AgentState',
+        ['name', 'location', 'mips', 'memory', 'bandwidth', 'timestamp'])
+OutpostState = collections.namedtuple('OutpostState',
+        ['name', 'is_running', 'timestamp'])
+
+# Resolutions (seconds) of the resource history rollups
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+
+
+class AgentStorage(object):
+    """ Persistence of deferred messages and serialized information of the
+        agents, used by AgentBook.
+
+        Messages are dicts with `agent`, `seq` (sequence number, increasing
+        in insertion order), `timestamp` and `message` (raw message) keys.
+    """
+
+    def append_messages(self, rows, max_messages=None):
+        """ Store messages durably in a single transaction.
+
+            rows         - list of message dicts
+            max_messages - if provided, the oldest messages of each agent
+                           above this number are discarded
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ Release the resources of the storage. """
+        pass
+
+    def delete_info(self, agent):
+        """ Delete the information of an agent.
+
+            Returns False if there was no information.
+
+            agent - agent name
+        """
+        raise NotImplementedError
+
+    def delete_messages(self, agent, upto=None):
+        """ Delete the messages of an agent.
+
+            Returns the number of deleted messages.
+
+            agent - agent name
+            upto  - only delete messages with a sequence number lower or
+                    equal to this one
+        """
+        raise NotImplementedError
+
+    def export_data(self):
+        """ Return a dict with the `info` of each agent and an iterable of
+            every stored message (`messages`), used for migrating between
+            engines.
+        """
+        raise NotImplementedError
+
+    def get_info(self, agent):
+        """ Return the information of an agent (None if there is none).
+
+            agent - agent name
+        """
+        raise NotImplementedError
+
+    def get_messages(self, agent, after=0, limit=None):
+        """ Return the messages of an agent in insertion order, as a list of
+            (sequence number, message) tuples.
+
+            agent - agent name
+            after - only return messages with a greater sequence number
+            limit - maximum number of messages to return
+        """
+        raise NotImplementedError
+
+    def import_data(self, data):
+        """ Store the data obtained from `export_data()`.
+
+            data - dict with `info` and `messages`
+        """
+        raise NotImplementedError
+
+    def max_seq(self):
+        """ Return the greatest sequence number stored (0 if none). """
+        raise NotImplementedError
+
+    def purge_messages(self, before):
+        """ Delete messages stored before the given time.
+
+            Returns the number of deleted messages.
+
+            before - seconds since epoch
+        """
+        raise NotImplementedError
+
+    def put_info(self, agent, info):
+        """ Store the information of an agent.
+
+            Returns False if the agent already had information stored.
+
+            agent - agent name
+            info  - raw message with the information
+        """
+        raise NotImplementedError
+
+
+class ZoneStorage(object):
+    """ Persistence of outposts, agents, resource history, traffic and
+        migrations, used by ZoneBook.
+
+        Samples are dicts with `agent`, `timestamp`, `mips`, `memory` and
+        `bandwidth` keys (memory and bandwidth are None if they were not
+        measured). Rollups aggregate the samples of each agent in buckets of
+        ROLLUP_RESOLUTIONS seconds and are dicts with `bucket` (start time),
+        `samples` (count), `mips_sum`, `mips_max`, `memory_sum`,
+        `bandwidth_sum`, `memory_samples` and `bandwidth_samples` (number
+        of samples with memory and bandwidth measurements) keys.
+    """
+
+    def close(self):
+        """ Release the resources of the storage. """
+        pass
+
+    def count_samples(self, agent, start, end):
+        """ Return the number of samples of an agent in a time range.
+
+            agent - agent name
+            start - start of the range (seconds since epoch)
+            end   - end of the range (seconds since epoch)
+        """
+        raise NotImplementedError
+
+    def export_data(self):
+        """ Return a dict with iterables of `outposts` (OutpostState),
+            `agents` (AgentState), `traffic` ((src, dst, rate) tuples),
+            `samples`, `rollups` (dicts that also have `agent` and
+            `resolution`) and `migrations`, used for migrating between
+            engines.
+        """
+        raise NotImplementedError
+
+    def get_migration_stats(self, agent=None):
+        """ Obtain average timings of past migrations (see
+            `ZoneBook.get_migration_stats()`).
+
+            agent - only take into account migrations of this agent
+        """
+        raise NotImplementedError
+
+    def get_rollups(self, agent, resolution, start, end):
+        """ Return the rollups of an agent with buckets in a time range, in
+            chronological order.
+
+            agent      - agent name
+            resolution - seconds of each bucket
+            start      - start of the range (seconds since epoch)
+            end        - end of the range (seconds since epoch)
+        """
+        raise NotImplementedError
+
+    def get_samples(self, agent, start, end):
+        """ Return the samples of an agent in a time range, in chronological
+            order.
+
+            agent - agent name
+            start - start of the range (seconds since epoch)
+            end   - end of the range (seconds since epoch)
+        """
+        raise NotImplementedError
+
+    def get_traffic_matrix(self):
+        """ Return a dict with the messages per second exchanged between
+            agents, with (src, dst) tuples as keys.
+        """
+        raise NotImplementedError
+
+    def import_data(self, data):
+        """ Store the data obtained from `export_data()`.
+
+            data - dict with the iterables of each kind of data
+        """
+        raise NotImplementedError
+
+    def load(self):
+        """ Return a tuple with the list of OutpostState and the list of
+            AgentState stored.
+        """
+        raise NotImplementedError
+
+    def oldest_rollup(self, agent, resolution):
+        """ Return the start of the oldest bucket of an agent (None if there
+            are no rollups).
+
+            agent      - agent name
+            resolution - seconds of each bucket
+        """
+        raise NotImplementedError
+
+    def oldest_sample(self, agent):
+        """ Return the time of the oldest sample of an agent (None if there
+            are no samples).
+
+            agent - agent name
+        """
+        raise NotImplementedError
+
+    def purge_resources(self, before):
+        """ Delete samples and rollups older than the given times.
+
+            Returns the number of deleted samples and rollups.
+
+            before - dict with the time (seconds since epoch) before which
+                     raw samples (key 0) and the rollups of each resolution
+                     are deleted
+        """
+        raise NotImplementedError
+
+    def write_location(self, name, location):
+        """ Change the location of an agent.
+
+            name     - agent name
+            location - outpost name
+        """
+        raise NotImplementedError
+
+    def write_migration(self, row):
+        """ Store a completed migration.
+
+            row - dict with `agent`, `origin`, `destination`, `size`,
+                  `downtime`, `transfer`, `phases` (JSON) and `timestamp`
+        """
+        raise NotImplementedError
+
+    def write_refresh(self, outposts, agents, removed):
+        """ Add outposts and agents (in central) and remove agents in a
+            single transaction.
+
+            outposts - names of the outposts to add
+            agents   - names of the agents to add
+            removed  - names of the agents to remove
+        """
+        raise NotImplementedError
+
+    def write_resources(self, samples, traffic):
+        """ Store the latest resources of the agents, their history and the
+            traffic they received in a single transaction.
+
+            samples - list of sample dicts (resources other than `mips` may
+                      be missing)
+            traffic - dict with the messages per second received by each
+                      agent from each sender
+        """
+        raise NotImplementedError
+
+    def write_running(self, name, value):
+        """ Change the running status of an outpost.
+
+            name  - outpost name
+            value - whether the outpost is running
+        """
+        raise NotImplementedError
+
+
+def open_storage(engine, directory):
+    """ Open the storage of the agent and zone books.
+
+        Returns a tuple with the AgentStorage and the ZoneStorage.
+
+        engine    - name of the engine (see ENGINES)
+        directory - directory in which the data is stored
+    """
+    agent_path, zone_path = storage_paths(engine, directory)
+
+    if engine == 'sqlite':
+        from libscout.sqlstore import SqliteAgentStorage, SqliteZoneStorage
+
+        return SqliteAgentStorage(agent_path), SqliteZoneStorage(zone_path)
+
+    if engine == 'log':
+        from libscout.logstore import LogAgentStorage, LogZoneStorage
+
+        return LogAgentStorage(agent_path), LogZoneStorage(zone_path)
+
+    raise ValueError('unknown storage engine "%s"' % engine)
+
+def storage_paths(engine, directory):
+    """ Return a tuple with the paths of the agent and zone books for an
+        engine (files for sqlite, directories for log).
+
+        engine    - name of the engine (see ENGINES)
+        directory - directory in which the data is stored
+    """
+    extension = {'sqlite': 'sqlite', 'log': 'log'}.get(engine, engine)
+
+    return (os.path.join(directory, 'agentbook.%s' % extension),
+            os.path.join(directory, 'zonebook.%s' % extension))
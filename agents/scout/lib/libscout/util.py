@@ -19,12 +19,14 @@
 """Utility functions."""
 
 import base64
+import concurrent.futures
 import configparser
+import json
 import os
-import paramiko
 import pickle
 import re
 import scp
+import shlex
 import shutil
 import subprocess
 import time
@@ -33,8 +35,10 @@ from os import environ as env
 from os.path import join as path
 
 from libscout import get_logger
+from libscout.config import OutpostList, ScoutSettings, UserList, ZoeSettings
 from libscout.static import \
-        ZONE_BOOK, SCOUT_CONF, OUTPOST_LIST, RULES_DIR, ZOE_LAUNCHER
+        ZONE_BOOK, SCOUT_CONF, OUTPOST_LIST, ZOE_CONF, ZOE_USERS, \
+        RULES_DIR, ZOE_LAUNCHER, SSH_POOL, CONFIG_CACHE, FORECASTER
 
 # Logging
 scoutlog = get_logger('libscout.util')
@@ -42,6 +46,58 @@ scoutlog = get_logger('libscout.util')
 # Serialization padding character
 PAD_CHAR = '['
 
+# Default maximum number of threads used when fanning out to outposts
+FANOUT_WORKERS = 64
+
+# Prefix of the result lines in the output of batched command scripts
+SCRIPT_MARKER = '@@scout-result'
+
+# Seconds after which the traffic measured by an agent is considered outdated
+TRAFFIC_MAX_AGE = 180
+
+
+def build_command_script(commands, directory=None, abort=False):
+    """ Build a shell script that executes the given commands and reports
+        the exit code, duration (nanoseconds) and standard error of each of
+        them in a line starting with `SCRIPT_MARKER`.
+
+        Every command is executed in its own subshell so that changes in the
+        working directory or environment do not affect the next one.
+
+        Durations have second resolution where `date` does not support
+        nanoseconds (`%N` is GNU only).
+
+        commands  - list of commands to execute
+        directory - working directory for the commands (if any)
+        abort     - stop the script after the first failed command
+    """
+    script = [
+        '__scout_err=$(mktemp)',
+        '__scout_now() { __scout_t=$(date +%s%N); case "$__scout_t" in '
+        '*[!0-9]*) echo "$(($(date +%s) * 1000000000))";; '
+        '*) echo "$__scout_t";; esac; }'
+    ]
+
+    if directory:
+        script.append('cd %s || exit 127' % shlex.quote(directory))
+
+    for index, cmd in enumerate(commands):
+        script.append('__scout_start=$(__scout_now)')
+        script.append('(\n%s\n) 2>"$__scout_err"' % cmd)
+        script.append('__scout_rc=$?')
+        script.append('__scout_end=$(__scout_now)')
+        script.append(
+            'printf "\\n%s %d %%d %%d " "$__scout_rc" '
+            '"$((__scout_end - __scout_start))"' % (SCRIPT_MARKER, index))
+        script.append('base64 "$__scout_err" | tr -d "\\n"; echo')
+
+        if abort:
+            script.append('if [ "$__scout_rc" -ne 0 ]; then '
+                'rm -f "$__scout_err"; exit "$__scout_rc"; fi')
+
+    script.append('rm -f "$__scout_err"')
+
+    return '\n'.join(script)
 
 def close_tunnel(conf, name):
     """ Close the SSH tunnel to a given outpost.
@@ -109,6 +165,39 @@ def deserialize(data):
     # return pickle.loads(base64.b64decode(data.encode()))
     return pickle.loads(base64.b64decode(data.replace(PAD_CHAR, '=').encode()))
 
+def fan_out(func, items, max_workers=FANOUT_WORKERS):
+    """ Call a function for every item in parallel using a bounded thread
+        pool and wait for all of them to finish.
+
+        Returns a dict with the item as key and the value returned by the
+        function. If the call raised an exception, the value is None.
+
+        func        - function that receives a single item
+        items       - list of (hashable) items, usually outpost names
+        max_workers - maximum number of concurrent threads
+    """
+    results = {}
+
+    if not items:
+        return results
+
+    workers = max(1, min(max_workers, len(items)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, item): item for item in items}
+
+        for future in concurrent.futures.as_completed(futures):
+            item = futures[future]
+
+            try:
+                results[item] = future.result()
+
+            except Exception as e:
+                scoutlog.exception('error while processing %s' % item)
+                results[item] = None
+
+    return results
+
 def gather_info_agents(agents, perf_path):
     """ Gather MIPS information for all agents
         Use pickle so that objects with multiple items can be sent as one.
@@ -119,7 +208,7 @@ def gather_info_agents(agents, perf_path):
         Returns a  dict with the information with agent name as key
         if no error occured.
     """
-    scoutlog.info('gathering MIPS')
+    scoutlog.info('gathering MIPS, memory and traffic')
     procs = []
     info = {}
     SLEEP_TIME = 10 # seconds
@@ -137,6 +226,13 @@ def gather_info_agents(agents, perf_path):
         with open(pid_file, 'r') as f:
             pid = f.read().strip()
 
+        # Resident memory and message bandwidth
+        bandwidth, peers = get_agent_traffic(agent)
+
+        info['memory-'+agent] = serialize(get_agent_memory(pid))
+        info['traffic-'+agent] = serialize(bandwidth)
+        info['peers-'+agent] = serialize(peers)
+
         agent_perf = path(env['ZOE_VAR'], agent + '.perf')
         with open(agent_perf, 'w') as lf:
             proc = subprocess.Popen([
@@ -190,6 +286,129 @@ def gather_info_agents(agents, perf_path):
 
     return info
 
+def get_agent_memory(pid):
+    """ Obtain the resident memory (bytes) of a process, 0 if unknown.
+
+        pid - PID of the process
+    """
+    try:
+        with open('/proc/%s/status' % pid, 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    # Value in kB
+                    return int(line.split()[1]) * 1024
+
+    except (OSError, IndexError, ValueError):
+        scoutlog.warning('could not read memory of process %s' % pid)
+
+    return 0
+
+def get_agent_size(agent, location):
+    """ Estimate the bytes of static and dynamic files that have to be
+        moved when migrating an agent.
+
+        Only local files can be measured: static files are read from
+        ZOE_HOME when the agent is in central and from its backup directory
+        otherwise, while dynamic files can only be measured in central.
+
+        Returns a tuple with (static bytes, dynamic bytes), where the second
+        value is None if it could not be measured.
+
+        agent    - agent name
+        location - current location of the agent
+    """
+    if location == 'central':
+        base = os.environ['ZOE_HOME']
+    else:
+        base = os.path.join(RULES_DIR, agent, 'backup')
+
+    try:
+        static_size = get_files_size(
+                [os.path.join(base, p) for p in get_static_list(agent)])
+
+    except OSError:
+        static_size = 0
+
+    if location != 'central':
+        return static_size, None
+
+    dynamic_size = get_files_size([os.path.join(base, p)
+        for p in get_dynamic_list(agent)])
+
+    return static_size, dynamic_size
+
+def get_agent_traffic(agent):
+    """ Obtain the traffic measured by an agent.
+
+        Returns a tuple with the message bandwidth (received bytes per
+        second) and a dict with the messages per second received from each
+        sender. Unknown or outdated values are returned as 0 and {}.
+
+        agent - agent name
+    """
+    traffic_file = path(env['ZOE_VAR'], agent + '.traffic')
+
+    try:
+        if time.time() - os.path.getmtime(traffic_file) > TRAFFIC_MAX_AGE:
+            return 0.0, {}
+
+        with open(traffic_file, 'r') as f:
+            traffic = json.load(f)
+
+        return float(traffic['bandwidth']), traffic.get('peers', {})
+
+    except (OSError, ValueError, TypeError, KeyError):
+        return 0.0, {}
+
+def get_dir_stamp(path):
+    """ Obtain the modification time of a directory, which changes when
+        entries are added or removed (None if it does not exist).
+
+        path - path to the directory
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+
+    except OSError:
+        return None
+
+def get_dynamic_list(agent):
+    """ Obtain a list of dynamic files for an agent (may be empty).
+
+        agent - agent name
+    """
+    dynamic_path = os.path.join(RULES_DIR, agent, 'dynamic')
+
+    if not os.path.isfile(dynamic_path):
+        return []
+
+    with open(dynamic_path, 'r') as f:
+        return f.read().splitlines()
+
+def get_files_size(paths):
+    """ Compute the total size in bytes of the given files and directories.
+
+        Paths that do not exist are ignored.
+
+        paths - list of absolute paths
+    """
+    total = 0
+
+    for p in paths:
+        if os.path.isdir(p):
+            for root, dirs, files in os.walk(p):
+                for f in files:
+                    try:
+                        total += os.path.getsize(os.path.join(root, f))
+
+                    except OSError:
+                        pass
+
+        elif os.path.isfile(p):
+            total += os.path.getsize(p)
+
+    return total
+
 def get_static_list(agent):
     """ Obtain a list of static files for an agent.
 
@@ -231,20 +450,14 @@ def launch_outpost(conf, name):
     directory = conf['directory']
 
     try:
-        # Establish connection
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(host, username=username, timeout=10)
-
-        # Launch outpost
-        scoutlog.info('launching outpost: %s' % name)
-        cmd = 'cd %s; ./outpost.sh restart' % directory
+        with SSH_POOL.session(host, username) as ssh:
+            # Launch outpost
+            scoutlog.info('launching outpost: %s' % name)
+            cmd = 'cd %s; ./outpost.sh restart' % directory
 
-        # Wait for the command to complete (stdin and stderr are not needed)
-        _, stdout, _ = ssh.exec_command(cmd)
-        stdout.channel.recv_exit_status()
-
-        ssh.close()
+            # Wait for the command to complete (stdin and stderr are not needed)
+            _, stdout, _ = ssh.exec_command(cmd)
+            stdout.channel.recv_exit_status()
 
     except Exception as e:
         scoutlog.exception('error while launching outpost %s' % name)
@@ -252,6 +465,41 @@ def launch_outpost(conf, name):
 
     return True
 
+def load_forecast_history():
+    """ Fill the forecaster with the resource history stored in the zone
+        book, so that predictions survive restarts of the scout.
+    """
+    history_days = load_scout_conf().get_int('history_days', 7, 'forecast')
+
+    now = time.time()
+    start = now - history_days * 86400
+
+    for agent in ZONE_BOOK.get_agents():
+        # Raw samples, and one-minute rollups where they were purged
+        history = ZONE_BOOK.get_demand_history(agent.name, start, now)
+
+        for timestamp, mips in history:
+            FORECASTER.add_sample(agent.name, mips, timestamp, history_days)
+
+        scoutlog.debug('loaded %d samples of agent %s' % (
+            len(history), agent.name))
+
+def load_outpost_list():
+    """ Obtain the (cached) snapshot of the outpost list. """
+    return CONFIG_CACHE.get(OUTPOST_LIST, OutpostList)
+
+def load_scout_conf():
+    """ Obtain the (cached) snapshot of the scout configuration file. """
+    return CONFIG_CACHE.get(SCOUT_CONF, ScoutSettings)
+
+def load_users():
+    """ Obtain the (cached) snapshot of the Zoe users file. """
+    return CONFIG_CACHE.get(ZOE_USERS, UserList)
+
+def load_zoe_conf():
+    """ Obtain the (cached) snapshot of the main Zoe configuration file. """
+    return CONFIG_CACHE.get(ZOE_CONF, ZoeSettings)
+
 def mark_hold_agent(agent):
     """ Update the scout config file to mark an agent as held to its current
         machine.
@@ -373,6 +621,84 @@ def open_tunnel(conf, name):
     scoutlog.info('tunnel is now open')
     return True
 
+def parse_command_results(commands, output):
+    """ Parse the output of a script generated with `build_command_script()`.
+
+        Returns a list of dicts with the following keys for each command that
+        was executed:
+
+            command   - the command
+            exit_code - exit status of the command
+            duration  - execution time in seconds
+            stderr    - standard error output of the command
+
+        commands - list of commands included in the script
+        output   - standard output of the script
+    """
+    results = []
+
+    for line in output.splitlines():
+        if not line.startswith(SCRIPT_MARKER):
+            continue
+
+        fields = line.split(' ')
+        index, exit_code, elapsed = [int(f) for f in fields[1:4]]
+        stderr = fields[4] if len(fields) > 4 else ''
+
+        results.append({
+            'command': commands[index],
+            'exit_code': exit_code,
+            'duration': elapsed / 1000000000,
+            'stderr': base64.b64decode(stderr).decode('utf-8', 'replace')
+        })
+
+    return results
+
+def parse_status_filter(text):
+    """ Parse the filters of the agent status report.
+
+        The text contains words in any order:
+
+            page N      - page to show
+            outpost O   - agents located in outpost O
+            held / free - agents held or free
+            load N      - agents using at least N% of the MIPS of their
+                          location
+
+        Returns a tuple with the dict of filters (None if the text is invalid)
+        and the page.
+
+        text - words with the filters (may be None)
+    """
+    words = (text or '').split()
+
+    filters = {}
+    page = 1
+
+    try:
+        while words:
+            word = words.pop(0)
+
+            if word in ('held', 'hold', 'free'):
+                filters['hold'] = word != 'free'
+
+            elif word == 'outpost':
+                filters['outpost'] = words.pop(0)
+
+            elif word == 'load':
+                filters['load'] = float(words.pop(0).rstrip('%'))
+
+            elif word == 'page':
+                page = int(words.pop(0))
+
+            else:
+                return None, page
+
+    except (IndexError, ValueError):
+        return None, page
+
+    return filters, page
+
 def prepare_backup(agent):
     """ Prepare the directory that is used for central backup and
         for deployment to other machines.
@@ -423,6 +749,32 @@ def prepare_backup(agent):
 
     return True
 
+def read_commands(agent, state):
+    """ Read the commands to execute for an agent in the given state.
+
+        Empty lines are ignored.
+
+        Returns None if the state is not valid and an empty list if there
+        is nothing to do.
+
+        agent - name of the agent
+        state - either 'premig' or 'postmig'
+    """
+    if state != 'premig' and state != 'postmig':
+        scoutlog.error('unknown state "%s"' % state)
+        return None
+
+    cmd_file = os.path.join(RULES_DIR, agent, state)
+
+    if not os.path.isfile(cmd_file):
+        # Not an error, simply nothing to do
+        scoutlog.warning('file for "%s" does not exist' % state)
+
+        return []
+
+    with open(cmd_file, 'r') as f:
+        return [cmd for cmd in f.read().splitlines() if cmd.strip()]
+
 def read_config(path):
     """ Obtain a ConfigParser instance from the given path. """
     conf = configparser.ConfigParser()
@@ -464,8 +816,15 @@ def refresh_scout_conf(agent_list):
     # New agents are added to the free list
     free_list.extend(local_list)
 
-    conf['agents']['hold'] = ' '.join(hold_list)
-    conf['agents']['free'] = ' '.join(free_list)
+    hold = ' '.join(hold_list)
+    free = ' '.join(free_list)
+
+    # Avoid rewriting the file (and invalidating cached copies) if possible
+    if hold == ag_sec['hold'] and free == ag_sec['free']:
+        return
+
+    conf['agents']['hold'] = hold
+    conf['agents']['free'] = free
 
     write_config(SCOUT_CONF, conf)
 
@@ -483,16 +842,11 @@ def remote_get(paths, outpost_host, username):
     """
     scoutlog.info('getting remote files from %s' % outpost_host)
 
-    # Open connection for SSH
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(outpost_host, username=username)
-
-    with scp.SCPClient(ssh.get_transport()) as scopy:
-        for path_tuple in paths:
-            scopy.get(path_tuple[0], path_tuple[1], recursive=True)
-
-    ssh.close()
+    # Reuse the SSH session, SCP runs on its own channel
+    with SSH_POOL.session(outpost_host, username) as ssh:
+        with scp.SCPClient(ssh.get_transport()) as scopy:
+            for path_tuple in paths:
+                scopy.get(path_tuple[0], path_tuple[1], recursive=True)
 
 def remote_put(paths, outpost_host, username):
     """ Copy given path to a remote machine.
@@ -506,25 +860,20 @@ def remote_put(paths, outpost_host, username):
     """
     scoutlog.info('uploading local files to %s' % outpost_host)
 
-    # Open connection for SSH
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(outpost_host, username=username)
-
-    with scp.SCPClient(ssh.get_transport()) as scopy:
-        for path_tuple in paths:
+    # Reuse the SSH session, SCP runs on its own channel
+    with SSH_POOL.session(outpost_host, username) as ssh:
+        with scp.SCPClient(ssh.get_transport()) as scopy:
+            for path_tuple in paths:
 
-            if os.path.isdir(path_tuple[0]):
-                # Copy directory contents
-                for fd in os.listdir(path_tuple[0]):
-                    scopy.put(
-                        os.path.join(path_tuple[0], fd),
-                        path_tuple[1], recursive=True)
+                if os.path.isdir(path_tuple[0]):
+                    # Copy directory contents
+                    for fd in os.listdir(path_tuple[0]):
+                        scopy.put(
+                            os.path.join(path_tuple[0], fd),
+                            path_tuple[1], recursive=True)
 
-            else:
-                scopy.put(path_tuple[0], path_tuple[1])
-
-    ssh.close()
+                else:
+                    scopy.put(path_tuple[0], path_tuple[1])
 
 def remove_local_files(agent):
     """ Remove local static files taking into account the static rules for the
@@ -545,10 +894,21 @@ def remove_local_files(agent):
                 # Remove tree
                 shutil.rmtree(real_path)
 
-            else:
-                # Remove file
+            elif os.path.exists(real_path):
+                # Remove file (may be gone if the removal is being resumed)
                 os.remove(real_path)
 
+def remove_backup(agent):
+    """ Remove the backup directory of an agent (if any).
+
+        agent - name of the agent
+    """
+    backup_dir = os.path.join(RULES_DIR, agent, 'backup')
+
+    if os.path.isdir(backup_dir):
+        scoutlog.info('removing backup of agent %s' % agent)
+        shutil.rmtree(backup_dir)
+
 def restore_backup(agent):
     """ When performing a migration to 'central', the backup files are restored
         to their original location.
@@ -591,35 +951,68 @@ def restore_backup(agent):
 
     return True
 
-def run_local_commands(agent, state):
+def run_local_commands(agent, state, batch=True, abort=False):
     """ Run local commands.
 
         Each command is a different line in file 'etc/scout/rules/agent/<state>'
         and is executed in a shell.
 
+        In batch mode, the whole file is executed as a single script that
+        reports the result of every command. Otherwise, a new shell is spawned
+        for each line.
+
+        Returns a tuple with a boolean indicating whether all the commands
+        succeeded and the list of results (see `parse_command_results()`).
+
         agent - name of the agent
         state - either 'premig' or 'postmig'
+        batch - run the commands as a single script
+        abort - stop executing commands after the first failure
     """
-    if state != 'premig' and state != 'postmig':
-        scoutlog.error('unknown state "%s"' % state)
-        return False
+    commands = read_commands(agent, state)
 
-    cmd_file = os.path.join(RULES_DIR, agent, state)
+    if commands is None:
+        return False, []
 
-    if not os.path.isfile(cmd_file):
-        # Not an error, simply nothing to do
-        scoutlog.warning('file for "%s" does not exist' % state)
+    if not commands:
+        return True, []
 
-        return True
+    if batch:
+        scoutlog.info('executing %d %s commands in batch' % (
+            len(commands), state))
+
+        proc = subprocess.Popen(['/bin/sh', '-c',
+            build_command_script(commands, abort=abort)],
+            stdout=subprocess.PIPE, universal_newlines=True)
+
+        output, _ = proc.communicate()
+        results = parse_command_results(commands, output)
+
+    else:
+        results = []
 
-    with open(cmd_file, 'r') as f:
         # Execute and wait for each command
-        for cmd in f.read().splitlines():
+        for cmd in commands:
             scoutlog.info('executing: %s' % cmd)
 
-            subprocess.Popen(cmd, shell=True).wait()
+            start = time.time()
+            proc = subprocess.Popen(cmd, shell=True,
+                    stderr=subprocess.PIPE, universal_newlines=True)
+            _, stderr = proc.communicate()
+
+            results.append({
+                'command': cmd,
+                'exit_code': proc.returncode,
+                'duration': time.time() - start,
+                'stderr': stderr
+            })
 
-def run_remote_commands(agent, state, outpost_conf):
+            if abort and proc.returncode != 0:
+                break
+
+    return _check_command_results(agent, state, commands, results)
+
+def run_remote_commands(agent, state, outpost_conf, batch=True, abort=False):
     """ Run remote commands through SSH.
 
         Each command is a different line in file 'etc/scout/rules/agent/<state>'
@@ -628,46 +1021,72 @@ def run_remote_commands(agent, state, outpost_conf):
         Given that no path is exported, ${ZOE_HOME} is replace manually
         with the outpost root prior to executing the command.
 
+        In batch mode, the whole file is sent as a single script in one
+        round-trip. Otherwise, each line is executed in a different channel.
+
+        Returns a tuple with a boolean indicating whether all the commands
+        succeeded and the list of results (see `parse_command_results()`).
+
         agent        - name of the agent
         state        - either 'premig' or 'postmig'
         outpost_conf - ConfigParser section for the outpost
+        batch        - run the commands as a single script
+        abort        - stop executing commands after the first failure
     """
-    if state != 'premig' and state != 'postmig':
-        scoutlog.error('unknown state "%s"' % state)
+    commands = read_commands(agent, state)
 
-        return False
-
-    cmd_file = os.path.join(RULES_DIR, agent, state)
-
-    if not os.path.isfile(cmd_file):
-        # Not an error, simply nothing to do
-        scoutlog.warning('file for "%s" does not exist' % state)
+    if commands is None:
+        return False, []
 
-        return True
+    if not commands:
+        return True, []
 
     host = outpost_conf['host']
     username = outpost_conf.get('username')
     directory = outpost_conf['directory']
 
-    # Open connection for SSH
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(host, username=username)
+    # Replace ${ZOE_HOME} with outpost Zoe home directory
+    commands = [cmd.replace('${ZOE_HOME}', directory) for cmd in commands]
 
-    with open(cmd_file, 'r') as f:
-        # Execute and wait for each command
-        for cmd in f.read().splitlines():
-            scoutlog.info('executing: %s' % cmd)
+    # Each command is a new channel in the same SSH session
+    with SSH_POOL.session(host, username) as ssh:
+        if batch:
+            scoutlog.info('executing %d %s commands in batch' % (
+                len(commands), state))
 
-            # Replace ${ZOE_HOME} with outpost Zoe home directory
-            cmd = cmd.replace('${ZOE_HOME}', directory)
+            _, stdout, _ = ssh.exec_command(
+                    build_command_script(commands, directory, abort))
 
-            _, stdout, _ = ssh.exec_command('cd %s; %s' % (directory, cmd))
+            output = stdout.read().decode('utf-8', 'replace')
             stdout.channel.recv_exit_status()
 
-    ssh.close()
+            results = parse_command_results(commands, output)
 
-    return True
+        else:
+            results = []
+
+            # Execute and wait for each command
+            for cmd in commands:
+                scoutlog.info('executing: %s' % cmd)
+
+                start = time.time()
+                _, stdout, stderr = ssh.exec_command(
+                        'cd %s; %s' % (directory, cmd))
+
+                errors = stderr.read().decode('utf-8', 'replace')
+                exit_code = stdout.channel.recv_exit_status()
+
+                results.append({
+                    'command': cmd,
+                    'exit_code': exit_code,
+                    'duration': time.time() - start,
+                    'stderr': errors
+                })
+
+                if abort and exit_code != 0:
+                    break
+
+    return _check_command_results(agent, state, commands, results)
 
 def serialize(data):
     """ Serialize the given data using pickle and converting it to a base64
@@ -693,20 +1112,14 @@ def stop_outpost(conf, outpost_id):
     directory = conf['directory']
 
     try:
-        # Establish connection
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(host, username=username)
-
-        # Launch outpost
-        scoutlog.info('stopping outpost: %s' % outpost_id)
-        cmd = 'cd %s; ./outpost.sh stop' % directory
-
-        # Wait for the command to complete (stdin and stderr are not needed)
-        _, stdout, _ = ssh.exec_command(cmd)
-        stdout.channel.recv_exit_status()
+        with SSH_POOL.session(host, username) as ssh:
+            # Stop outpost
+            scoutlog.info('stopping outpost: %s' % outpost_id)
+            cmd = 'cd %s; ./outpost.sh stop' % directory
 
-        ssh.close()
+            # Wait for the command to complete (stdin and stderr are not needed)
+            _, stdout, _ = ssh.exec_command(cmd)
+            stdout.channel.recv_exit_status()
 
     except Exception as e:
         scoutlog.exception('error while stopping outpost %s' % outpost_id)
@@ -717,31 +1130,92 @@ def stop_outpost(conf, outpost_id):
 def store_gathered_info_agents(info):
     """ Store the agent's gathered resource information in the zone book.
 
-        info - MIPS of the agents in a dict with `agent-NAME` as key
+        All the agents of the message are stored in a single transaction.
+
+        info - MIPS of the agents in a dict with `agent-NAME` as key, memory
+               with `memory-NAME`, bandwidth with `traffic-NAME` and messages
+               per second received from each sender with `peers-NAME`
     """
+    history_days = load_scout_conf().get_int('history_days', 7, 'forecast')
+
+    # Timestamp (stored as float of seconds since epoch)
+    timestamp = time.time()
+
+    samples = []
+    traffic = {}
+
     for key in filter(
         (lambda a: a.startswith('agent-')), info.keys()):
 
         # Remove prefix
         agent = key.replace('agent-', '', 1)
 
-        kwargs = {}
+        sample = {
+            'agent': agent,
+            'mips': deserialize(info[key]),
+            'timestamp': timestamp
+        }
 
-        # MIPS
-        kwargs['mips'] = deserialize(info[key])
+        # Memory and bandwidth (may not be sent by older outposts)
+        if 'memory-' + agent in info:
+            sample['memory'] = deserialize(info['memory-' + agent])
 
-        # Timestamp (stored as float of seconds since epoch)
-        kwargs['timestamp'] = time.time()
+        if 'traffic-' + agent in info:
+            sample['bandwidth'] = deserialize(info['traffic-' + agent])
 
-        if ZONE_BOOK.store_agent_resources(agent, **kwargs):
-            scoutlog.info('updated resource information for agent %s' % agent)
-            scoutlog.status('resources of agent "%s"; MIPS: %f' % (
-                agent, kwargs['mips']))
+        # Messages received from other agents
+        if 'peers-' + agent in info:
+            traffic[agent] = deserialize(info['peers-' + agent])
 
-        else:
-            scoutlog.info('failed to update resources for agent %s' % agent)
+        # Keep history for demand prediction
+        FORECASTER.add_sample(agent, sample['mips'], timestamp, history_days)
+
+        samples.append(sample)
+
+    if not samples:
+        return
+
+    ZONE_BOOK.store_resources(samples, traffic)
+
+    for sample in samples:
+        scoutlog.info('updated resource information for agent %s' % (
+            sample['agent']))
+        scoutlog.status('resources of agent "%s"; MIPS: %f' % (
+            sample['agent'], sample['mips']))
 
 def write_config(path, conf):
     """ Write the given ConfigParser instance to the specified path. """
     with open(path, 'w') as f:
         conf.write(f)
+
+    # Do not rely on the resolution of the modification time
+    CONFIG_CACHE.invalidate(path)
+
+def _check_command_results(agent, state, commands, results):
+    """ Log the results of the executed commands and check whether all of
+        them were executed successfully.
+
+        Returns a tuple with the status and the list of results.
+
+        agent    - name of the agent
+        state    - either 'premig' or 'postmig'
+        commands - list of commands that were to be executed
+        results  - list of results of the executed commands
+    """
+    status = len(results) == len(commands)
+
+    for result in results:
+        scoutlog.debug('"%s" exited with %d in %.3f seconds' % (
+            result['command'], result['exit_code'], result['duration']))
+
+        if result['exit_code'] != 0:
+            status = False
+            scoutlog.error('%s command of agent %s failed (%d): %s\n%s' % (
+                state, agent, result['exit_code'], result['command'],
+                result['stderr']))
+
+    if len(results) < len(commands):
+        scoutlog.warning('%d %s commands of agent %s were not executed' % (
+            len(commands) - len(results), state, agent))
+
+    return status, results
@@ -27,11 +27,11 @@ import threading
 import time
 import zoe
 from zoe.deco import Agent, Message, Timed
-from zoe.models.users import Users
 
 # Helpful namespaces
 from libscout import get_logger
 from libscout import messages as scoutmsg
+from libscout import planner as scoutplan
 from libscout import static as scoutatic
 from libscout import util as scoutil
 
@@ -40,7 +40,6 @@ from libscout import util as scoutil
 LOCK_AGENT_BOOK = threading.Lock()
 LOCK_ZONE_BOOK = threading.Lock()
 LOCK_SCOUT_CONF = threading.Lock()
-LOCK_OUTPOST_LIST = threading.Lock()
 LOCK_MIGRATION = threading.Lock()
 
 # Logging
@@ -52,46 +51,44 @@ class Scout:
 
     def __init__(self):
         self._starting = True
+        # Migrations are not started until the interrupted ones have been
+        # recovered, the lock is released by `recover_migrations()`
+        LOCK_MIGRATION.acquire()
+        self._recovering = True
+        # Outposts after the last balancing (incremental balancing)
+        self._balance_state = scoutplan.BalanceState()
+        # Rules directory and outposts of the last zone book refresh
+        self._refresh_stamp = None
+
         # Refresh the configurations and zone book
         self.refresh_info()
 
-        # Open the tunnels
-        # scoutil.open_tunnels()
-
-        # Launch the outposts
-        # scoutil.launch_outposts()
-
-        # Open tunnels and launch outposts
-        outpost_list = scoutil.read_config(scoutatic.OUTPOST_LIST)
-        for outpost in filter(
-                (lambda o: o.startswith('outpost ')), outpost_list.sections()):
-
-            name = outpost.replace('outpost ', '', 1)
-            scoutlog.info('opening tunnel and launching %s' % name)
-
-            # Open tunnel
-            if not scoutil.open_tunnel(outpost_list[outpost], name):
-                scoutlog.error('failed to open tunnel to outpost %s' % name)
-
-                # Set as 'not running'
-                scoutatic.ZONE_BOOK.set_outpost_running(name, False)
-                continue
+        # Demand history for the forecaster
+        with LOCK_ZONE_BOOK:
+            scoutil.load_forecast_history()
 
-            # Launch outpost
-            if not scoutil.launch_outpost(outpost_list[outpost], name):
-                scoutlog.error('failed to launch outpost %s' % name)
+        # Open tunnels and launch outposts in parallel
+        outpost_list = scoutil.load_outpost_list()
+        names = outpost_list.names()
 
-                # Set as 'not running'
-                scoutatic.ZONE_BOOK.set_outpost_running(name, False)
-                continue
+        started = scoutil.fan_out(
+                (lambda name: self._start_outpost(outpost_list[name], name)),
+                names, self._fanout_workers())
 
-            # Set as running
-            scoutatic.ZONE_BOOK.set_outpost_running(name, True)
+        # Update running status
+        for name in names:
+            scoutatic.ZONE_BOOK.set_outpost_running(
+                    name, bool(started.get(name)))
 
     @Timed(600)
     def balance_agents(self):
         """ Periodic method that determines best location for the agents given
             available outposts information and moves them around.
+
+            When `incremental` is enabled in scout.conf, only the agents of
+            outposts whose agents changed or whose load moved more than
+            `rebalance_threshold` since the last run are re-placed, and
+            every outpost is balanced once every `full_balance_every` runs.
         """
         # Skip first iteration
         if self._starting:
@@ -100,117 +97,98 @@ class Scout:
 
         scoutlog.info('starting agent balancing')
 
-        with LOCK_OUTPOST_LIST:
-            outposts = scoutil.read_config(scoutatic.OUTPOST_LIST)
-
-        with LOCK_SCOUT_CONF:
-            conf = scoutil.read_config(scoutatic.SCOUT_CONF)
-
-        outpost_map = {}
+        outposts = scoutil.load_outpost_list()
+        conf = scoutil.load_scout_conf()
 
         with LOCK_MIGRATION:
             # Get algorithm to use
-            alg_name = conf['general'].get('balance', None)
+            alg_name = conf.balance
             if not alg_name:
                 scoutlog.info('load balancing not enabled')
                 return
 
-            algorithm = scoutatic.BALANCER.get_algorithm(alg_name)
+            algorithm = scoutatic.BALANCER.get_algorithm(
+                    alg_name, conf.balancer_options(alg_name))
             if not algorithm:
                 scoutlog.error('unknown algorithm "%s"' % alg_name)
                 return
 
             scoutlog.info('using algorithm: "%s"' % alg_name)
 
-            # Get current locations and information of outposts
-            for s in filter(
-                (lambda o: o.startswith('outpost ')), outposts.sections()):
+            # Get current locations and information of running outposts
+            outpost_map = scoutplan.build_outpost_map(
+                    outposts, conf, self._running_outposts(outposts))
 
-                # Mind the blank space
-                outpost = s.replace('outpost ', '', 1)
+            if conf.get_bool('incremental', False):
+                balance_map, changed = self._balance_state.restrict(
+                        outpost_map,
+                        conf.get_float('rebalance_threshold', 0.1),
+                        conf.get_int('full_balance_every', 6))
 
-                # Check if running
-                if not scoutatic.ZONE_BOOK.is_outpost_running(outpost):
-                    err_msg = 'outpost %s is not running'
-                    scoutlog.warning(err_msg)
-                    continue
-
-                agents = scoutatic.ZONE_BOOK.get_agents_in(outpost)
-
-                # Store agents and config information in outpost map
-                outpost_map[outpost] = {'agents': {}}
-
-                for key in outposts[s]:
-                    outpost_map[outpost][key] = outposts[s][key]
+            else:
+                self._balance_state.reset()
+                balance_map, changed = outpost_map, outpost_map.keys()
 
-                for agent in agents:
-                    # Can the agent be moved?
-                    if agent.name in conf['agents']['free']:
-                        is_free = True
-                    else:
-                        is_free = False
+            if not changed:
+                scoutlog.info('no outpost changed since last balancing')
+                return
 
-                    outpost_map[outpost]['agents'][agent.name] = {
-                        'location': outpost,
-                        'mips': agent.mips,
-                        'timestamp': agent.timestamp,
-                        'is_free': is_free
-                    }
+            # Execute the balancing algorithm and check new locations
+            scoutlog.info('executing balancing algorithm')
+            balanced_map = algorithm(balance_map.copy())
 
-            # Information on Central
-            agents = scoutatic.ZONE_BOOK.get_agents_in('central')
+            scoutlog.debug('balance result: ' + str(balanced_map))
 
-            # Store agents and config information in outpost map
-            outpost_map['central'] = {'agents': {}}
+            # Compare locations to see what agents must be moved
+            migrations = scoutplan.get_migrations(balance_map, balanced_map)
 
-            for key in conf['general']:
-                outpost_map['central'][key] = conf['general'][key]
+            self._balance_state.update(outpost_map, migrations)
 
-            for agent in agents:
-                # Can the agent be moved?
-                if agent.name in conf['agents']['free']:
-                    is_free = True
-                else:
-                    is_free = False
+        # Run migrations
+        scoutlog.info('starting agent migrations...')
 
-                outpost_map['central']['agents'][agent.name] = {
-                    'location': 'central',
-                    'mips': agent.mips,
-                    'timestamp': agent.timestamp,
-                    'is_free': is_free
-                }
+        for mig in migrations:
+            self.migrate_agent(mig)
 
-            # Execute the balancing algorithm and check new locations
-            scoutlog.info('executing balancing algorithm')
-            balanced_map = algorithm(outpost_map.copy())
+    @Timed(30)
+    def check_replays(self):
+        """ Periodic method that sends again the pages of deferred messages
+            that were not acknowledged within `replay_timeout` seconds.
 
-            scoutlog.debug('balance result: ' + str(balanced_map))
+            After `replay_retries` attempts the replay is abandoned and the
+            remaining messages are kept until the next retrieval.
+        """
+        conf = scoutil.load_scout_conf()
 
-            # Compare locations to see what agents must be moved
-            migrations = []
+        timeout = conf.get_float('replay_timeout', 30.0)
+        retries = conf.get_int('replay_retries', 3)
 
-            for outpost in balanced_map.keys():
-                scoutlog.info('checking migrations to outpost "%s"' % outpost)
+        for agent in scoutatic.REPLAYS.expired(timeout):
+            attempts = scoutatic.REPLAYS.retry(agent)
 
-                new_agents = balanced_map[outpost]
-                current_agents = outpost_map[outpost]['agents'].keys()
+            if attempts is None:
+                # Replay finished meanwhile
+                continue
 
-                incoming = list(set(new_agents) - set(current_agents))
+            if attempts > retries:
+                scoutlog.error(
+                    'agent %s did not acknowledge replayed messages' % agent)
 
-                for inc in incoming:
-                    scoutlog.debug('registering migration of "%s" to %s' % (
-                        inc, outpost))
+                scoutatic.REPLAYS.finish(agent)
+                continue
 
-                    migrations.append({
-                        'outpost_id': outpost,
-                        'agent': inc
-                    })
+            scoutlog.warning('sending replayed messages to %s again' % agent)
+            self._replay_page(agent)
 
-        # Run migrations
-        scoutlog.info('starting agent migrations...')
+    @Timed(60)
+    def check_ssh_sessions(self):
+        """ Periodic method that closes SSH sessions to the outposts that have
+            been idle for too long or are no longer active.
+        """
+        evicted = scoutatic.SSH_POOL.evict_idle()
 
-        for mig in migrations:
-            self.migrate_agent(mig)
+        if evicted:
+            scoutlog.info('closed %d idle SSH sessions' % evicted)
 
     @Timed(180)
     def gather_agent_info(self):
@@ -220,45 +198,79 @@ class Scout:
             relevant outpost.
         """
         # First send to all the outposts
-        with LOCK_OUTPOST_LIST:
-            conf = scoutil.read_config(scoutatic.OUTPOST_LIST)
+        conf = scoutil.load_outpost_list()
 
         scoutlog.info('sending agent gathering messages')
 
-        # Build messages to send
-        for s in filter(
-            (lambda o: o.startswith('outpost ')), conf.sections()):
-
-            # Mind the blank space
-            outpost = s.replace('outpost ', '', 1)
-
-            # Check if running
-            with LOCK_ZONE_BOOK:
-                if not scoutatic.ZONE_BOOK.is_outpost_running(outpost):
-                    err_msg = 'outpost %s is not running'
-                    scoutlog.warning(err_msg)
-                    continue
-
-            # Deliver message
-            self.sendbus(scoutmsg.outpost_gather_agents(outpost))
+        # Deliver messages to all the running outposts
+        scoutil.fan_out(
+                (lambda outpost: self.sendbus(
+                    scoutmsg.outpost_gather_agents(outpost))),
+                self._running_outposts(conf), self._fanout_workers())
 
         scoutlog.info('gathering agents in central')
 
         # Gather info for all agents in central
-        scout_conf = scoutil.read_config(scoutatic.SCOUT_CONF)
-        sys_perf = scout_conf['general']['perf_path']
+        sys_perf = scoutil.load_scout_conf().perf_path
 
-        with LOCK_ZONE_BOOK:
-            agent_list = scoutatic.ZONE_BOOK.get_agent_names_in('central')
+        agent_list = scoutatic.ZONE_BOOK.get_agent_names_in('central')
 
         gathered = scoutil.gather_info_agents(agent_list, sys_perf)
         scoutil.store_gathered_info_agents(gathered)
 
+    @Timed(3600)
+    def purge_messages(self):
+        """ Periodic method that removes deferred messages stored for longer
+            than `message_ttl` days (agents that never settled).
+        """
+        ttl = scoutil.load_scout_conf().get_float('message_ttl', 7.0)
+
+        with LOCK_AGENT_BOOK:
+            scoutatic.AGENT_BOOK.purge_messages(ttl * 86400)
+
+    @Timed(3600)
+    def purge_history(self):
+        """ Periodic method that removes resource history older than the
+            retention configured in the `history` section of scout.conf.
+        """
+        retention = scoutil.load_scout_conf().history_retention()
+
+        with LOCK_ZONE_BOOK:
+            removed = scoutatic.ZONE_BOOK.purge_resources(retention)
+
+        scoutlog.info('removed %d rows of resource history' % removed)
+
+    @Timed(60)
+    def recover_migrations(self):
+        """ Periodic method that resumes or rolls back the migrations that
+            were interrupted when the scout stopped, as recorded in the
+            migration journal.
+
+            The first run happens when the scout starts, with LOCK_MIGRATION
+            held since `__init__()`, so that no other migration is started
+            before. Migrations that cannot be recovered yet (e.g. an outpost
+            is not reachable) are tried again in the next run.
+        """
+        if self._recovering:
+            try:
+                self._recover_interrupted()
+
+            finally:
+                self._recovering = False
+                LOCK_MIGRATION.release()
+
+            return
+
+        with LOCK_MIGRATION:
+            self._recover_interrupted()
+
     @Timed(60)
     def refresh_info(self):
         """ Periodic method that refreshes scout config file and zone book
             to see if agents or outposts have been added.
         """
+        # Stat before listing, a change in between is detected next time
+        rules_stamp = scoutil.get_dir_stamp(scoutatic.RULES_DIR)
         agent_list = os.listdir(scoutatic.RULES_DIR)
 
         scoutlog.info('refreshing scout configuration')
@@ -267,15 +279,33 @@ class Scout:
         with LOCK_SCOUT_CONF:
             scoutil.refresh_scout_conf(agent_list)
 
-        with LOCK_OUTPOST_LIST:
-            outpost_list = scoutil.read_config(scoutatic.OUTPOST_LIST)
+        outpost_list = scoutil.load_outpost_list()
 
-        scoutlog.info('refreshing zone book information')
+        # Check zone book (only if agents or outposts may have changed)
+        stamp = (rules_stamp, tuple(outpost_list.names()))
 
-        # Check zone book
-        with LOCK_ZONE_BOOK:
-            scoutatic.ZONE_BOOK.refresh_agents(agent_list)
-            scoutatic.ZONE_BOOK.refresh_outposts(outpost_list)
+        if stamp == self._refresh_stamp:
+            scoutlog.debug('agents and outposts did not change')
+
+        else:
+            scoutlog.info('refreshing zone book information')
+
+            with LOCK_ZONE_BOOK:
+                removed = set(a.name for a in
+                        scoutatic.ZONE_BOOK.get_agents()) - set(agent_list)
+
+                refreshed = scoutatic.ZONE_BOOK.refresh(
+                        agent_list, outpost_list.names())
+
+            # Demand history of agents that no longer exist
+            for agent in removed:
+                scoutatic.FORECASTER.forget(agent)
+
+            if refreshed:
+                self._refresh_stamp = stamp
+
+        # New or modified balancing algorithms
+        scoutatic.BALANCER.load_plugins(scoutatic.BALANCERS_DIR)
 
     @Timed(60)
     def refresh_users(self):
@@ -285,29 +315,22 @@ class Scout:
         scoutlog.info('sending updated users list to outposts')
 
         # Obtain the latest version of the config file
-        with open(scoutatic.ZOE_USERS, 'r') as f:
-            users = scoutil.serialize(f.read())
+        raw = scoutil.load_users().raw
 
-        # Send to all the outposts
-        with LOCK_OUTPOST_LIST:
-            outposts = scoutil.read_config(scoutatic.OUTPOST_LIST)
-
-        # Build messages to send
-        for s in filter(
-            (lambda o: o.startswith('outpost ')), outposts.sections()):
+        if raw is None:
+            # Do not overwrite the users of the outposts
+            return
 
-            # Mind the blank space
-            outpost = s.replace('outpost ', '', 1)
+        users = scoutil.serialize(raw)
 
-            # Check if running
-            with LOCK_ZONE_BOOK:
-                if not scoutatic.ZONE_BOOK.is_outpost_running(outpost):
-                    err_msg = 'outpost %s is not running'
-                    scoutlog.warning(err_msg)
-                    continue
+        # Send to all the outposts
+        outposts = scoutil.load_outpost_list()
 
-            # Deliver message
-            self.sendbus(scoutmsg.refresh_users(outpost, users))
+        # Deliver messages to all the running outposts
+        scoutil.fan_out(
+                (lambda outpost: self.sendbus(
+                    scoutmsg.refresh_users(outpost, users))),
+                self._running_outposts(outposts), self._fanout_workers())
 
     @Message(tags=['close-tunnel'])
     def close_tunnel(self, parser):
@@ -326,14 +349,13 @@ class Scout:
         scoutlog.info('closing tunnel to outpost %s' % outpost_id)
 
         # Check if outpost is known
-        with LOCK_OUTPOST_LIST:
-            outposts = scoutil.read_config(scoutatic.OUTPOST_LIST)
+        outposts = scoutil.load_outpost_list()
 
-            if 'outpost ' + outpost_id not in outposts.sections():
-                err_msg = 'unknown outpost: %s' % outpost_id
-                scoutlog.error(err_msg)
+        if outpost_id not in outposts:
+            err_msg = 'unknown outpost: %s' % outpost_id
+            scoutlog.error(err_msg)
 
-                return self._feedback(err_msg, parser=parser)
+            return self._feedback(err_msg, parser=parser)
 
         # Check if there is a tunnel open
         if not os.path.isfile(
@@ -347,7 +369,7 @@ class Scout:
         # Close the tunnel
         with LOCK_MIGRATION:
             if not scoutil.close_tunnel(
-                    outposts['outpost ' + outpost_id], outpost_id):
+                    outposts[outpost_id], outpost_id):
 
                 err_msg = 'failed to close tunnel to outpost %s' % outpost_id
                 scoutlog.error(err_msg)
@@ -418,14 +440,13 @@ class Scout:
         scoutlog.info('launching outpost %s' % outpost_id)
 
         # Check if outpost is known
-        with LOCK_OUTPOST_LIST:
-            outposts = scoutil.read_config(scoutatic.OUTPOST_LIST)
+        outposts = scoutil.load_outpost_list()
 
-            if 'outpost ' + outpost_id not in outposts.sections():
-                err_msg = 'unknown outpost: %s' % outpost_id
-                scoutlog.error(err_msg)
+        if outpost_id not in outposts:
+            err_msg = 'unknown outpost: %s' % outpost_id
+            scoutlog.error(err_msg)
 
-                return self._feedback(err_msg, parser=parser)
+            return self._feedback(err_msg, parser=parser)
 
         # Check if it is supposed to be stopped and mark as running
         with LOCK_ZONE_BOOK:
@@ -443,7 +464,7 @@ class Scout:
 
         # Launch the outpost
         with LOCK_MIGRATION:
-            if not scoutil.launch_outpost(outposts['outpost ' + outpost_id],
+            if not scoutil.launch_outpost(outposts[outpost_id],
                     outpost_id):
 
                 err_msg = 'failed to remotely launch outpost %s' % outpost_id
@@ -485,12 +506,11 @@ class Scout:
             return self._feedback(err_msg, parser=parser)
 
         # Check if the agent is in central
-        with LOCK_OUTPOST_LIST:
-            if scoutatic.ZONE_BOOK.get_agent_location(agent) != 'central':
-                err_msg = 'agent %s is not in central' % agent
-                scoutlog.error(err_msg)
+        if scoutatic.ZONE_BOOK.get_agent_location(agent) != 'central':
+            err_msg = 'agent %s is not in central' % agent
+            scoutlog.error(err_msg)
 
-                return self._feedback(err_msg, parser=parser)
+            return self._feedback(err_msg, parser=parser)
 
         # Create backup
         scoutil.prepare_backup(agent)
@@ -517,41 +537,39 @@ class Scout:
         outpost_id = parser.get('outpost_id')
 
         # Check if agent is registered for moving
-        with LOCK_SCOUT_CONF:
-            sconf = scoutil.read_config(scoutatic.SCOUT_CONF)
+        if not scoutil.load_scout_conf().can_migrate(agent):
+            err_msg = 'agent %s cannot migrate' % agent
+            scoutlog.error(err_msg)
 
-            hold = sconf['agents']['hold'].split(' ')
-            free = sconf['agents']['free'].split(' ')
+            return self._feedback(err_msg, parser=parser)
 
-            if agent not in hold and agent not in free:
-                err_msg = 'agent %s cannot migrate' % agent
-                scoutlog.error(err_msg)
+        # Read outpost list and check destination
+        outposts = scoutil.load_outpost_list()
 
-                return self._feedback(err_msg, parser=parser)
+        if outpost_id not in outposts and outpost_id != 'central':
+            err_msg = 'unknown outpost: %s' % outpost_id
+            scoutlog.error(err_msg)
 
-        # Read outpost list and check destination
-        with LOCK_OUTPOST_LIST:
-            outposts = scoutil.read_config(scoutatic.OUTPOST_LIST)
+            return self._feedback(err_msg, parser=parser)
 
-            if 'outpost ' + outpost_id not in outposts.sections() and (
-                    outpost_id != 'central'):
-                err_msg = 'unknown outpost: %s' % outpost_id
-                scoutlog.error(err_msg)
+        # Recover the previous migration first
+        if scoutatic.MIGRATIONS.is_interrupted(agent):
+            err_msg = 'agent %s has an interrupted migration' % agent
+            scoutlog.error(err_msg)
 
-                return self._feedback(err_msg, parser=parser)
+            return self._feedback(err_msg, parser=parser)
 
         # Get current location and status of the new outpost
-        with LOCK_ZONE_BOOK:
-            current_location = scoutatic.ZONE_BOOK.get_agent_location(agent)
+        current_location = scoutatic.ZONE_BOOK.get_agent_location(agent)
 
-            if not current_location:
-                # Where is the agent?
-                err_msg = 'agent %s cannot be located' % agent
-                scoutlog.error(err_msg)
+        if not current_location:
+            # Where is the agent?
+            err_msg = 'agent %s cannot be located' % agent
+            scoutlog.error(err_msg)
 
-                return self._feedback(err_msg, parser=parser)
+            return self._feedback(err_msg, parser=parser)
 
-            is_running = scoutatic.ZONE_BOOK.is_outpost_running(outpost_id)
+        is_running = scoutatic.ZONE_BOOK.is_outpost_running(outpost_id)
 
         # Cannot migrate to a closed outpost
         if outpost_id != 'central' and not is_running:
@@ -567,8 +585,19 @@ class Scout:
 
             return self._feedback(err_msg, parser=parser)
 
+        # Measure files to move, dynamic files of remote agents are measured
+        # once they have been fetched
+        static_size, dynamic_size = scoutil.get_agent_size(
+                agent, current_location)
+
+        # Every phase is recorded before it starts, so that the migration
+        # can be recovered if the scout stops in the middle of it
+        entry = scoutatic.MIGRATIONS.begin(agent, current_location,
+                outpost_id, scoutplan.PhaseTimer())
+
         # Notify agent that it is being moved
         scoutlog.info('notifying %s of the migration' % agent)
+        entry.enter('travel')
         self.sendbus(scoutmsg.moving_agent(agent))
 
         # Give some time to terminate current operations
@@ -576,98 +605,24 @@ class Scout:
 
         # Tell agent to terminate
         scoutlog.info('terminating agent %s' % agent)
+        entry.enter('terminate')
         self.sendbus(scoutmsg.terminate_agent(agent))
 
         with LOCK_MIGRATION:
-            # Check origin
-            if current_location == 'central':
-                # Create backup dir for deployment
-                scoutil.prepare_backup(agent)
+            try:
+                return self._run_migration(entry, static_size, dynamic_size,
+                        parser)
 
-                # Remove local files
-                scoutil.remove_local_files(agent)
+            except Exception as e:
+                scoutlog.exception('migration of %s interrupted' % agent)
 
-            else:
-                # Remove static files
-                file_list = scoutil.get_static_list(agent)
-                self.sendbus(
-                        scoutmsg.clean_static(current_location, file_list))
-
-                # Copy dynamic files to central
-                outpost_item = outposts['outpost ' + current_location]
-                scoutil.copy_dynamic_files(agent, outpost_item['directory'],
-                        os.environ['ZOE_HOME'], outpost_item['host'],
-                        outpost_item.get('username'), 'local')
-
-                # Remove from remote outpost
-                self.sendbus(scoutmsg.rm_agent(current_location, agent))
+        # Leave it to `recover_migrations()`
+        scoutatic.MIGRATIONS.interrupt(entry)
 
+        err_msg = 'migration of %s interrupted in %s, it will be recovered' \
+                % (agent, entry.last_phase)
 
-            # Check destination
-            if outpost_id != 'central':
-                # Moving to external outpost
-                outpost_item = outposts['outpost ' + outpost_id]
-
-                # Execute pre-migration commands (SSH)
-                scoutil.run_remote_commands(agent, 'premig', outpost_item)
-
-                # Copy files using SCP
-                backup_dir = os.path.join(scoutatic.RULES_DIR, agent, 'backup')
-                scoutil.remote_put(
-                        [(backup_dir, outpost_item['directory']),],
-                        outpost_item['host'], outpost_item.get('username'))
-
-                # Copy dynamic files
-                scoutil.copy_dynamic_files(
-                        agent, os.environ['ZOE_HOME'],
-                        outpost_item['directory'], outpost_item['host'],
-                        outpost_item.get('username'), 'remote')
-
-                # Execute post-migration commands (SSH)
-                scoutil.run_remote_commands(agent, 'postmig', outpost_item)
-
-                # Add agent to remote list
-                self.sendbus(scoutmsg.add_agent(outpost_id, agent))
-
-                # Give some time to outpost
-                time.sleep(5)
-
-                # Launch agent
-                self.sendbus(scoutmsg.launch_agent(outpost_id, agent))
-
-            else:
-                # Moving to central
-
-                # Execute pre-migration commands
-                scoutil.run_local_commands(agent, 'premig')
-
-                # Move the backup to ZOE_HOME
-                scoutil.restore_backup(agent)
-
-                # Execute post-migration commands
-                scoutil.run_local_commands(agent, 'postmig')
-
-                # Force local register
-                self.sendbus(scoutmsg.register_local(agent))
-
-                # Launch agent
-                scoutil.launch_agent(agent)
-
-            # Check for error
-            if not scoutatic.ZONE_BOOK.move_agent(agent, outpost_id):
-                err_msg = 'failed to move agent %s' % agent
-                scoutlog.error(err_msg)
-
-                return self._feedback(err_msg, parser=parser)
-
-            # Update list
-            msg = 'agent %s moved to %s' % (agent, outpost_id)
-            scoutlog.info(msg)
-
-            scoutlog.status('new location of agent "%s": %s' % (
-                agent, outpost_id))
-
-            return self._feedback(msg, parser=parser)
+        return self._feedback(err_msg, parser=parser)
 
     @Message(tags=['open-tunnel'])
     def open_tunnel(self, parser):
@@ -686,14 +641,13 @@ class Scout:
         scoutlog.info('opening tunnel to outpost %s' % outpost_id)
 
         # Check if outpost is known
-        with LOCK_OUTPOST_LIST:
-            outposts = scoutil.read_config(scoutatic.OUTPOST_LIST)
+        outposts = scoutil.load_outpost_list()
 
-            if 'outpost ' + outpost_id not in outposts.sections():
-                err_msg = 'unknown outpost: %s' % outpost_id
-                scoutlog.error(err_msg)
+        if outpost_id not in outposts:
+            err_msg = 'unknown outpost: %s' % outpost_id
+            scoutlog.error(err_msg)
 
-                return self._feedback(err_msg, parser=parser)
+            return self._feedback(err_msg, parser=parser)
 
         # Check if there is a tunnel open
         if os.path.isfile(
@@ -707,7 +661,7 @@ class Scout:
         # Open the tunnel
         with LOCK_MIGRATION:
             if not scoutil.open_tunnel(
-                    outposts['outpost ' + outpost_id], outpost_id):
+                    outposts[outpost_id], outpost_id):
 
                 err_msg = 'failed to open tunnel to outpost %s'
                 scoutlog.error(err_msg)
@@ -721,6 +675,84 @@ class Scout:
 
         return self._feedback(msg, parser=parser)
 
+    @Message(tags=['plan-migrations'])
+    def plan_migrations(self, parser):
+        """ Show the migrations that the balancing algorithm would perform
+            with the current information, without moving any agent.
+
+            Relevant parser keys:
+                algorithm - algorithm to use (defaults to the configured one)
+                sender    - unique ID of the user that sent the message
+                src       - where the message came from (zoe agent)
+        """
+        if not self._has_permissions(parser.get('sender'), parser.get('src')):
+            return None
+
+        outposts = scoutil.load_outpost_list()
+        conf = scoutil.load_scout_conf()
+
+        alg_name = parser.get('algorithm') or conf.balance
+
+        if not alg_name:
+            err_msg = 'no balancing algorithm configured'
+            scoutlog.error(err_msg)
+
+            return self._feedback(err_msg, parser=parser)
+
+        algorithm = scoutatic.BALANCER.get_algorithm(
+                alg_name, conf.balancer_options(alg_name))
+
+        if not algorithm:
+            err_msg = 'unknown algorithm "%s"' % alg_name
+            scoutlog.error(err_msg)
+
+            return self._feedback(err_msg, parser=parser)
+
+        scoutlog.info('planning migrations with algorithm "%s"' % alg_name)
+
+        # Only the snapshot of the zone book is taken with the lock, the
+        # algorithm may take a while
+        with LOCK_ZONE_BOOK:
+            outpost_map = scoutplan.build_outpost_map(
+                    outposts, conf, self._running_outposts(outposts))
+
+        balanced_map = algorithm(outpost_map.copy())
+
+        plan = scoutplan.make_plan(outpost_map, balanced_map)
+
+        return self._feedback(
+                scoutmsg.feedback_migration_plan(plan, alg_name,
+                    scoutatic.BALANCER.get_stats(alg_name)),
+                parser=parser)
+
+    @Message(tags=['replay-ack'])
+    def replay_ack(self, parser):
+        """ Delete a page of replayed messages acknowledged by the agent and
+            send the next one.
+
+            Relevant parser keys:
+                agent - name of the agent
+                seq   - sequence number of the last message of the page
+        """
+        agent = parser.get('agent')
+
+        try:
+            seq = int(parser.get('seq'))
+
+        except (TypeError, ValueError):
+            scoutlog.error('invalid replay acknowledgement from %s' % agent)
+            return
+
+        if not scoutatic.REPLAYS.acked(agent, seq):
+            scoutlog.warning('unexpected replay acknowledgement from %s' %
+                    agent)
+            return
+
+        with LOCK_AGENT_BOOK:
+            scoutatic.AGENT_BOOK.delete_messages(agent, upto=seq)
+
+        self._replay_page(agent)
+
     @Message(tags=['retrieve-info'])
     def retrieve_info(self, parser):
         """ Retrieve agent information and send it back.
@@ -765,7 +797,11 @@ class Scout:
 
     @Message(tags=['retrieve-msg'])
     def retrieve_messages(self, parser):
-        """ Retrieve all stored messages for the settled agent.
+        """ Start replaying the stored messages for the settled agent.
+
+            Messages are sent in pages of `replay_page` messages (bundled in
+            a single message if `replay_batch` is enabled) and each page is
+            only deleted once the agent acknowledges it.
 
             Relevant parser keys:
                 agent  - name of the agent to restore
@@ -786,52 +822,40 @@ class Scout:
         scoutlog.info('retrieving messages for %s' % agent)
 
         # Suppose that agent is settled
-        with LOCK_AGENT_BOOK:
-            # Get messages
-            msg_list = scoutatic.AGENT_BOOK.get_messages(agent)
-
-        # Dispatch past messages
-        for msg in msg_list:
-            self.sendbus(zoe.MessageBuilder.fromparser(
-                zoe.MessageParser(msg)).msg())
+        scoutatic.REPLAYS.start(
+                agent, parser.get('sender'), parser.get('src'))
 
-        # Delete stored messages
-        with LOCK_AGENT_BOOK:
-            scoutatic.AGENT_BOOK.delete_messages(agent)
-
-        msg = 'retrieved stored messages for agent %s' % agent
-        scoutlog.info(msg)
-
-        return self._feedback(msg, parser=parser)
+        self._replay_page(agent)
 
     @Message(tags=['show-locations'])
     def show_agent_locations(self, parser):
         """ Show a list of agents sorted by outpost in which they are located.
 
             Relevant parser keys:
-                sender - unique ID of the user that sent the message
-                src    - where the message came from (zoe agent)
+                outpost - only show the agents in this outpost (optional)
+                sender  - unique ID of the user that sent the message
+                src     - where the message came from (zoe agent)
         """
         if not self._has_permissions(parser.get('sender'), parser.get('src')):
             return None
 
         scoutlog.info('obtaining agent locations')
 
-        with LOCK_OUTPOST_LIST:
-            conf = scoutil.read_config(scoutatic.OUTPOST_LIST)
+        conf = scoutil.load_outpost_list()
 
-        with LOCK_ZONE_BOOK:
-            msg = scoutmsg.feedback_agent_locations(conf)
+        msg = scoutmsg.feedback_agent_locations(conf, parser.get('outpost'))
 
         return self._feedback(msg, parser=parser)
 
     @Message(tags=['show-agent-status'])
     def show_agent_status(self, parser):
-        """ Show the status of all the agents.
+        """ Show the status of the agents, in pages of `status_page` agents.
 
             This includes whether they are on hold or free.
 
             Relevant parser keys:
+                filter - words with the filters and page to show (optional,
+                         see `util.parse_status_filter()`)
                 sender - unique ID of the user that sent the message
                 src    - where the message came from (zoe agent)
         """
@@ -840,11 +864,15 @@ class Scout:
 
         scoutlog.info('obtaining status of agents')
 
-        with LOCK_ZONE_BOOK:
-            agents = scoutatic.ZONE_BOOK.get_agents()
+        filters, page = scoutil.parse_status_filter(parser.get('filter'))
 
-        with LOCK_SCOUT_CONF:
-            msg = scoutmsg.feedback_agent_status(agents)
+        if filters is None:
+            return self._feedback('invalid filter "%s"' % parser.get('filter'),
+                    parser=parser)
+
+        page_size = scoutil.load_scout_conf().get_int('status_page', 50)
+
+        msg = scoutmsg.feedback_agent_status(filters, page, page_size)
 
         return self._feedback(msg, parser=parser)
 
@@ -861,11 +889,23 @@ class Scout:
 
         scoutlog.info('obtaining status of outposts')
 
-        with LOCK_ZONE_BOOK:
-            outposts = scoutatic.ZONE_BOOK.get_outposts()
+        msg = scoutmsg.feedback_outpost_status(
+                scoutatic.ZONE_BOOK.get_outposts())
 
-        with LOCK_SCOUT_CONF:
-            msg = scoutmsg.feedback_outpost_status(outposts)
+        return self._feedback(msg, parser=parser)
+
+    @Message(tags=['replay-status'])
+    def show_replays(self, parser):
+        """ Show the deferred message replays in progress and their rate.
+
+            Relevant parser keys:
+                sender - unique ID of the user that sent the message
+                src    - where the message came from (zoe agent)
+        """
+        if not self._has_permissions(parser.get('sender'), parser.get('src')):
+            return None
+
+        msg = scoutmsg.feedback_replay_status(scoutatic.REPLAYS.status())
 
         return self._feedback(msg, parser=parser)
 
@@ -889,14 +929,13 @@ class Scout:
         scoutlog.info('stopping outpost %s' % outpost_id)
 
         # Check if outpost is known
-        with LOCK_OUTPOST_LIST:
-            outposts = scoutil.read_config(scoutatic.OUTPOST_LIST)
+        outposts = scoutil.load_outpost_list()
 
-            if 'outpost ' + outpost_id not in outposts.sections():
-                err_msg = 'unknown outpost: %s' % outpost_id
-                scoutlog.error(err_msg)
+        if outpost_id not in outposts:
+            err_msg = 'unknown outpost: %s' % outpost_id
+            scoutlog.error(err_msg)
 
-                return self._feedback(err_msg, parser=parser)
+            return self._feedback(err_msg, parser=parser)
 
         # Check if it is supposed to be running and mark as stopped
         with LOCK_ZONE_BOOK:
@@ -914,7 +953,7 @@ class Scout:
 
         # Stop the outpost
         with LOCK_MIGRATION:
-            if not scoutil.stop_outpost(outposts['outpost ' + outpost_id],
+            if not scoutil.stop_outpost(outposts[outpost_id],
                     outpost_id):
 
                 err_msg = 'failed to remotely stop outpost %s' % outpost_id
@@ -966,6 +1005,11 @@ class Scout:
             The message is transformed so that when retrieved, it can be
             sent directly.
 
+            Messages received in a burst are committed together: each one
+            waits up to `store_delay` milliseconds or until `store_batch`
+            messages are buffered. The method returns after the message has
+            been committed.
+
             Relevant parser keys:
                 _outpost_dst - original destination (agent name)
                 _outpost_src - original sender of the message
@@ -974,8 +1018,17 @@ class Scout:
         scoutlog.info('storing deffered message for agent %s' %
                 parser.get('_outpost_dst'))
 
-        with LOCK_AGENT_BOOK:
-            scoutatic.AGENT_BOOK.store_message(parser)
+        conf = scoutil.load_scout_conf()
+
+        # Not locked, the agent book groups concurrent messages
+        stored = scoutatic.AGENT_BOOK.store_message(parser,
+                conf.get_int('max_messages', 1000),
+                conf.get_float('store_delay', 10.0) / 1000.0,
+                conf.get_int('store_batch', 50))
+
+        if not stored:
+            scoutlog.error('failed to store message for agent %s' %
+                    parser.get('_outpost_dst'))
 
     @Message(tags=['unhold-agent'])
     def unhold_agent(self, parser):
@@ -1013,18 +1066,402 @@ class Scout:
 
         return self._feedback(msg, parser=parser)
 
+    def _abort_migration(self, entry, state, parser=None):
+        """ Abort a migration to a remote outpost after a failed step and
+            bring the agent back to central so that it keeps running.
+
+            Must be called with LOCK_MIGRATION acquired, once the agent has
+            been terminated and its files have been removed from the origin.
+
+            entry  - MigrationEntry of the migration
+            state  - migration step that failed
+            parser - MessageParser instance of the migration request
+        """
+        agent = entry.agent
+        outpost_id = entry.destination
+
+        scoutlog.error('aborting migration of %s to %s: %s step failed' % (
+            agent, outpost_id, state))
+
+        entry.enter('abort')
+
+        # Remove the files already copied to the outpost
+        if 'transfer' in entry.phases:
+            self.sendbus(scoutmsg.clean_static(
+                outpost_id, scoutil.get_static_list(agent)))
+            self.sendbus(scoutmsg.rm_agent(outpost_id, agent))
+
+        # Restore files and launch in central
+        scoutil.restore_backup(agent)
+        self.sendbus(scoutmsg.register_local(agent))
+        scoutil.launch_agent(agent)
+
+        scoutatic.ZONE_BOOK.move_agent(agent, 'central')
+        entry.finish('aborted')
+
+        scoutlog.status('new location of agent "%s": %s' % (agent, 'central'))
+
+        err_msg = 'migration of %s to %s aborted (%s failed), ' \
+                'agent restored in central' % (agent, outpost_id, state)
+
+        return self._feedback(err_msg, parser=parser)
+
+    def _fanout_workers(self):
+        """ Obtain the maximum number of threads to use when sending
+            messages or running operations on several outposts at once.
+        """
+        return scoutil.load_scout_conf().get_int('fanout_workers',
+                scoutil.FANOUT_WORKERS)
+
     def _has_permissions(self, user, src=None):
         """ Check if the user has permissions necessary to interact with the
             scout (belongs to group 'admins')
         """
         # No user, manual commands from terminal
-        if not user or user in Users().membersof('admins'):
+        if not user or scoutil.load_users().is_admin(user):
             return True
 
         # Does not have permission, send message
         self._feedback(scoutmsg.feedback_permissions(), user, src)
         return False
 
+    def _recover_interrupted(self):
+        """ Try to recover every interrupted migration in the journal.
+
+            Must be called with LOCK_MIGRATION acquired.
+        """
+        for entry in scoutatic.MIGRATIONS.interrupted():
+            try:
+                self._recover_migration(entry)
+
+            except Exception as e:
+                scoutlog.exception('failed to recover migration of %s' %
+                        entry.agent)
+
+    def _recover_migration(self, entry):
+        """ Resume or roll back an interrupted migration.
+
+            Migrations interrupted before the agent was terminated are
+            cancelled, those interrupted before its files were modified are
+            rolled back (the agent is launched again in its origin) and the
+            rest are resumed from the phase that was interrupted. If the
+            destination outpost is no longer running, the agent is moved to
+            central instead.
+
+            Returns False if the migration could not be recovered yet.
+
+            Must be called with LOCK_MIGRATION acquired.
+
+            entry - MigrationEntry of the interrupted migration
+        """
+        agent = entry.agent
+        origin = entry.origin
+        action = entry.recovery_action()
+
+        # Phases before the last one that was started are already done
+        entry.resume_from = entry.last_phase
+
+        scoutlog.warning('recovering migration of %s to %s (%s): %s' % (
+            agent, entry.destination, entry.last_phase, action))
+
+        if action == 'cancel':
+            # The agent was never told to terminate
+            entry.finish('cancelled')
+            return True
+
+        if action == 'abort':
+            self._abort_migration(entry, 'recovery')
+            return True
+
+        if action == 'rollback':
+            if origin == 'central':
+                # Discard the (partial) backup
+                scoutil.remove_backup(agent)
+
+                self.sendbus(scoutmsg.register_local(agent))
+                scoutil.launch_agent(agent)
+
+            elif scoutatic.ZONE_BOOK.is_outpost_running(origin):
+                self.sendbus(scoutmsg.launch_agent(origin, agent))
+
+            else:
+                scoutlog.warning('outpost %s is not running' % origin)
+                return False
+
+            entry.finish('rolled back')
+
+            scoutlog.status('migration of agent "%s" rolled back to %s' % (
+                agent, origin))
+            return True
+
+        # Dynamic files have to be fetched from the origin
+        if entry.resume_from in ('clean', 'fetch') and \
+                not scoutatic.ZONE_BOOK.is_outpost_running(origin):
+            scoutlog.warning('outpost %s is not running' % origin)
+            return False
+
+        if entry.destination != 'central' and \
+                not scoutatic.ZONE_BOOK.is_outpost_running(entry.destination):
+            scoutlog.warning('outpost %s is not running, moving %s to central'
+                    % (entry.destination, agent))
+            entry.reroute('central')
+
+        self._run_migration(entry)
+        return True
+
+    def _replay_page(self, agent):
+        """ Send the next page of stored messages to an agent, or finish
+            the replay if there are no more messages.
+
+            agent - name of the agent
+        """
+        replay = scoutatic.REPLAYS.get(agent)
+
+        if not replay:
+            return
+
+        conf = scoutil.load_scout_conf()
+
+        with LOCK_AGENT_BOOK:
+            page = scoutatic.AGENT_BOOK.get_message_page(
+                    agent, replay['acked'], conf.get_int('replay_page', 20))
+
+        if not page:
+            stats = scoutatic.REPLAYS.finish(agent)
+
+            msg = 'replayed %d messages for agent %s (%.2f messages/s)' % (
+                    stats['messages'], agent, stats['rate'])
+            scoutlog.info(msg)
+
+            return self._feedback(msg, replay['user'], replay['src'])
+
+        seq = page[-1][0]
+        messages = [m for _, m in page]
+
+        if not scoutatic.REPLAYS.sent(agent, seq, len(messages)):
+            # Replay finished meanwhile
+            return
+
+        if conf.get_bool('replay_batch', True):
+            self.sendbus(scoutmsg.replay_page(agent, seq, messages))
+            return
+
+        # Dispatch messages and mark the end of the page
+        for msg in messages:
+            self.sendbus(zoe.MessageBuilder.fromparser(
+                zoe.MessageParser(msg)).msg())
+
+        self.sendbus(scoutmsg.replay_page(agent, seq))
+
+    def _run_migration(self, entry, static_size=0, dynamic_size=None,
+            parser=None):
+        """ Move a terminated agent from its origin to its destination,
+            recording every phase in the migration journal.
+
+            When resuming an interrupted migration, the phases before the
+            one that was interrupted are skipped.
+
+            Must be called with LOCK_MIGRATION acquired.
+
+            entry        - MigrationEntry of the migration
+            static_size  - bytes of static files of the agent
+            dynamic_size - bytes of dynamic files of the agent (None if they
+                           are in a remote outpost)
+            parser       - MessageParser instance of the migration request
+        """
+        agent = entry.agent
+        current_location = entry.origin
+        outpost_id = entry.destination
+
+        # Execution of pre/post-migration commands
+        sconf = scoutil.load_scout_conf()
+        batch = sconf.get_bool('batch_commands', True)
+        abort = sconf.get_bool('abort_on_error', False)
+
+        outposts = scoutil.load_outpost_list()
+
+        # Check origin
+        if current_location == 'central':
+            # Create backup dir for deployment
+            if entry.enter('backup'):
+                scoutil.prepare_backup(agent)
+
+            # Remove local files
+            if entry.enter('remove'):
+                scoutil.remove_local_files(agent)
+
+        else:
+            # Remove static files
+            if entry.enter('clean'):
+                file_list = scoutil.get_static_list(agent)
+                self.sendbus(
+                        scoutmsg.clean_static(current_location, file_list))
+
+            # Copy dynamic files to central
+            if entry.enter('fetch'):
+                outpost_item = outposts[current_location]
+                scoutil.copy_dynamic_files(agent, outpost_item['directory'],
+                        os.environ['ZOE_HOME'], outpost_item['host'],
+                        outpost_item.get('username'), 'local')
+
+                dynamic_size = scoutil.get_files_size([
+                    os.path.join(os.environ['ZOE_HOME'], p)
+                    for p in scoutil.get_dynamic_list(agent)])
+
+            # Remove from remote outpost
+            if entry.enter('remove'):
+                self.sendbus(scoutmsg.rm_agent(current_location, agent))
+
+        # Check destination
+        if outpost_id != 'central':
+            # Moving to external outpost
+            outpost_item = outposts[outpost_id]
+
+            # Execute pre-migration commands (SSH)
+            if entry.enter('premig'):
+                status, _ = scoutil.run_remote_commands(
+                        agent, 'premig', outpost_item, batch, abort)
+
+                if abort and not status:
+                    return self._abort_migration(entry, 'premig', parser)
+
+            # Copy files using SCP
+            if entry.enter('transfer'):
+                backup_dir = os.path.join(scoutatic.RULES_DIR, agent, 'backup')
+                scoutil.remote_put(
+                        [(backup_dir, outpost_item['directory']),],
+                        outpost_item['host'], outpost_item.get('username'))
+
+                # Copy dynamic files
+                scoutil.copy_dynamic_files(
+                        agent, os.environ['ZOE_HOME'],
+                        outpost_item['directory'], outpost_item['host'],
+                        outpost_item.get('username'), 'remote')
+
+            # Execute post-migration commands (SSH)
+            if entry.enter('postmig'):
+                status, _ = scoutil.run_remote_commands(
+                        agent, 'postmig', outpost_item, batch, abort)
+
+                if abort and not status:
+                    return self._abort_migration(entry, 'postmig', parser)
+
+            # Add agent to remote list
+            if entry.enter('add'):
+                self.sendbus(scoutmsg.add_agent(outpost_id, agent))
+
+                # Give some time to outpost
+                time.sleep(5)
+
+            # Launch agent
+            if entry.enter('launch'):
+                self.sendbus(scoutmsg.launch_agent(outpost_id, agent))
+
+        else:
+            # Moving to central
+
+            # Execute pre-migration commands
+            # Central is the last resort, so failures are only logged
+            if entry.enter('premig'):
+                scoutil.run_local_commands(agent, 'premig', batch, False)
+
+            # Move the backup to ZOE_HOME
+            if entry.enter('transfer'):
+                scoutil.restore_backup(agent)
+
+            # Execute post-migration commands
+            if entry.enter('postmig'):
+                scoutil.run_local_commands(agent, 'postmig', batch, False)
+
+            # Force local register
+            if entry.enter('add'):
+                self.sendbus(scoutmsg.register_local(agent))
+
+            # Launch agent
+            if entry.enter('launch'):
+                scoutil.launch_agent(agent)
+
+        # The location is written to the zone book before the migration is
+        # marked as finished in the journal
+        entry.enter('move')
+        if not scoutatic.ZONE_BOOK.move_agent(agent, outpost_id):
+            err_msg = 'failed to move agent %s' % agent
+            scoutlog.error(err_msg)
+
+            if scoutatic.ZONE_BOOK.get_agent_location(agent) is None:
+                # Agent no longer exists
+                entry.finish('failed')
+
+            else:
+                # Write failed, try again later
+                scoutatic.MIGRATIONS.interrupt(entry)
+
+            return self._feedback(err_msg, parser=parser)
+
+        entry.finish('done')
+
+        # Keep timings and sizes to estimate future migrations (phases of
+        # recovered migrations were not measured)
+        if not entry.recovered:
+            scoutatic.ZONE_BOOK.store_migration(agent, current_location,
+                    outpost_id, static_size + (dynamic_size or 0),
+                    entry.timer)
+
+            scoutatic.ZONE_BOOK.set_agent_size(
+                    agent, static_size, dynamic_size)
+
+        # Update list
+        msg = 'agent %s moved to %s' % (agent, outpost_id)
+        scoutlog.info(msg)
+
+        scoutlog.status('new location of agent "%s": %s' % (
+            agent, outpost_id))
+
+        return self._feedback(msg, parser=parser)
+
+    def _running_outposts(self, outpost_list):
+        """ Obtain the names of the outposts in the outpost list that are
+            currently running.
+
+            The running status is read from the zone book only once.
+
+            outpost_list - OutpostList snapshot of the outpost list
+        """
+        running = scoutatic.ZONE_BOOK.get_running_outposts()
+
+        outposts = []
+
+        for outpost in outpost_list.names():
+            if outpost not in running:
+                scoutlog.warning('outpost %s is not running' % outpost)
+                continue
+
+            outposts.append(outpost)
+
+        return outposts
+
+    def _start_outpost(self, conf, name):
+        """ Open the tunnel to an outpost and launch it.
+
+            Returns a boolean indicating whether the outpost is running.
+
+            conf - OutpostRecord with the data of the outpost
+            name - name of the outpost
+        """
+        scoutlog.info('opening tunnel and launching %s' % name)
+
+        # Open tunnel
+        if not scoutil.open_tunnel(conf, name):
+            scoutlog.error('failed to open tunnel to outpost %s' % name)
+            return False
+
+        # Launch outpost
+        if not scoutil.launch_outpost(conf, name):
+            scoutlog.error('failed to launch outpost %s' % name)
+            return False
+
+        return True
+
     def _feedback(self, message, user=None, dst=None, parser=None):
         """ Send feedback message to the given user.
 
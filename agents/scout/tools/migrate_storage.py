@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Scout for Zoe outpost system
+# Copyright (C) 2016  Rafael Medina García <rafamedgar@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Copy the agent and zone books to another storage engine.
+
+The books are read with the engine currently set in the `storage` key of the
+general section of scout.conf. The scout must be stopped while copying, and
+once the copy finishes the key must be changed to the new engine.
+
+Usage:
+    python3 tools/migrate_storage.py ENGINE [--force]
+
+Requires the environment of the scout (ZOE_HOME).
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'lib'))
+
+from libscout.config import ConfigCache, ScoutSettings
+from libscout.storage import ENGINES, open_storage, storage_paths
+
+
+def copy_storage(source, destination):
+    """ Copy every record from one storage to another.
+
+        source      - AgentStorage or ZoneStorage to read
+        destination - storage of the same kind to write
+    """
+    destination.import_data(source.export_data())
+
+def remove_storage(engine, directory):
+    """ Remove the books of an engine.
+
+        engine    - name of the engine
+        directory - directory in which the data is stored
+    """
+    for path in storage_paths(engine, directory):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+        # SQLite keeps the write-ahead log in separate files
+        for name in (path, path + '-wal', path + '-shm'):
+            if os.path.isfile(name):
+                os.remove(name)
+
+def main():
+    """ Parse the arguments and copy the books. """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('engine', choices=ENGINES,
+            help='engine to copy the books to')
+    parser.add_argument('--force', action='store_true',
+            help='overwrite the books of the destination engine')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # The scout runtime (libscout.static) is not started, only the books
+    # are opened
+    directory = os.path.join(os.environ['ZOE_HOME'], 'etc', 'scout')
+    current = ConfigCache().get(os.path.join(directory, 'scout.conf'),
+            ScoutSettings).general.get('storage', 'sqlite')
+
+    if args.engine == current:
+        parser.error('the books already use the %s engine' % args.engine)
+
+    if any(os.path.exists(p)
+            for p in storage_paths(args.engine, directory)):
+        if not args.force:
+            parser.error('%s books already exist in %s (use --force)' % (
+                args.engine, directory))
+
+        remove_storage(args.engine, directory)
+
+    start = time.perf_counter()
+
+    sources = open_storage(current, directory)
+    destinations = open_storage(args.engine, directory)
+
+    for name, source, destination in zip(('agent book', 'zone book'),
+            sources, destinations):
+        copy_storage(source, destination)
+        source.close()
+        destination.close()
+
+        print('copied %s' % name)
+
+    print('done in %.1f s, set "storage = %s" in scout.conf' % (
+        time.perf_counter() - start, args.engine))
+
+
+if __name__ == '__main__':
+    main()
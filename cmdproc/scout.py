@@ -29,14 +29,18 @@ specified outpost',
 '- scout hold <agent> -> hold an agent in its current location \
 (can only be moved manually)',
 '- scout launch-outpost <outpost> -> manually launch a remote outpost',
-'- scout locations -> show current agent locations',
+'- scout locations [outpost] -> show current agent locations',
 '- scout migrate <agent> <outpost> -> migrate an agent to the given outpost',
 '- scout open-tunnel <outpost> -> manually open a SSH tunnel to the \
 specified outpost',
+'- scout plan [algorithm] -> show the migrations that the balancing \
+algorithm would perform, without moving any agent',
 '- scout retrieve-info <agent> -> force information retrieval for an agent',
 '- scout retrieve-msg <agent> -> force message retrieval for an agent',
-'- scout status agents -> show current status of the agents',
+'- scout status agents [page N] [outpost O] [held|free] [load N] -> show \
+current status of the agents, optionally filtered',
 '- scout status outposts -> show current status of the outposts',
+'- scout status replays -> show deferred message replays in progress',
 '- scout stop-outpost <outpost> -> manually stop a remote outpost',
 '- scout unhold <agent> -> unhold an agent so that it may be moved \
 automatically by the scout using the active load balance algorithm'
@@ -59,12 +63,20 @@ PATTERNS = {
 
     '^scout locations$': 'message tag=show-locations',
 
+    '^scout locations ([a-zA-Z0-9_]+)$':
+        'message tag=show-locations&outpost=$0',
+
     '^scout migrate ([a-zA-Z0-9_]+) ([a-zA-Z0-9_]+)$':
         'message tag=migrate-agent&agent=$0&outpost_id=$1',
 
     '^scout open-tunnel ([a-zA-Z0-9_]+)$':
         'message tag=open-tunnel&outpost_id=$0',
 
+    '^scout plan$': 'message tag=plan-migrations',
+
+    '^scout plan ([a-zA-Z0-9_]+)$':
+        'message tag=plan-migrations&algorithm=$0',
+
     '^scout retrieve-info ([a-zA-Z0-9_]+)$':
         'message tag=retrieve-info&agent=$0',
 
@@ -72,8 +84,13 @@ PATTERNS = {
 
     '^scout status agents$': 'message tag=show-agent-status',
 
+    '^scout status agents ([a-zA-Z0-9_%. ]+)$':
+        'message tag=show-agent-status&filter=$0',
+
     '^scout status outposts$': 'message tag=show-outpost-status',
 
+    '^scout status replays$': 'message tag=replay-status',
+
     '^scout stop-outpost ([a-zA-Z0-9_]+)$':
         'message tag=stop-outpost&outpost_id=$0',
 
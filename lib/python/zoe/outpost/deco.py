@@ -31,8 +31,12 @@ import zoe
 from zoe.deco import *
 from types import MethodType
 import base64
+import collections
+import json
+import os
 import pickle
 import threading
+import time
 
 
 # Used to remove bound methods from the automatic attribute parsing
@@ -42,6 +46,9 @@ _method_names = ['__travel__', '__prepare__travel__',
 # Serialization padding character
 PAD_CHAR = '['
 
+# Seconds over which the message bandwidth of the agent is measured
+TRAFFIC_WINDOW = 60
+
 
 # Private methods to bind to the agent
 def __travel__(self):
@@ -218,6 +225,13 @@ class OutpostDecoratedListener(DecoratedListener):
         self._travelling = False
         self._travel_lock = threading.Lock()
 
+        # Received bytes and messages per sender in the current measuring
+        # window
+        self._traffic_bytes = 0
+        self._traffic_peers = collections.Counter()
+        self._traffic_start = time.time()
+        self._traffic_lock = threading.Lock()
+
         # Cannot simply use super() because we want the listener to notify
         # the scout right after it has been started (asynchronous)
         #
@@ -263,6 +277,10 @@ class OutpostDecoratedListener(DecoratedListener):
             print("Message received:", str(parser))
         tags = parser.tags()
 
+        # Replayed messages are counted when they are unpacked
+        if "replay!" not in tags:
+            self._count_traffic(parser)
+
         # Check if message should be executed or deferred
         if "travel!" in tags and not self._travelling:
             # Indicate travel
@@ -298,6 +316,26 @@ class OutpostDecoratedListener(DecoratedListener):
             self.sendresponse(zoe.MessageBuilder(response))
             return
 
+        elif "replay!" in tags:
+            # Deferred messages bundled in a single message
+            bundle = parser.get('messages')
+
+            if bundle:
+                for msg in json.loads(base64.b64decode(
+                        bundle.replace(PAD_CHAR, '=').encode()).decode()):
+                    self.receive(zoe.MessageParser(msg))
+
+            # Acknowledge the page so that the scout sends the next one
+            ack = {
+                'dst': 'scout',
+                'tag': 'replay-ack',
+                'agent': self._name,
+                'seq': parser.get('seq')
+            }
+
+            self.sendresponse(zoe.MessageBuilder(ack))
+            return
+
 
         # Travelling?
         if self._travelling:
@@ -322,6 +360,48 @@ class OutpostDecoratedListener(DecoratedListener):
 
         self.dispatch(tags, parser)
 
+    def _count_traffic(self, parser):
+        """ Account the bytes and sender of a received message.
+
+            At the end of each window, the receive rate (bytes per second) and
+            the messages per second received from each sender are written to
+            ZOE_VAR/<agent>.traffic, from where they are gathered along with
+            the rest of resources of the agent.
+        """
+        now = time.time()
+        src = parser.get('src')
+
+        with self._traffic_lock:
+            self._traffic_bytes += len(parser._msg)
+
+            if src and src != self._name:
+                self._traffic_peers[src] += 1
+
+            elapsed = now - self._traffic_start
+
+            if elapsed < TRAFFIC_WINDOW:
+                return
+
+            traffic = {
+                'bandwidth': self._traffic_bytes / elapsed,
+                'peers': {p: c / elapsed
+                    for p, c in self._traffic_peers.items()}
+            }
+
+            self._traffic_bytes = 0
+            self._traffic_peers.clear()
+            self._traffic_start = now
+
+        try:
+            traffic_file = os.path.join(
+                    os.environ['ZOE_VAR'], self._name + '.traffic')
+
+            with open(traffic_file, 'w') as f:
+                json.dump(traffic, f)
+
+        except (KeyError, OSError):
+            pass
+
     def retrieve_info(self, call_register=False):
         """ Send a message to the scout asking for any stored information.
 
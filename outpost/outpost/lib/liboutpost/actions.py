@@ -18,10 +18,12 @@
 
 """Implementation of outpost actions."""
 
+import json
 import os
 import re
 import shutil
 import subprocess
+import time
 
 from os import environ as env
 from os.path import join as path
@@ -32,6 +34,9 @@ from . import get_logger
 # Logging
 outlog = get_logger('liboutpost.actions')
 
+# Seconds after which the traffic measured by an agent is considered outdated
+TRAFFIC_MAX_AGE = 180
+
 
 def add_agent(conf, agent, port):
     """ Add an agent to the list.
@@ -147,7 +152,7 @@ def gather_info_agents(agents, perf_path):
         Returns a boolean with status and dict with the information if no error
         occured.
     """
-    outlog.info('gathering MIPS')
+    outlog.info('gathering MIPS, memory and traffic')
     procs = []
     info = {}
     SLEEP_TIME = 10 # seconds
@@ -165,6 +170,13 @@ def gather_info_agents(agents, perf_path):
         with open(pid_file, 'r') as f:
             pid = f.read().strip()
 
+        # Resident memory and message bandwidth
+        bandwidth, peers = _read_traffic(agent)
+
+        info['memory-'+agent] = util.serialize(_read_memory(pid))
+        info['traffic-'+agent] = util.serialize(bandwidth)
+        info['peers-'+agent] = util.serialize(peers)
+
         agent_perf = path(env['ZOE_VAR'], agent + '.perf')
         with open(agent_perf, 'w') as lf:
             proc = subprocess.Popen([
@@ -281,3 +293,43 @@ def _is_running(agent):
         return True
 
     return False
+
+def _read_memory(pid):
+    """ Obtain the resident memory (bytes) of a process, 0 if unknown.
+
+        pid - PID of the process
+    """
+    try:
+        with open('/proc/%s/status' % pid, 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    # Value in kB
+                    return int(line.split()[1]) * 1024
+
+    except (OSError, IndexError, ValueError):
+        outlog.warning('could not read memory of process %s' % pid)
+
+    return 0
+
+def _read_traffic(agent):
+    """ Obtain the traffic measured by an agent.
+
+        Returns a tuple with the message bandwidth (received bytes per
+        second) and a dict with the messages per second received from each
+        sender. Unknown or outdated values are returned as 0 and {}.
+
+        agent - agent name
+    """
+    traffic_file = path(env['ZOE_VAR'], agent + '.traffic')
+
+    try:
+        if time.time() - os.path.getmtime(traffic_file) > TRAFFIC_MAX_AGE:
+            return 0.0, {}
+
+        with open(traffic_file, 'r') as f:
+            traffic = json.load(f)
+
+        return float(traffic['bandwidth']), traffic.get('peers', {})
+
+    except (OSError, ValueError, TypeError, KeyError):
+        return 0.0, {}